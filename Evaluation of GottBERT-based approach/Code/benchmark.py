@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import platform
+import argparse
+import resource
+import threading
+import subprocess
+from helpers.clean_file import sanitized_rows
+from helpers.sentence_segmentation import segment_utterances
+from helpers.punctuation_replacement import mask_sentences, remove_punctuation
+from helpers.predictions import predict, predict_batch
+from helpers.simplify_predictions import simplify_row, simplify_pred, needs_syntax_check, SyntaxChecker, ANALYZER_URL
+from helpers.backends import load_predictor, BACKENDS, MODEL_NAME
+from helpers.offline import save_tiny_model, StubAnalyzer
+from helpers.context_window import ContextWindow
+from pipeline import load_segmentation_model
+
+'''
+    Benchmark of the stages of the pipeline (segmentation, masking, inference, simplification and syntax check)
+    on fixed, seeded subsets of the input file (by default 1k, 10k and all the utterances of Data/Dortmund_all.csv).
+
+    Each stage is run as in the pipeline (in batches) to measure its throughput, and then once per item on a
+    sample of the items to measure the per-item latency (p50/p95/p99). The results are written to a json file
+    together with the git commit, so that runs can be compared across commits (--compare).
+
+    For an offline run, use --tiny-model (a small, randomly initialized RoBERTa model with the same interface as GottBERT)
+    and --stub-analyzer (a local server in place of the sentence analyzer), e.g. from the Code folder:
+        python benchmark.py --tiny-model ../Data/tiny-model --stub-analyzer --sizes 1000 10000
+'''
+
+def get_commit():
+    ''' Return the current git commit and whether the working tree has uncommitted changes '''
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip()!=""
+        return commit, dirty
+    except Exception:
+        return None, None
+
+def peak_rss_mb():
+    # ru_maxrss is the peak of the whole process so far, in kilobytes on Linux and in bytes on macOS
+    # (on Linux, it's also reset by PeakMemory)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform=='darwin':
+        return peak/(1024*1024)
+    return peak/1024
+
+def read_status_kb(field):
+    # A memory field of /proc/self/status (e.g. VmHWM, the peak resident memory), in kilobytes
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return None
+
+def current_rss_mb():
+    # The resident memory of the process now (the second field of /proc/self/statm, in pages)
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024*1024)
+
+class PeakMemory:
+    ''' Measures the peak resident memory of the process during one stage
+
+    ru_maxrss only grows, so after a stage that needs a lot of memory it would be reported for all the next stages
+    too. On Linux, the peak (VmHWM) is reset at the start of the stage by writing 5 to /proc/self/clear_refs and
+    read at its end ('hwm'). If that isn't allowed, a thread samples the resident memory every interval seconds
+    ('polling', which can miss very short peaks). Elsewhere (e.g. on macOS) only the peak of the whole process so
+    far is known ('cumulative').
+
+    The peak can't be lower than the memory at the start of the stage (start_rss), e.g. the model and the outputs
+    of the stages before it, so both are reported.
+    '''
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.method = 'cumulative'
+        self.peak = None
+        self.start_rss = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def poll(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def start(self):
+        if os.path.exists('/proc/self/statm'):
+            self.start_rss = current_rss_mb()
+        try:
+            with open('/proc/self/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+            self.method = 'hwm'
+        except OSError:
+            if os.path.exists('/proc/self/statm'):
+                self.method = 'polling'
+                self.peak = self.start_rss
+                self.thread = threading.Thread(target=self.poll, daemon=True)
+                self.thread.start()
+        return self
+
+    def stop(self):
+        ''' Return the peak resident memory (in MB) since start (or since the process started, if the method is 'cumulative') '''
+
+        if self.method=='hwm':
+            self.peak = read_status_kb('VmHWM') / 1024
+        elif self.method=='polling':
+            self.stopped.set()
+            self.thread.join()
+            self.peak = max(self.peak, current_rss_mb())
+        else:
+            self.peak = peak_rss_mb()
+        return self.peak
+
+def percentile(values, q):
+    # Nearest-rank percentile of a list of numbers
+    if len(values)==0:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered), math.ceil(q/100*len(ordered))) - 1)
+    return ordered[index]
+
+def subset(items, size, seed):
+    ''' A fixed random subset of size items (all of them for size=None), in the original order '''
+
+    if size==None or size>=len(items):
+        return list(items)
+    indices = sorted(random.Random(seed).sample(range(len(items)), size))
+    return [items[index] for index in indices]
+
+def run_stage(name, batched, single, items, latency_sample):
+    ''' Measure a stage: batched(items) returns all the outputs, single(item) processes one item on its own
+
+    Returns the outputs of the batched run and a dict with the measurements.
+    '''
+
+    memory = PeakMemory().start()
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    outputs = batched(items)
+    seconds = time.perf_counter() - start
+    cpu_seconds = time.process_time() - start_cpu
+    # The peak of the batched run, as in the pipeline
+    peak = memory.stop()
+
+    latencies = []
+    for item in items[:latency_sample]:
+        start = time.perf_counter()
+        single(item)
+        latencies.append(time.perf_counter() - start)
+
+    result = {
+        "items": len(items),
+        "outputs": len(outputs),
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "items_per_second": len(items)/seconds if seconds>0 else None,
+        "latency_sample": len(latencies),
+        "latency_ms_p50": percentile(latencies, 50)*1000 if len(latencies)>0 else None,
+        "latency_ms_p95": percentile(latencies, 95)*1000 if len(latencies)>0 else None,
+        "latency_ms_p99": percentile(latencies, 99)*1000 if len(latencies)>0 else None,
+        "peak_rss_mb": peak,
+        "start_rss_mb": memory.start_rss,
+        "peak_rss_method": memory.method,
+    }
+    print(name + ":", len(items), "items in", round(seconds, 3), "s (" + str(round(result["items_per_second"] or 0, 1)) + " items/s), p50/p95/p99:",
+          [round(result[key], 3) if result[key]!=None else None for key in ("latency_ms_p50", "latency_ms_p95", "latency_ms_p99")], "ms,",
+          "peak memory:", round(peak, 1), "MB (" + memory.method + ")")
+    return outputs, result
+
+def benchmark_subset(utterances, segmentation_model, predictor, checker, args):
+    stages = {}
+    context = ContextWindow(predictor.tokenizer, args.left_context, args.right_context)
+
+    sentences, stages["segmentation"] = run_stage("segmentation",
+        lambda items: [sentence for sentences in segment_utterances(items, segmentation_model, args.segmentation_batch_size) for sentence in sentences],
+        lambda item: list(segment_utterances([item], segmentation_model)),
+        utterances, args.latency_sample)
+
+    masked_rows, stages["masking"] = run_stage("masking",
+        lambda items: list(mask_sentences(items)),
+        remove_punctuation,
+        sentences, args.latency_sample)
+
+    predictions, stages["inference"] = run_stage("inference",
+        lambda items: list(predict_batch(predictor, [row[0] for row in items], max_tokens=args.max_tokens, context=context)),
+        lambda item: predict(predictor, item[0], context),
+        masked_rows, args.latency_sample)
+    prediction_rows = [row + prediction for row, prediction in zip(masked_rows, predictions)]
+
+    _, stages["simplification"] = run_stage("simplification",
+        lambda items: [simplify_row(row, None, False) for row in items],
+        lambda item: simplify_row(item, None, False),
+        prediction_rows, args.latency_sample)
+
+    # Only the sentences for which the pipeline calls the analyzer (or all of them, with --syntax-check all)
+    to_check = [row[0] for row in prediction_rows if args.syntax_check=='all' or needs_syntax_check(simplify_pred(row[3], row[5]), row[5])]
+    _, stages["syntax"] = run_stage("syntax",
+        checker.analyze_many,
+        checker.analyze,
+        to_check, args.latency_sample)
+
+    return stages
+
+def compare(filename_old, filename_new):
+    ''' Print the throughput of each stage of a new run relative to an old one (e.g. of the previous commit) '''
+
+    with open(filename_old) as file_old, open(filename_new) as file_new:
+        old, new = json.load(file_old), json.load(file_new)
+    print("Comparing", old.get("commit"), "->", new.get("commit"))
+    for size, new_subset in new["subsets"].items():
+        old_subset = old["subsets"].get(size)
+        if old_subset==None:
+            continue
+        for stage, new_stage in new_subset["stages"].items():
+            old_stage = old_subset["stages"].get(stage)
+            if old_stage==None or not old_stage["items_per_second"] or not new_stage["items_per_second"]:
+                continue
+            print(size, stage + ":", round(old_stage["items_per_second"], 1), "->", round(new_stage["items_per_second"], 1),
+                  "items/s (x" + str(round(new_stage["items_per_second"]/old_stage["items_per_second"], 2)) + ")")
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default=os.path.join(os.path.abspath('..'), "Data", "Dortmund_all.csv"), help="The csv file with the utterances in its first column")
+    parser.add_argument("--sizes", nargs="+", default=["1000", "10000", "full"], help="The numbers of utterances of the subsets ('full' for all of them)")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the subsets")
+    parser.add_argument("--latency-sample", type=int, default=100, help="The number of items of each stage that are also processed one at a time to measure the latency")
+    parser.add_argument("--segmentation-batch-size", type=int, default=1000, help="The number of utterances that spaCy segments together")
+    parser.add_argument("--max-tokens", type=int, default=4096, help="The maximum (padded) number of tokens of an inference batch")
+    parser.add_argument("--left-context", type=int, default=254, help="The maximum number of tokens before the <mask> that the model sees")
+    parser.add_argument("--right-context", type=int, default=254, help="The maximum number of tokens after the <mask> that the model sees")
+    parser.add_argument("--model", type=str, default=MODEL_NAME, help="The name or local path of the model")
+    parser.add_argument("--tiny-model", type=str, default=None, help="Create (if needed) a tiny random RoBERTa model in this folder and use it instead of --model")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="The inference backend")
+    parser.add_argument("--onnx-dir", type=str, default=None, help="Where the exported ONNX model is saved")
+    parser.add_argument("--analyzer-url", type=str, default=ANALYZER_URL, help="The analyze-text endpoint of the sentence analyzer")
+    parser.add_argument("--stub-analyzer", action="store_true", help="Start a local stub of the sentence analyzer and use it instead of --analyzer-url")
+    parser.add_argument("--syntax-workers", type=int, default=8, help="The number of concurrent requests to the sentence analyzer")
+    parser.add_argument("--syntax-check", choices=["needed", "all"], default="all", help="Benchmark the syntax check on all the sentences (as the pipeline does by default) or on the sentences that need it")
+    parser.add_argument("--output", type=str, default=None, help="The json file of the results (default: benchmark_<commit>.json)")
+    parser.add_argument("--compare", type=str, default=None, help="A json file of a previous run to compare the results with")
+    args = parser.parse_args()
+
+    commit, dirty = get_commit()
+    utterances = [row[0] for row in sanitized_rows(args.input)]
+
+    model_name = args.model
+    if args.tiny_model!=None:
+        model_name = save_tiny_model(args.tiny_model, utterances, seed=args.seed)
+    segmentation_model = load_segmentation_model()
+    predictor = load_predictor(args.backend, model_name, args.onnx_dir)
+    stub = StubAnalyzer() if args.stub_analyzer else None
+    checker = SyntaxChecker(stub.url if stub!=None else args.analyzer_url, args.syntax_workers)
+
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "input": args.input,
+        "seed": args.seed,
+        "model": model_name,
+        "tiny_model": args.tiny_model!=None,
+        "backend": args.backend,
+        "analyzer": "stub" if stub!=None else args.analyzer_url,
+        "syntax_check": args.syntax_check,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "subsets": {},
+    }
+    for size in args.sizes:
+        items = subset(utterances, None if size=='full' else int(size), args.seed)
+        print("Subset", size, "-", len(items), "utterances")
+        results["subsets"][size] = {"utterances": len(items), "stages": benchmark_subset(items, segmentation_model, predictor, checker, args)}
+
+    checker.close()
+    if stub!=None:
+        stub.close()
+
+    filename_out = args.output
+    if filename_out==None:
+        filename_out = "benchmark_" + (commit[:10] if commit!=None else "nocommit") + ".json"
+    with open(filename_out, "w") as file_out:
+        json.dump(results, file_out, indent=2)
+    print("Results written to", filename_out)
+
+    if args.compare!=None:
+        compare(args.compare, filename_out)
@@ -0,0 +1,283 @@
+import os
+import csv
+import json
+import time
+import argparse
+import numpy as np
+from helpers.simplify_predictions import simplify_pred, NOT_CHECKED
+
+'''
+    Evaluation of decision rules on the final results of the pipeline (csv, arrow or parquet), without the model
+    and without the sentence analyzer.
+
+    The results are loaded once into NumPy arrays. Each sentence gets a question score: P(question) of the
+    punctuation scoring if it's there, else the sum of the scores of its top-5 predictions that are simplified to
+    'question'. A rule labels a sentence as a 'question' if its score is at least a threshold, or if a syntax override
+    applies: the sentence contains question words (and/or question syntax), its second prediction is a 'question'
+    and it has at most a number of tokens. All the thresholds of a rule are evaluated at once from the sorted
+    scores, so a sweep over hundreds of variants takes seconds.
+
+    The question words/syntax are only known for the sentences that the pipeline sent to the sentence analyzer:
+    all of them by default (--syntax-check all), but with --syntax-check needed only those predicted as 'EOS' with
+    a second prediction that is a 'question' (the others are "not checked"). The overrides of other sentences can't be evaluated from such
+    results, so the variants with an override are skipped, unless --checked-only restricts all the variants to
+    the checked sentences.
+
+    For every variant and every bucket of "Num of Tokens", the precision, recall and F1 of 'question' and 'EOS'
+    and the confusion matrix (TP/FP/FN/TN with 'question' as the positive class) are written to a csv file, e.g.
+    from the Code folder:
+        python evaluate.py --input ../Data/Dortmund_all_allPredictions_test.csv --output sweep.csv
+'''
+
+OVERRIDES = {
+    "none": lambda data: np.zeros(len(data["gt"]), dtype=bool),
+    "words": lambda data: data["question_words"],
+    "syntax": lambda data: data["question_syntax"],
+    "words_or_syntax": lambda data: data["question_words"] | data["question_syntax"],
+}
+
+# The columns of the results that the evaluation needs (the utterances are never loaded)
+COLUMNS = ["Prominent Prediction", "Prominent Score", "Prediction 2", "Score 2", "Prediction 3", "Score 3", "Prediction 4", "Score 4",
+           "Prediction 5", "Score 5", "GT Punctuation simplified", "Predicted Punctuation Simplified", "Num of Tokens",
+           "Contains Question Words", "Contains Question Syntax", "New Predicted Punctuation Simplified", "P(question)"]
+
+def load_table(filename):
+    ''' Load the needed columns of a results file (csv, arrow or parquet) as a typed pyarrow Table '''
+
+    import pyarrow as pa
+    from helpers.columnar import read_table, is_columnar, COLUMN_TYPES, CATEGORY
+    if is_columnar(filename):
+        table = read_table(filename)
+        return table.select([name for name in COLUMNS if name in table.column_names])
+
+    # The csv file is parsed by Arrow's multithreaded reader, with the column types of the arrow/parquet results
+    from pyarrow import csv as arrow_csv
+    with open(filename, encoding='utf-8', newline='') as csv_file_in:
+        header = next(csv.reader(csv_file_in, delimiter=','))
+    names = [name for name in COLUMNS if name in header]
+    types = {name: pa.string() if COLUMN_TYPES[name]==CATEGORY else COLUMN_TYPES[name] for name in names}
+    return arrow_csv.read_csv(filename, parse_options=arrow_csv.ParseOptions(newlines_in_values=True),
+                              convert_options=arrow_csv.ConvertOptions(include_columns=names, column_types=types,
+                                                                       strings_can_be_null=False, quoted_strings_can_be_null=False,
+                                                                       null_values=["", NOT_CHECKED]))
+
+def load_columns(filename, valid=None):
+    ''' Load the needed columns of a results file as NumPy arrays (empty cells are "", NaN, False or 0)
+
+    If a dictionary valid is given, the boolean array of the non-empty cells of every boolean column is added to it
+    '''
+
+    import pyarrow as pa
+    table = load_table(filename)
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(pa.string())
+        if pa.types.is_string(column.type):
+            columns[name] = column.fill_null("").to_numpy(zero_copy_only=False).astype(str)
+        elif pa.types.is_floating(column.type):
+            columns[name] = column.cast(pa.float64()).fill_null(np.nan).to_numpy()
+        elif pa.types.is_boolean(column.type):
+            if valid!=None:
+                valid[name] = column.is_valid().to_numpy(zero_copy_only=False)
+            columns[name] = column.fill_null(False).to_numpy(zero_copy_only=False)
+        else:
+            columns[name] = column.fill_null(0).to_numpy()
+    return columns
+
+def map_unique(values, function):
+    # Apply a function once per unique value instead of once per row
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return np.array([function(str(value)) for value in uniques], dtype=object)[inverse]
+
+def load_results(filename):
+    ''' Load the final results into NumPy arrays: the ground truth, the question score, the syntax flags and the tokens '''
+
+    valid = {}
+    columns = load_columns(filename, valid)
+    data = {
+        "gt": columns["GT Punctuation simplified"]=="question",
+        "tokens": columns["Num of Tokens"],
+        "question_words": columns["Contains Question Words"],
+        "question_syntax": columns["Contains Question Syntax"],
+        # Whether the sentence analyzer checked the sentence, i.e. whether its question words/syntax are known
+        "checked": valid["Contains Question Words"] & valid["Contains Question Syntax"],
+        "second_is_question": map_unique(columns["Prediction 2"], simplify_pred)=="question",
+        "baselines": {
+            "Predicted Punctuation Simplified": columns["Predicted Punctuation Simplified"],
+            "New Predicted Punctuation Simplified": columns["New Predicted Punctuation Simplified"],
+        },
+    }
+
+    if "P(question)" in columns:
+        score = columns["P(question)"]
+    else:
+        score = np.zeros(len(data["gt"]))
+        for k, (prediction, score_column) in enumerate([("Prominent Prediction", "Prominent Score"), ("Prediction 2", "Score 2"),
+                                                        ("Prediction 3", "Score 3"), ("Prediction 4", "Score 4"), ("Prediction 5", "Score 5")]):
+            is_question = map_unique(columns[prediction], simplify_pred)=="question"
+            scores = columns[score_column].copy()
+            if k==0:
+                # A row decided without the model (e.g. by the cascade) has a prominent prediction without a score
+                scores[np.isnan(scores) & (columns[prediction]!="")] = 1.0
+            score += np.where(is_question, np.nan_to_num(scores), 0.0)
+    data["score"] = np.nan_to_num(score)
+    return data
+
+def select_rows(data, selected):
+    # The data of the selected rows only
+    return {name: select_rows(values, selected) if isinstance(values, dict) else values[selected] for name, values in data.items()}
+
+def get_buckets(tokens, edges):
+    ''' Return the labels of the token buckets and the bucket of every row. The first bucket ('all') is every row '''
+
+    labels = ["all"]
+    lower = 0
+    for upper in edges:
+        labels.append(str(lower) + "-" + str(upper))
+        lower = upper+1
+    labels.append(">" + str(edges[-1]))
+    return labels, np.searchsorted(np.array(edges), tokens, side='left') + 1
+
+def count_at_least(values, thresholds):
+    # For each threshold, the number of values that are at least the threshold
+    return len(values) - np.searchsorted(np.sort(values), thresholds, side='left')
+
+def sweep(data, thresholds, override, buckets):
+    ''' Return the confusion counts (TP, FP, FN, TN of 'question') of a rule for every threshold and every bucket
+
+    The rule labels a row as 'question' if its score is at least the threshold or if override is True for it.
+    The counts are arrays of shape (number of buckets, number of thresholds).
+    '''
+
+    labels, bucket = buckets
+    counts = {name: np.zeros((len(labels), len(thresholds)), dtype=np.int64) for name in ("tp", "fp", "fn", "tn")}
+    for index in range(len(labels)):
+        in_bucket = np.ones(len(bucket), dtype=bool) if index==0 else bucket==index
+        forced = in_bucket & override
+        free = in_bucket & ~override
+        tp = np.count_nonzero(forced & data["gt"]) + count_at_least(data["score"][free & data["gt"]], thresholds)
+        predicted = np.count_nonzero(forced) + count_at_least(data["score"][free], thresholds)
+        positives = np.count_nonzero(in_bucket & data["gt"])
+        counts["tp"][index] = tp
+        counts["fp"][index] = predicted - tp
+        counts["fn"][index] = positives - tp
+        counts["tn"][index] = np.count_nonzero(in_bucket) - positives - (predicted - tp)
+    return counts
+
+def divide(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator>0)
+
+def scores(tp, fp, fn, tn):
+    ''' Precision, recall and F1 of 'question' (positive class) and 'EOS' (negative class), and the accuracy '''
+
+    result = {}
+    for name, (true, false_positive, false_negative) in (("question", (tp, fp, fn)), ("EOS", (tn, fn, fp))):
+        precision = divide(true, true + false_positive)
+        recall = divide(true, true + false_negative)
+        result[name + "_precision"] = precision
+        result[name + "_recall"] = recall
+        result[name + "_f1"] = divide(2 * precision * recall, precision + recall)
+    result["accuracy"] = divide(tp + tn, tp + fp + fn + tn)
+    result["macro_f1"] = (result["question_f1"] + result["EOS_f1"]) / 2
+    return result
+
+def confusion_matrix(gt, labels):
+    # Rows: the ground truth ('question', 'EOS'), columns: the predicted label ('question', 'EOS', 'other')
+    return {truth: {label: int(np.count_nonzero((gt==(truth=="question")) & (labels==label))) for label in ("question", "EOS", "other")}
+            for truth in ("question", "EOS")}
+
+def evaluate(data, thresholds, max_tokens_options, token_edges, overrides=None):
+    ''' Evaluate every variant (threshold x override x maximum tokens of the override) and return one record per variant and bucket
+
+    overrides is the list of the names of the overrides that are evaluated (default: all of them)
+    '''
+
+    buckets = get_buckets(data["tokens"], token_edges)
+    records = []
+    for override_name, override_function in OVERRIDES.items():
+        if overrides!=None and override_name not in overrides:
+            continue
+        for max_tokens in (max_tokens_options if override_name!="none" else [None]):
+            override = override_function(data) & data["second_is_question"]
+            if max_tokens!=None:
+                override = override & (data["tokens"]<=max_tokens)
+            counts = sweep(data, thresholds, override, buckets)
+            metrics = scores(counts["tp"], counts["fp"], counts["fn"], counts["tn"])
+            for index, label in enumerate(buckets[0]):
+                for t, threshold in enumerate(thresholds):
+                    record = {"threshold": float(threshold), "override": override_name, "override_max_tokens": max_tokens, "bucket": label}
+                    record.update({name: int(values[index, t]) for name, values in counts.items()})
+                    record.update({name: float(values[index, t]) for name, values in metrics.items()})
+                    records.append(record)
+    return records
+
+def evaluate_baselines(data):
+    # The labels that the pipeline wrote, without and with its syntax override. A label 'other' is neither 'question' nor 'EOS'
+    results = {}
+    gt = data["gt"]
+    for name, labels in data["baselines"].items():
+        results[name] = {}
+        for label, truth in (("question", gt), ("EOS", ~gt)):
+            predicted = labels==label
+            precision = divide(np.count_nonzero(predicted & truth), np.count_nonzero(predicted))
+            recall = divide(np.count_nonzero(predicted & truth), np.count_nonzero(truth))
+            results[name][label + "_precision"] = float(precision)
+            results[name][label + "_recall"] = float(recall)
+            results[name][label + "_f1"] = float(divide(2 * precision * recall, precision + recall))
+        results[name]["accuracy"] = float(divide(np.count_nonzero((labels=="question") & gt) + np.count_nonzero((labels=="EOS") & ~gt), len(gt)))
+        results[name]["confusion_matrix"] = confusion_matrix(gt, labels)
+    return results
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default=os.path.join(os.path.abspath('..'), "Data", "Dortmund_all_allPredictions_test.csv"), help="The final results of the pipeline (csv, arrow or parquet)")
+    parser.add_argument("--thresholds", type=int, default=101, help="The number of thresholds of the question score, evenly spaced from 0 to 1")
+    parser.add_argument("--override-max-tokens", type=int, nargs="+", default=[None], help="The maximum numbers of tokens of a sentence for the syntax override (default: no limit)")
+    parser.add_argument("--token-buckets", type=int, nargs="+", default=[2, 5, 10, 20], help="The upper limits of the buckets of 'Num of Tokens'")
+    parser.add_argument("--metric", type=str, default="question_f1", help="The metric used to rank the variants")
+    parser.add_argument("--top", type=int, default=10, help="The number of best variants printed")
+    parser.add_argument("--checked-only", action="store_true", help="Evaluate all the variants on the sentences checked by the sentence analyzer only (for results of --syntax-check needed)")
+    parser.add_argument("--output", type=str, default=None, help="The csv file with the results of every variant and bucket (default: next to the input file)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = load_results(args.input)
+    print("Loaded", len(data["gt"]), "sentences in", round(time.perf_counter()-start, 2), "s")
+
+    overrides = None
+    if args.checked_only:
+        print("Only the", np.count_nonzero(data["checked"]), "sentences checked by the sentence analyzer are evaluated")
+        data = select_rows(data, data["checked"])
+    elif np.any(data["second_is_question"] & ~data["checked"]):
+        # An override would count these sentences as without question words/syntax, so its numbers would be too low
+        print("WARNING:", np.count_nonzero(data["second_is_question"] & ~data["checked"]), "sentences with a 'question' as second prediction weren't checked by the sentence analyzer"
+              " (results of --syntax-check needed), so only the variants without an override are evaluated."
+              " Run the pipeline with --syntax-check all, or use --checked-only")
+        overrides = ["none"]
+
+    start = time.perf_counter()
+    records = evaluate(data, np.linspace(0, 1, args.thresholds), args.override_max_tokens, args.token_buckets, overrides)
+    variants = [record for record in records if record["bucket"]=="all"]
+    print("Evaluated", len(variants), "variants in", round(time.perf_counter()-start, 2), "s")
+
+    for name, result in evaluate_baselines(data).items():
+        print(name + ":", {metric: round(value, 4) for metric, value in result.items() if metric!="confusion_matrix"})
+        print("  confusion matrix (ground truth -> predicted):", json.dumps(result["confusion_matrix"]))
+
+    print("Best variants by", args.metric + ":")
+    for record in sorted(variants, key=lambda record: record[args.metric], reverse=True)[:args.top]:
+        print("  threshold", round(record["threshold"], 3), "override", record["override"], "max tokens", record["override_max_tokens"],
+              "-", {metric: round(record[metric], 4) for metric in ("question_precision", "question_recall", "question_f1", "EOS_f1", "accuracy")})
+
+    filename_out = args.output
+    if filename_out==None:
+        filename_out = os.path.splitext(args.input)[0]+'_sweep.csv'
+    with open(filename_out, "w", newline='', encoding='utf-8') as csv_file_out:
+        csv_writer = csv.DictWriter(csv_file_out, fieldnames=list(records[0].keys()))
+        csv_writer.writeheader()
+        csv_writer.writerows(records)
+    print("Results written to", filename_out)
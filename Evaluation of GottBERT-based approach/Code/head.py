@@ -0,0 +1,148 @@
+import os
+import csv
+import json
+import time
+import argparse
+import numpy as np
+from helpers.csv_io import read_csv, write_csv
+from helpers.columnar import is_columnar
+from helpers.backends import BACKENDS, MODEL_NAME
+from evaluate import load_columns, evaluate_baselines
+
+'''
+    A lightweight classification head on the hidden states at the <mask>, instead of the rules on the top-5 tokens.
+
+    The encoder is run once over the masked sentences of the final results of the pipeline (csv, arrow or parquet),
+    and the hidden state at the <mask> of every sentence is cached on disk (see helpers.mask_embeddings). A logistic
+    regression (see helpers.logistic_head) is trained on them against "GT Punctuation simplified", on a seeded
+    split of the unique sentences (a sentence is never both in the training and in the test rows), and compared on
+    the test rows with the labels of the pipeline, without and with its syntax override. Then every sentence is
+    classified, and the results are written with the label and the probabilities of the head. Once the hidden
+    states are cached, training and classifying take seconds, e.g. from the Code folder:
+        python head.py --input ../Data/Dortmund_all_allPredictions_test.csv
+    The cached hidden states are extracted again if they were computed with another model, backend or context
+    window. The saved head can label new utterances in the pipeline, with the same options:
+        python pipeline.py --scoring head --head-file ../Data/Dortmund_all_allPredictions_test_head.npz
+'''
+
+HEAD_LABEL_COLUMN = "Head Predicted Punctuation Simplified"
+
+def read_sentences(filename):
+    ''' Return the masked sentences (the "Utterance" column) of a results file (csv, arrow or parquet) '''
+
+    if is_columnar(filename):
+        from helpers.columnar import read_table
+        return read_table(filename).column("Utterance").to_pylist()
+    return [row[0] for row in read_csv(filename)]
+
+def read_results(filename):
+    # The header and the rows of a results file, as text
+    if is_columnar(filename):
+        from helpers.columnar import read_table, read_rows
+        return read_table(filename).column_names, read_rows(filename)
+    with open(filename, encoding='utf-8', newline='') as csv_file_in:
+        header = next(csv.reader(csv_file_in, delimiter=','))
+    return header, read_csv(filename)
+
+def get_extraction_source(args):
+    from helpers.mask_embeddings import get_source
+    return get_source(args.model, args.backend, args.left_context, args.right_context)
+
+def extract(args, sentences, filename):
+    from helpers.backends import load_predictor
+    from helpers.context_window import ContextWindow
+    from helpers.mask_embeddings import extract_embeddings
+    if args.backend=='onnx':
+        raise ValueError("The hidden states need the PyTorch model, please use the 'eager' or 'int8' backend")
+    predictor = load_predictor(args.backend, args.model)
+    context = ContextWindow(predictor.tokenizer, args.left_context, args.right_context)
+    return extract_embeddings(filename, sentences, predictor.model, predictor.tokenizer, context, args.max_tokens, source=get_extraction_source(args))
+
+def get_stale_reason(args, filename, rows):
+    # Why the cached hidden states in filename can't be used (None if they can)
+    from helpers.mask_embeddings import load_embeddings, get_mismatch
+    if args.extract:
+        return "--extract"
+    if not os.path.isfile(filename):
+        return "not cached yet"
+    metadata = load_embeddings(filename)[1]
+    if metadata["rows"]!=rows:
+        return str(metadata["rows"]) + " rows instead of " + str(rows)
+    return get_mismatch(metadata, get_extraction_source(args))
+
+def split_sentences(sentences, test_share, seed=0):
+    ''' Return the training and the test rows, split by unique sentence '''
+
+    uniques, inverse = np.unique(sentences, return_inverse=True)
+    in_test = np.random.default_rng(seed).random(len(uniques))<test_share
+    rows_in_test = in_test[inverse]
+    return np.flatnonzero(~rows_in_test), np.flatnonzero(rows_in_test)
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default=os.path.join(os.path.abspath('..'), "Data", "Dortmund_all_allPredictions_test.csv"), help="The final results of the pipeline (csv, arrow or parquet)")
+    parser.add_argument("--embeddings", type=str, default=None, help="The cached hidden states (default: next to the input file)")
+    parser.add_argument("--extract", action="store_true", help="Run the encoder again even if the hidden states are cached")
+    parser.add_argument("--model", type=str, default=MODEL_NAME, help="The name (or local path) of the model")
+    parser.add_argument("--backend", type=str, default="eager", choices=BACKENDS[:2], help="The inference backend of the extraction")
+    parser.add_argument("--max-tokens", type=int, default=4096, help="The maximum number of tokens of a batch of the extraction")
+    parser.add_argument("--left-context", type=int, default=254, help="The maximum number of tokens before the <mask> given to the model")
+    parser.add_argument("--right-context", type=int, default=254, help="The maximum number of tokens after the <mask> given to the model")
+    parser.add_argument("--test-share", type=float, default=0.2, help="The share of the unique sentences held out for the evaluation")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the split and of the training")
+    parser.add_argument("--epochs", type=int, default=20, help="The number of passes over the training rows")
+    parser.add_argument("--learning-rate", type=float, default=1e-3, help="The learning rate of the training")
+    parser.add_argument("--l2", type=float, default=1e-4, help="The weight of the L2 penalty")
+    parser.add_argument("--class-weight", type=str, default=None, choices=["balanced"], help="Weight the rows inversely to the frequency of their label")
+    parser.add_argument("--head", type=str, default=None, help="The file of the trained head (default: next to the input file)")
+    parser.add_argument("--output", type=str, default=None, help="The results with the labels of the head (default: next to the input file)")
+    args = parser.parse_args()
+
+    base = os.path.splitext(args.input)[0]
+    embeddings_filename = args.embeddings if args.embeddings!=None else base+'_maskEmbeddings.f16'
+
+    from helpers.mask_embeddings import load_embeddings
+    from helpers.logistic_head import LogisticHead
+    sentences = np.array(read_sentences(args.input), dtype=str)
+    stale_reason = get_stale_reason(args, embeddings_filename, len(sentences))
+    if stale_reason!=None:
+        print("Extracting the hidden states to", embeddings_filename, "(" + stale_reason + ")")
+        start = time.perf_counter()
+        extract(args, sentences, embeddings_filename)
+        print("Extracted in", round(time.perf_counter()-start, 2), "s")
+    embeddings, metadata = load_embeddings(embeddings_filename)
+
+    columns = load_columns(args.input)
+    gt = columns["GT Punctuation simplified"]
+    train, test = split_sentences(sentences, args.test_share, args.seed)
+    print(len(train), "training and", len(test), "test sentences")
+
+    start = time.perf_counter()
+    head = LogisticHead(sorted(set(gt[train])), args.l2, metadata["source"])
+    head.fit(embeddings, gt, train, args.epochs, learning_rate=args.learning_rate, class_weight=args.class_weight, seed=args.seed)
+    print("Trained in", round(time.perf_counter()-start, 2), "s")
+
+    start = time.perf_counter()
+    probabilities = head.predict_proba(embeddings)
+    labels = np.array(head.labels)[probabilities.argmax(axis=1)]
+    print("Classified", len(labels), "sentences in", round(time.perf_counter()-start, 2), "s")
+
+    # The head and the labels of the pipeline on the test rows
+    data = {"gt": gt[test]=="question", "baselines": {HEAD_LABEL_COLUMN: labels[test]}}
+    for name in ("Predicted Punctuation Simplified", "New Predicted Punctuation Simplified"):
+        if name in columns:
+            data["baselines"][name] = columns[name][test]
+    for name, result in evaluate_baselines(data).items():
+        print(name + ":", {metric: round(value, 4) for metric, value in result.items() if metric!="confusion_matrix"})
+        print("  confusion matrix (ground truth -> predicted):", json.dumps(result["confusion_matrix"]))
+
+    head_filename = args.head if args.head!=None else base+'_head.npz'
+    head.save(head_filename)
+    print("Head written to", head_filename)
+
+    filename_out = args.output if args.output!=None else base+'_head.csv'
+    header, rows = read_results(args.input)
+    header = header + [HEAD_LABEL_COLUMN] + ["Head P(" + label + ")" for label in head.labels]
+    write_csv((list(row) + [label] + [float(value) for value in row_probabilities]
+               for row, label, row_probabilities in zip(rows, labels, probabilities)), filename_out, header)
+    print("Results written to", filename_out)
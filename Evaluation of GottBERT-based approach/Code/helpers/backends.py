@@ -0,0 +1,105 @@
+import os
+import csv
+import time
+import random
+import argparse
+from .predictions import predict_batch
+from .simplify_predictions import simplify_pred
+
+''' Inference backends for the prediction step
+
+    - 'eager': the PyTorch model in fp32, as downloaded (the reference)
+    - 'int8': the PyTorch model, with its linear layers dynamically quantized to int8
+    - 'onnx': the model exported to ONNX and run with ONNX Runtime (needs: pip install optimum[onnxruntime])
+
+    All of them return a fill-mask pipeline, so they can be used in the same way by predict/predict_batch.
+    check_parity compares the predictions of a backend with those of the eager backend on a fixed sample of sentences.
+'''
+
+MODEL_NAME = 'uklfr/gottbert-base'
+BACKENDS = ['eager', 'int8', 'onnx']
+
+def load_predictor(backend='eager', model_name=MODEL_NAME, onnx_dir=None):
+    ''' Load the fill-mask pipeline of the model with the given backend
+
+    :param backend: One of BACKENDS
+    :param model_name: The name (or local path) of the model
+    :param onnx_dir: Where the exported ONNX model is saved and loaded from, so that it's exported only once
+    '''
+
+    from transformers import pipeline, AutoTokenizer
+    if backend=='eager':
+        return pipeline('fill-mask', model=model_name)
+    if backend=='int8':
+        import torch
+        predictor = pipeline('fill-mask', model=model_name)
+        torch.ao.quantization.quantize_dynamic(predictor.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return predictor
+    if backend=='onnx':
+        from optimum.onnxruntime import ORTModelForMaskedLM
+        if onnx_dir!=None and os.path.isdir(onnx_dir):
+            model = ORTModelForMaskedLM.from_pretrained(onnx_dir)
+        else:
+            model = ORTModelForMaskedLM.from_pretrained(model_name, export=True)
+            if onnx_dir!=None:
+                model.save_pretrained(onnx_dir)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return pipeline('fill-mask', model=model, tokenizer=tokenizer)
+    raise ValueError("Unknown backend '" + str(backend) + "'. Please use one of: " + ", ".join(BACKENDS))
+
+def sample_sentences(filename, size=1000, seed=0):
+    ''' Return a fixed (seeded) random sample of the masked sentences in the first column of a csv file '''
+
+    with open(filename, encoding='utf-8', newline='') as csv_file_in:
+        sentences = [row[0] for i, row in enumerate(csv.reader(csv_file_in, delimiter=',')) if i>0 and len(row)>0]
+    if len(sentences)<=size:
+        return sentences
+    return random.Random(seed).sample(sentences, size)
+
+def check_parity(reference, candidate, sentences, **kwargs):
+    ''' Compare the predictions of two predictors on the same sentences
+
+    Returns the share of the sentences for which the top-1 punctuation and the simplified label
+    (simplify_pred of the first two predictions) are the same, together with the time each predictor needed.
+    The keyword arguments are passed to predict_batch.
+    '''
+
+    start = time.time()
+    reference_rows = list(predict_batch(reference, sentences, **kwargs))
+    reference_time = time.time() - start
+    start = time.time()
+    candidate_rows = list(predict_batch(candidate, sentences, **kwargs))
+    candidate_time = time.time() - start
+
+    same_top1 = 0
+    same_label = 0
+    for reference_row, candidate_row in zip(reference_rows, candidate_rows):
+        if reference_row[0]==candidate_row[0]:
+            same_top1 += 1
+        if simplify_pred(reference_row[0], reference_row[2])==simplify_pred(candidate_row[0], candidate_row[2]):
+            same_label += 1
+
+    total = max(len(sentences), 1)
+    return {
+        "sentences": len(sentences),
+        "top1_agreement": same_top1/total,
+        "label_agreement": same_label/total,
+        "reference_seconds": reference_time,
+        "candidate_seconds": candidate_time,
+        "speedup": reference_time/candidate_time if candidate_time>0 else None,
+    }
+
+if __name__=='__main__':
+    # e.g. python -m helpers.backends --backend int8 --sample 1000 (from the Code folder)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default="int8", help="The backend that is compared with the eager one")
+    parser.add_argument("--input", type=str, default=os.path.join(os.path.abspath('..'), "Data", "Dortmund_all_segmentedUtterances_maskedPredictions.csv"), help="A csv file with masked sentences in its first column")
+    parser.add_argument("--sample", type=int, default=1000, help="The number of sentences of the sample")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the sample")
+    parser.add_argument("--onnx-dir", type=str, default=None, help="Where the exported ONNX model is saved")
+    args = parser.parse_args()
+
+    sentences = sample_sentences(args.input, args.sample, args.seed)
+    reference = load_predictor('eager')
+    candidate = load_predictor(args.backend, onnx_dir=args.onnx_dir)
+    print(check_parity(reference, candidate, sentences))
@@ -0,0 +1,142 @@
+import re
+from itertools import tee
+from .predictions import predict_batch
+
+''' Rule-first cascade: only the sentences that the cheap tiers can't decide are sent to GottBERT
+
+    1. rules: a question word at the beginning of the sentence makes it a 'question', a short greeting or thanks
+       without any question cue (e.g. "hallo", "vielen dank") an 'EOS'
+    2. syntax: a verb before its subject (the question syntax of the sentence analyzer, e.g. "hast du zeit") makes
+       it a 'question'
+    3. model: all the other sentences are predicted by the model, as without the cascade
+
+    The tiers only look at the masked sentence, never at its punctuation. A decided sentence gets its label's
+    punctuation as the prominent prediction (with no score), so the next steps treat it like a prediction of the
+    model. The tier that decided each row is kept in the last column ("Decided By"), and the final rows are used to
+    report the share and the accuracy (against the ground truth) of each tier.
+'''
+
+TIERS = ["rules", "syntax", "model"]
+
+DECIDED_BY_COLUMN = "Decided By"
+
+# The punctuation written as the prediction of a decided sentence
+LABEL_PUNCTUATION = {"question": "?", "EOS": "."}
+
+# Question words that make a sentence a question when it starts with them
+QUESTION_WORDS = {"wer", "wen", "wem", "wessen", "was", "wann", "wo", "woher", "wohin", "warum", "wieso", "weshalb",
+                  "weswegen", "wie", "welche", "welcher", "welches", "welchen", "welchem", "wozu", "womit", "wofür",
+                  "worüber", "worauf", "woran", "wovon", "wodurch", "worum", "wieviel", "wieviele"}
+
+# Words of greetings, thanks and goodbyes
+GREETING_WORDS = {"hallo", "hi", "hey", "huhu", "moin", "servus", "tschüss", "tschüs", "ciao", "bye", "danke",
+                  "dankeschön", "vielen", "dank", "gute", "guten", "morgen", "tag", "abend", "nacht", "liebe", "lieben",
+                  "gruß", "grüße", "lg", "vg"}
+
+WORD = re.compile(r"\w+")
+
+def strip_mask(masked_sentence):
+    return masked_sentence.replace("<mask>", "").strip()
+
+def sentence_words(masked_sentence):
+    return WORD.findall(strip_mask(masked_sentence).lower())
+
+class Cascade:
+    ''' Decides the sentences with the rules and the syntax tier and predicts only the rest with the model
+
+    :param checker: The sentence analyzer of the syntax tier (a SyntaxChecker or InProcessSyntaxChecker), None for the rules only
+    :param max_greeting_words: The maximum number of words of a greeting that the rules decide
+    :param chunk_size: The number of sentences whose syntax is checked together
+    '''
+
+    def __init__(self, checker=None, max_greeting_words=3, chunk_size=256):
+        self.checker = checker
+        self.max_greeting_words = max_greeting_words
+        self.chunk_size = chunk_size
+        self.rows = {tier: 0 for tier in TIERS}
+        self.correct = {tier: 0 for tier in TIERS}
+
+    def decide_rules(self, masked_sentence):
+        ''' Return the label of the sentence according to the rules, or None if they can't decide '''
+
+        words = sentence_words(masked_sentence)
+        if len(words)==0:
+            return None
+        if words[0] in QUESTION_WORDS:
+            return "question"
+        if len(words)<=self.max_greeting_words and all(word in GREETING_WORDS for word in words):
+            return "EOS"
+        return None
+
+    def decide_chunk(self, rows):
+        # The tier and the label of each row (the label is None for the rows left to the model)
+        decisions = []
+        for row in rows:
+            label = self.decide_rules(row[0])
+            decisions.append(("rules", label) if label!=None else ("model", None))
+        if self.checker!=None:
+            to_check = [index for index, (tier, label) in enumerate(decisions) if tier=='model' and strip_mask(rows[index][0])!=""]
+            analyses = self.checker.analyze_many([strip_mask(rows[index][0]) for index in to_check])
+            for index, analysis in zip(to_check, analyses):
+                if analysis!=None and analysis["containsQuestionSyntax"]:
+                    decisions[index] = ("syntax", "question")
+        return decisions
+
+    def decide(self, rows):
+        ''' Yield (row, tier, label) for the masked rows, in the order of the input '''
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk)==self.chunk_size:
+                yield from ((row, tier, label) for row, (tier, label) in zip(chunk, self.decide_chunk(chunk)))
+                chunk = []
+        if len(chunk)>0:
+            yield from ((row, tier, label) for row, (tier, label) in zip(chunk, self.decide_chunk(chunk)))
+
+    def add_predictions(self, predictor, rows, columns=10, **kwargs):
+        ''' Like predictions.add_predictions, but only the undecided rows go to the model, and the tier is added at the end
+
+        :param columns: The number of prediction columns of a row (with the score columns of a PunctuationScorer, if any)
+
+        The keyword arguments are passed to predict_batch
+        '''
+
+        decisions, decisions_copy = tee(self.decide(rows))
+        predictions = predict_batch(predictor, (row[0] for row, tier, label in decisions_copy if tier=='model'), **kwargs)
+        for row, tier, label in decisions:
+            if tier=='model':
+                prediction = next(predictions)
+            else:
+                prediction = [LABEL_PUNCTUATION[label]] + [""] * (columns-1)
+            yield row + prediction + [tier]
+
+    def score_rows(self, rows):
+        ''' Yield the final (simplified) rows unchanged, while counting the rows and the correct labels of each tier '''
+
+        for row in rows:
+            tier = row[-1]
+            if tier in self.rows:
+                self.rows[tier] += 1
+                # GT Punctuation simplified and New Predicted Punctuation Simplified
+                if row[13]==row[18]:
+                    self.correct[tier] += 1
+            yield row
+
+    def to_dict(self):
+        total = sum(self.rows.values())
+        return {tier: {"rows": self.rows[tier],
+                       "share": self.rows[tier]/total if total>0 else None,
+                       "accuracy": self.correct[tier]/self.rows[tier] if self.rows[tier]>0 else None}
+                for tier in TIERS}
+
+    def report(self):
+        lines = ["Cascade:"]
+        for tier, values in self.to_dict().items():
+            line = "  " + tier + ": " + str(values["rows"]) + " rows"
+            if values["share"]!=None:
+                line += " (" + str(round(100*values["share"], 1)) + "%)"
+            if values["accuracy"]!=None:
+                line += ", accuracy " + str(round(100*values["accuracy"], 1)) + "%"
+            lines.append(line)
+        return "\n".join(lines)
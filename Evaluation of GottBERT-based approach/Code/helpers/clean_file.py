@@ -1,25 +1,162 @@
+import os
+import re
 import csv
+import codecs
 
-def clean_file(filename_in, filename_out):
-    # Read input file (csv)
-    csv_file_in = open(filename_in, encoding='utf-8')
-    csv_reader = csv.reader(csv_file_in, delimiter=',')
-
-    # Write to output file (csv)
-    csv_file_out = open(filename_out, "w", newline='', encoding='utf-8')
-    csv_writer = csv.writer(csv_file_out, delimiter=',')
-
-    # Write all the lines in a new file, except from those that contain some weird characters (e.g. NUL)
-    flag=0
-    placeholder = 0
-    while flag==0:
-        try:
-            for id, row in enumerate(csv_reader):
-                csv_writer.writerow(row)
-            flag=1
-        except Exception as e:
-            placeholder = placeholder + id
-            print(Exception,"in line",placeholder)
-
-    return 1
+''' Single-pass sanitizer for the csv files of the pipeline
 
+    The file is read in big binary chunks and decoded incrementally from its (detected) encoding, so it's read
+    only once and at disk speed. NULs, other control characters and the bytes that are invalid in the encoding are
+    stripped from the text, and the lines that needed it are counted as repaired. Rows that are left empty,
+    or that the csv reader can't parse, are dropped and counted. The rows can be used directly as the first
+    stage of the pipeline (sanitized_rows), or written to a new utf-8 csv file (clean_file).
+'''
+
+CHUNK_SIZE = 1 << 20
+SAMPLE_SIZE = 1 << 16
+
+BOMS = [(codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')]
+
+# Control characters except from tab and line breaks
+INVALID_CHARACTERS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+
+# The bytes that are invalid in the encoding are decoded as NULs, so that they are stripped (and counted) with them
+codecs.register_error('sanitizer', lambda error: ('\x00', error.end))
+
+def decodes_as(sample, encoding):
+    # Samples may start or end in the middle of a multi-byte character: skip the leading continuation bytes
+    # and let the incremental decoder keep the incomplete character at the end
+    if encoding=='utf-8':
+        start = 0
+        while start<min(len(sample), 3) and 0x80<=sample[start]<=0xbf:
+            start += 1
+        sample = sample[start:]
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def detect_encoding(filename, sample_size=SAMPLE_SIZE):
+    ''' Guess the encoding of a file from samples of its beginning, middle and end
+
+    A byte order mark wins. Otherwise the file is utf-8 if all the samples are valid utf-8, else cp1252
+    (the usual encoding of German text exported on Windows, e.g. Data/Dortmund_all.csv) if they are valid cp1252,
+    else latin-1, which accepts any byte.
+    '''
+
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as file_in:
+        head = file_in.read(sample_size)
+        for bom, encoding in BOMS:
+            if head.startswith(bom):
+                return encoding
+        samples = [head]
+        for offset in (size//2, size-sample_size):
+            if offset>=len(head):
+                file_in.seek(offset)
+                samples.append(file_in.read(sample_size))
+
+    for encoding in ('utf-8', 'cp1252'):
+        if all(decodes_as(sample, encoding) for sample in samples):
+            return encoding
+    return 'latin-1'
+
+class Sanitizer:
+    ''' Reads a csv file once, yielding its sanitized rows and counting what was repaired or dropped
+
+    :param filename: The csv file
+    :param encoding: The encoding of the file (default: detected with detect_encoding)
+    :param chunk_size: The number of bytes read at once
+    '''
+
+    def __init__(self, filename, encoding=None, chunk_size=CHUNK_SIZE):
+        self.filename = filename
+        self.encoding = encoding if encoding!=None else detect_encoding(filename)
+        self.chunk_size = chunk_size
+        self.lines = 0
+        self.repaired = 0
+        self.dropped = 0
+        self.rows = 0
+
+    def read_lines(self):
+        ''' Yield the decoded and sanitized lines of the file (with their line break) '''
+
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='sanitizer')
+        pending = ""
+        with open(self.filename, 'rb') as file_in:
+            while True:
+                chunk = file_in.read(self.chunk_size)
+                text = pending + decoder.decode(chunk, final=len(chunk)==0)
+                lines = text.split('\n')
+                # The last part is either empty or a line that continues in the next chunk
+                pending = lines.pop()
+                if len(chunk)==0 and pending!="":
+                    lines.append(pending)
+                    pending = ""
+                # Most chunks are clean, so the lines are checked one by one only if the chunk needs it
+                check = INVALID_CHARACTERS.search(text)!=None
+                for line in lines:
+                    self.lines += 1
+                    if check and INVALID_CHARACTERS.search(line)!=None:
+                        line = INVALID_CHARACTERS.sub('', line)
+                        self.repaired += 1
+                        # The csv reader yields [] for an empty line, which read_rows doesn't count as a dropped
+                        # row (it was never one), so a line that only had control characters is counted here.
+                        # A line with spaces left is yielded as a row of blank cells, and counted by read_rows
+                        if line=="":
+                            self.dropped += 1
+                    yield line + '\n'
+                if len(chunk)==0:
+                    break
+
+    def read_rows(self):
+        ''' Yield all the rows of the file (including the header) except from the empty or unreadable ones '''
+
+        csv_reader = csv.reader(self.read_lines(), delimiter=',')
+        while True:
+            try:
+                row = next(csv_reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                # The reader continues with the next line, so the row is just dropped
+                print("Dropped the row in line", csv_reader.line_num, "of", self.filename, "-", e)
+                self.dropped += 1
+                continue
+            if all(cell.strip()=="" for cell in row):
+                if len(row)>0:
+                    self.dropped += 1
+                continue
+            self.rows += 1
+            yield row
+
+    def report(self):
+        return (self.filename + " (" + self.encoding + "): " + str(self.lines) + " lines, " + str(self.rows) + " rows, "
+                + str(self.repaired) + " lines repaired, " + str(self.dropped) + " rows dropped")
+
+def sanitized_rows(filename, encoding=None, skip_header=True):
+    ''' Yield the sanitized rows of a csv file (without its header) and print the report at the end '''
+
+    sanitizer = Sanitizer(filename, encoding)
+    for i, row in enumerate(sanitizer.read_rows()):
+        if i>0 or not skip_header:
+            yield row
+    print(sanitizer.report())
+
+def clean_file(filename_in, filename_out, encoding=None):
+    ''' Write the sanitized rows of a csv file to a new utf-8 csv file and return the number of rows written '''
+
+    sanitizer = Sanitizer(filename_in, encoding)
+    with open(filename_out, "w", newline='', encoding='utf-8') as csv_file_out:
+        csv_writer = csv.writer(csv_file_out, delimiter=',')
+        for row in sanitizer.read_rows():
+            csv_writer.writerow(row)
+    print(sanitizer.report())
+
+    return sanitizer.rows
+
+if __name__=='__main__':
+    # e.g. python clean_file.py ../../Data/Dortmund_all.csv ../../Data/Dortmund_all_utf8.csv
+    import sys
+    clean_file(sys.argv[1], sys.argv[2])
@@ -0,0 +1,162 @@
+import os
+import csv
+import sys
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    # The pipeline checks its files with is_columnar, which doesn't need pyarrow
+    pa = None
+
+''' Read and write the results of the pipeline as Apache Arrow (.arrow) or Parquet (.parquet) tables with typed columns.
+
+    Scores are stored as float32, the question words/syntax flags as booleans (null for the sentences that weren't
+    sent to the sentence analyzer) and the punctuation and labels as
+    categorical (dictionary-encoded) columns. An .arrow file is memory-mapped when it is read, so loading it is
+    almost instant. The tables can always be exported back to csv, e.g. from the Code folder:
+        python -m helpers.columnar ../Data/Dortmund_all_allPredictions_test.parquet ../Data/Dortmund_all_allPredictions_test.csv
+'''
+
+COLUMNAR_FORMATS = ['arrow', 'parquet']
+
+def is_columnar(filename):
+    ''' Return whether the file is an .arrow or .parquet table (by its extension) '''
+
+    return os.path.splitext(filename)[1][1:] in COLUMNAR_FORMATS
+
+def check_pyarrow():
+    if pa==None:
+        raise ImportError("The arrow and parquet tables need pyarrow, please install it: pip install pyarrow")
+
+if pa!=None:
+    CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+    COLUMN_TYPES = {
+        "Utterance": pa.string(),
+        "Punctuation": CATEGORY,
+        "Simple Punctuation": CATEGORY,
+        "Prominent Prediction": CATEGORY,
+        "Prominent Score": pa.float32(),
+        "Prediction 2": CATEGORY,
+        "Score 2": pa.float32(),
+        "Prediction 3": CATEGORY,
+        "Score 3": pa.float32(),
+        "Prediction 4": CATEGORY,
+        "Score 4": pa.float32(),
+        "Prediction 5": CATEGORY,
+        "Score 5": pa.float32(),
+        "GT Punctuation simplified": CATEGORY,
+        "Predicted Punctuation Simplified": CATEGORY,
+        "Num of Tokens": pa.int32(),
+        "Contains Question Words": pa.bool_(),
+        "Contains Question Syntax": pa.bool_(),
+        "New Predicted Punctuation Simplified": CATEGORY,
+        "P(question)": pa.float32(),
+        "P(EOS)": pa.float32(),
+        "Decided By": CATEGORY,
+    }
+
+def make_schema(header):
+    # Columns that aren't known are kept as strings
+    return pa.schema([(name, COLUMN_TYPES.get(name, pa.string())) for name in header])
+
+def to_value(value, data_type):
+    ''' Convert a value of a csv row (usually a string) to a value of the given arrow type (None for empty cells) '''
+
+    if data_type==pa.string() or data_type==CATEGORY:
+        return "" if value==None else str(value)
+    if value=="" or value==None:
+        return None
+    if data_type==pa.bool_():
+        if value==True or value=="True" or value=="true":
+            return True
+        if value==False or value=="False" or value=="false":
+            return False
+        return None
+    if data_type==pa.int32():
+        return int(value)
+    return float(value)
+
+def to_record_batch(rows, schema):
+    columns = []
+    for index, field in enumerate(schema):
+        values = [to_value(row[index] if index<len(row) else None, field.type) for row in rows]
+        if field.type==CATEGORY:
+            columns.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            columns.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+def to_record_batches(rows, schema, batch_size):
+    # Convert the rows to columns in batches of batch_size rows (there is always at least one batch, maybe empty)
+    chunk = []
+    empty = True
+    for row in rows:
+        chunk.append(row)
+        if len(chunk)==batch_size:
+            yield to_record_batch(chunk, schema)
+            empty = False
+            chunk = []
+    if len(chunk)>0 or empty:
+        yield to_record_batch(chunk, schema)
+
+def write_table(rows, filename, header, batch_size=65536):
+    ''' Write the rows to an .arrow or .parquet file and return the number of rows written '''
+
+    check_pyarrow()
+    schema = make_schema(header)
+    count = 0
+    if filename.endswith('.parquet'):
+        with pq.ParquetWriter(filename, schema) as writer:
+            for batch in to_record_batches(rows, schema, batch_size):
+                writer.write_batch(batch)
+                count += batch.num_rows
+    else:
+        # The arrow file format needs a single dictionary per column, so the batches are unified before writing
+        batches = list(to_record_batches(rows, schema, batch_size))
+        table = pa.Table.from_batches(batches, schema=schema).unify_dictionaries().combine_chunks()
+        with pa.OSFile(filename, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        count = table.num_rows
+
+    return count
+
+def read_table(filename):
+    ''' Load an .arrow (memory-mapped, zero-copy) or .parquet file as a pyarrow Table '''
+
+    check_pyarrow()
+    if filename.endswith('.parquet'):
+        return pq.read_table(filename, memory_map=True)
+    return pa.ipc.open_file(pa.memory_map(filename, 'r')).read_all()
+
+def read_rows(filename):
+    ''' Yield the rows of an .arrow or .parquet file as lists, like the rows of the csv files '''
+
+    table = read_table(filename)
+    for batch in table.to_batches():
+        columns = [column.to_pylist() for column in batch.columns]
+        for row in zip(*columns):
+            yield ["" if value==None else value for value in row]
+
+def export_csv(filename_in, filename_out):
+    ''' Export an .arrow or .parquet file to csv '''
+
+    table = read_table(filename_in)
+    with open(filename_out, "w", newline='', encoding='utf-8') as csv_file_out:
+        csv_writer = csv.writer(csv_file_out, delimiter=',')
+        csv_writer.writerow(table.column_names)
+        for row in read_rows(filename_in):
+            csv_writer.writerow(row)
+
+if __name__=='__main__':
+    # Convert between csv and columnar files, e.g. from the Code folder: python -m helpers.columnar results.parquet results.csv
+    filename_in, filename_out = sys.argv[1], sys.argv[2]
+    if is_columnar(filename_in):
+        export_csv(filename_in, filename_out)
+    else:
+        from .csv_io import read_csv
+        with open(filename_in, encoding='utf-8', newline='') as csv_file_in:
+            header = next(csv.reader(csv_file_in, delimiter=','))
+        write_table(read_csv(filename_in), filename_out, header)
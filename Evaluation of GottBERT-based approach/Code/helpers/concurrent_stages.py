@@ -0,0 +1,181 @@
+import time
+import queue
+import threading
+import traceback
+import multiprocessing
+
+''' Stages of the streaming pipeline that run concurrently, connected by bounded queues
+
+    In streaming mode the steps are a chain of generators, so every row is segmented, predicted and simplified
+    one step after the other: the model waits while spaCy segments the next utterances and while the sentence
+    analyzer answers over the network. With --concurrent the segmentation runs in its own process (a
+    ProcessStage), the model in the main process, and the simplification (the requests to the sentence analyzer)
+    and the writing of the results in a thread (a ThreadStage). The rows are handed over in chunks through
+    bounded queues: a stage that is ahead blocks when the queue to the next stage is full, so the memory stays
+    bounded and the total time is close to the time of the slowest stage. Each stage has one worker and the
+    queues are FIFO, so the rows keep the order of the input.
+
+    Both stages measure how long they waited for their neighbors, which shows the slowest stage: e.g. if the
+    model waits for the segmentation, more segmentation processes help, and if it waits for the simplification,
+    more concurrent requests to the sentence analyzer.
+'''
+
+# Put at the end of the rows of a stage
+END = None
+
+def chunked(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk)==chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk)>0:
+        yield chunk
+
+def run_process_stage(function, args, rows_queue, chunk_size):
+    # The body of the process of a ProcessStage. An error is sent to the parent as its traceback
+    try:
+        for chunk in chunked(function(*args), chunk_size):
+            rows_queue.put(chunk)
+    except BaseException:
+        rows_queue.put(traceback.format_exc())
+    rows_queue.put(END)
+
+class ProcessStage:
+    ''' Produces rows in a child process, e.g. the CPU-heavy segmentation, while the parent consumes them
+
+    The process starts right away (e.g. before the model is loaded, so that it segments while the model loads).
+    Iterating over the stage yields the rows of function(*args), in their order. If the rows aren't iterated
+    to the end, the process has to be stopped with close.
+
+    :param name: The name of the stage (for the errors and the report)
+    :param function: A module-level function that returns (or yields) the rows. It runs in the child process
+    :param args: The arguments of function (they are pickled)
+    :param queue_size: The maximum number of chunks waiting in the queue to the parent
+    :param chunk_size: The number of rows of a chunk
+    '''
+
+    def __init__(self, name, function, args=(), queue_size=8, chunk_size=256):
+        self.name = name
+        self.queue = multiprocessing.Queue(maxsize=queue_size)
+        # Not a daemon, so that the function can start processes itself (e.g. spaCy with n_process>1)
+        self.process = multiprocessing.Process(target=run_process_stage, args=(function, args, self.queue, chunk_size))
+        self.rows = 0
+        self.waiting = 0.0
+        self.process.start()
+
+    def get_chunk(self):
+        while True:
+            try:
+                return self.queue.get(timeout=1)
+            except queue.Empty:
+                # The process may have been killed (e.g. out of memory) without sending the end of its rows
+                if not self.process.is_alive():
+                    try:
+                        return self.queue.get(timeout=1)
+                    except queue.Empty:
+                        raise RuntimeError("The process of the " + self.name + " stage stopped with exit code " + str(self.process.exitcode))
+
+    def __iter__(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                chunk = self.get_chunk()
+                self.waiting += time.perf_counter() - start
+                if chunk==END:
+                    break
+                if isinstance(chunk, str):
+                    raise RuntimeError("The " + self.name + " stage failed:\n" + chunk)
+                self.rows += len(chunk)
+                yield from chunk
+            self.process.join()
+        finally:
+            self.close()
+
+    def close(self):
+        # If the rows weren't all consumed (e.g. after an error downstream), the process is stopped
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def report(self):
+        return self.name + " (process): " + str(self.rows) + " rows, the next stage waited " + str(round(self.waiting, 2)) + " s for them"
+
+    def to_dict(self):
+        return {"rows": self.rows, "downstream_waiting_seconds": self.waiting}
+
+class ThreadStage:
+    ''' Consumes rows in a background thread, e.g. the requests to the sentence analyzer and the writing of the results
+
+    :param name: The name of the stage (for the report)
+    :param function: The function that consumes the rows (an iterable) in the thread. Its result is returned by feed
+    :param queue_size: The maximum number of chunks waiting in the queue to the thread
+    :param chunk_size: The number of rows of a chunk
+    '''
+
+    def __init__(self, name, function, queue_size=8, chunk_size=256):
+        self.name = name
+        self.function = function
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.result = None
+        self.error = None
+        self.stopped = threading.Event()
+        self.rows = 0
+        self.waiting = 0.0
+        self.blocked = 0.0
+
+    def get_rows(self):
+        # The rows put by feed, in their order
+        while True:
+            start = time.perf_counter()
+            chunk = self.queue.get()
+            self.waiting += time.perf_counter() - start
+            if chunk==END:
+                return
+            self.rows += len(chunk)
+            yield from chunk
+
+    def run(self):
+        try:
+            self.result = self.function(self.get_rows())
+        except BaseException as e:
+            self.error = e
+        finally:
+            # The feeder doesn't block on a full queue anymore once the thread has stopped
+            self.stopped.set()
+
+    def put(self, item):
+        start = time.perf_counter()
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.blocked += time.perf_counter() - start
+
+    def feed(self, rows):
+        ''' Hand the rows over to the thread (blocking while its queue is full), wait for it and return the result of function '''
+
+        thread = threading.Thread(target=self.run, name=self.name)
+        thread.start()
+        try:
+            for chunk in chunked(rows, self.chunk_size):
+                self.put(chunk)
+                if self.stopped.is_set():
+                    break
+        finally:
+            self.put(END)
+            thread.join()
+        if self.error!=None:
+            raise self.error
+        return self.result
+
+    def report(self):
+        return (self.name + " (thread): " + str(self.rows) + " rows, waited " + str(round(self.waiting, 2)) + " s for them, the stage before it waited " +
+                str(round(self.blocked, 2)) + " s for a free place in its queue")
+
+    def to_dict(self):
+        return {"rows": self.rows, "waiting_seconds": self.waiting, "upstream_blocked_seconds": self.blocked}
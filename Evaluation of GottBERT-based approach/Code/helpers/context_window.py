@@ -0,0 +1,63 @@
+''' Bounded context around the <mask> of long sentences
+
+    Long chat messages (or pasted paragraphs) cost more the longer they are, and the model can't take more
+    than 512 tokens at all. A ContextWindow cuts each sentence to at most left tokens before the <mask> and
+    right tokens after it, using the character offsets of the tokens, so the result is still a piece of the
+    original text. The cuts are between words, so that the piece has the same tokens as in the whole sentence.
+    Sentences that are short enough are kept as they are.
+'''
+
+class ContextWindow:
+    ''' Cuts the sentences to a bounded number of tokens around their (first) <mask>
+
+    :param tokenizer: The (fast) tokenizer of the model
+    :param left: The maximum number of tokens kept before the <mask>
+    :param right: The maximum number of tokens kept after the <mask>
+    '''
+
+    def __init__(self, tokenizer, left=254, right=254):
+        self.tokenizer = tokenizer
+        self.left = left
+        self.right = right
+        self.total = 0
+        self.windowed = 0
+
+    def fits(self, sentence):
+        # Every token has at least one byte, so a sentence with few bytes can't have too many tokens
+        return len(sentence.encode('utf-8'))<=self.left+self.right+1
+
+    def apply(self, sentences):
+        ''' Return the sentences cut to their context window (in the same order) '''
+
+        self.total += len(sentences)
+        result = list(sentences)
+        long_indices = [index for index, sentence in enumerate(sentences) if not self.fits(sentence)]
+        if len(long_indices)==0:
+            return result
+
+        encodings = self.tokenizer([sentences[index] for index in long_indices], add_special_tokens=False, return_offsets_mapping=True)
+        for index, ids, offsets in zip(long_indices, encodings["input_ids"], encodings["offset_mapping"]):
+            if len(ids)<=self.left+self.right+1:
+                continue
+            # Without a <mask>, the end of the sentence is kept
+            if self.tokenizer.mask_token_id in ids:
+                position = ids.index(self.tokenizer.mask_token_id)
+            else:
+                position = len(ids)-1
+            start = max(0, position-self.left)
+            end = min(len(ids), position+self.right+1)
+            # A piece of a word can have more tokens on its own than inside the word, so the window only cuts
+            # between words: it starts at a token after a space and ends before one
+            while start<position and start>0 and offsets[start][0]==offsets[start-1][1]:
+                start += 1
+            while end-1>position and end<len(ids) and offsets[end][0]==offsets[end-1][1]:
+                end -= 1
+            # The space before the first token is kept, since it's part of that token
+            begin = offsets[start-1][1] if start>0 else offsets[start][0]
+            result[index] = sentences[index][begin:offsets[end-1][1]]
+            self.windowed += 1
+
+        return result
+
+    def report(self):
+        return "Context window (" + str(self.left) + " + " + str(self.right) + " tokens): " + str(self.windowed) + " of " + str(self.total) + " sentences cut"
@@ -0,0 +1,43 @@
+import csv
+
+# Headers of the csv files written by the different steps of the pipeline
+SEGMENTED_HEADER = ["Utterance"]
+MASKED_HEADER = ["Utterance", "Punctuation", "Simple Punctuation"]
+PREDICTIONS_HEADER = MASKED_HEADER + ["Prominent Prediction", "Prominent Score", "Prediction 2", "Score 2", "Prediction 3", "Score 3", "Prediction 4", "Score 4", "Prediction 5", "Score 5"]
+# The columns added by the punctuation scoring (after the predictions)
+SCORE_COLUMNS = ["P(question)", "P(EOS)"]
+ALL_PREDICTIONS_HEADER = PREDICTIONS_HEADER + ["GT Punctuation simplified", "Predicted Punctuation Simplified", "Num of Tokens", "Contains Question Words", "Contains Question Syntax", "New Predicted Punctuation Simplified"]
+
+def read_csv(filename, encoding='utf-8'):
+    ''' Yield the rows of a csv file, except from the header '''
+
+    with open(filename, encoding=encoding, newline='') as csv_file_in:
+        csv_reader = csv.reader(csv_file_in, delimiter=',')
+        for i, row in enumerate(csv_reader):
+            if i>0:
+                yield row
+
+def write_csv(rows, filename, header):
+    ''' Write the header and all the rows to a csv file (utf-8) and return the number of rows written '''
+
+    count = 0
+    with open(filename, "w", newline='', encoding='utf-8') as csv_file_out:
+        csv_writer = csv.writer(csv_file_out, delimiter=',')
+        csv_writer.writerow(header)
+        for row in rows:
+            csv_writer.writerow(row)
+            count += 1
+
+    return count
+
+def tee_csv(rows, filename, header):
+    ''' Yield the rows unchanged, while also writing them to a csv file
+
+    Used to keep the intermediate results of the pipeline as debug outputs, without reading them back '''
+
+    with open(filename, "w", newline='', encoding='utf-8') as csv_file_out:
+        csv_writer = csv.writer(csv_file_out, delimiter=',')
+        csv_writer.writerow(header)
+        for row in rows:
+            csv_writer.writerow(row)
+            yield row
@@ -0,0 +1,50 @@
+import re
+
+# Runs of the same letter, e.g. "uuuu" in "juuuuliiiia"
+REPEATED_LETTERS = re.compile(r'([^\W\d_])\1+')
+
+def exact_key(sentence):
+    return sentence
+
+def normalized_key(sentence):
+    ''' Aggressive key: case folding, collapsing of repeated letters and of whitespace
+
+    e.g. "Juuuuliiiia  <mask>" and "julia <mask>" get the same key '''
+
+    key = sentence.casefold()
+    key = REPEATED_LETTERS.sub(r'\1', key)
+    return ' '.join(key.split())
+
+class Deduplicator:
+    ''' Collapses identical masked sentences, so that the model runs only once per unique key
+
+    The predictions are kept for the whole run and fanned back out to every sentence with the same key.
+    With aggressive=True the sentences are compared by their normalized_key instead of their exact text,
+    and the prediction of the first sentence with a given key is used for all of them.
+    '''
+
+    def __init__(self, aggressive=False):
+        if aggressive:
+            self.key = normalized_key
+        else:
+            self.key = exact_key
+        self.predictions = {}
+        self.total = 0
+
+    def add(self, key, prediction):
+        self.predictions[key] = prediction
+
+    def get(self, key):
+        return self.predictions.get(key)
+
+    def count(self, number_of_sentences):
+        self.total += number_of_sentences
+
+    def ratio(self):
+        # Fraction of the sentences that didn't need their own prediction
+        if self.total==0:
+            return 0.0
+        return 1 - len(self.predictions)/self.total
+
+    def report(self):
+        return "Deduplication: " + str(self.total) + " sentences, " + str(len(self.predictions)) + " unique (dedup ratio " + str(round(self.ratio(), 4)) + ")"
@@ -0,0 +1,68 @@
+import time
+from .predictions import make_batches, format_predictions
+from .punctuation_scoring import mask_hidden_states
+from .cascade import LABEL_PUNCTUATION
+from .logistic_head import LogisticHead
+from .mask_embeddings import get_mismatch
+
+class HeadScorer:
+    ''' Labels the sentences with a trained LogisticHead (see head.py) instead of the top-5 tokens
+
+    The encoder runs as usual, but the LM head is skipped: the hidden state at the <mask> goes to the logistic
+    regression. It can be used in place of the fill-mask pipeline in predict_batch: each prediction row contains
+    the punctuation of every label of the head (e.g. '?' for 'question'), best first, with the probability of
+    the label as its score, followed by P(question) and P(EOS). So simplify_pred gives the label of the head,
+    and the syntax override of the next step works as with the other scorings.
+
+    :param model: The PyTorch masked language model (with its base_model)
+    :param tokenizer: The tokenizer of the model
+    :param head: The LogisticHead
+    '''
+
+    def __init__(self, model, tokenizer, head):
+        unknown = [label for label in head.labels if label not in LABEL_PUNCTUATION]
+        if len(unknown)>0:
+            raise ValueError("The head has labels without punctuation: " + ", ".join(unknown))
+        self.model = model
+        self.tokenizer = tokenizer
+        self.head = head
+        self.model.eval()
+        self.punctuation = [LABEL_PUNCTUATION[label] for label in head.labels]
+        self.score_indices = [head.labels.index(label) if label in head.labels else None for label in ("question", "EOS")]
+
+    def format_scores(self, probabilities):
+        # The labels as punctuation in the format of the fill-mask pipeline, followed by P(question) and P(EOS)
+        result = [{"token_str": token_str, "score": float(score)} for token_str, score in zip(self.punctuation, probabilities)]
+        return format_predictions(result) + [float(probabilities[index]) if index!=None else 0.0 for index in self.score_indices]
+
+    def predict_rows(self, sentences, max_tokens, timer=None):
+        ''' Return the prediction rows of the sentences, running the model on batches of similar length '''
+
+        if len(sentences)==0:
+            return []
+        lengths = [len(ids) for ids in self.tokenizer(sentences)["input_ids"]]
+        rows = [None] * len(sentences)
+        for batch in make_batches(lengths, max_tokens):
+            start = time.perf_counter()
+            hidden = mask_hidden_states(self.model, self.tokenizer, [sentences[index] for index in batch])
+            probabilities = self.head.predict_proba(hidden.numpy())
+            if timer!=None:
+                timer.record([lengths[index] for index in batch], time.perf_counter() - start, [sentences[index] for index in batch])
+            for index, sentence_probabilities in zip(batch, probabilities):
+                rows[index] = self.format_scores(sentence_probabilities)
+
+        return rows
+
+def load_head_scorer(filename, model, tokenizer, source):
+    ''' Return a HeadScorer with the head saved in filename
+
+    :param source: The source of the hidden states of the pipeline (see helpers.mask_embeddings.get_source).
+        The head must have been trained on hidden states of the same source
+    '''
+
+    head = LogisticHead.load(filename)
+    mismatch = get_mismatch({"source": head.source}, source)
+    if mismatch!=None:
+        raise ValueError("The head in " + filename + " was trained on other hidden states (" + mismatch +
+                         "). Please train it again with head.py and the options of the pipeline")
+    return HeadScorer(model, tokenizer, head)
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+
+''' Question analysis in the same process as the pipeline, instead of over HTTP
+
+    The qcg-sentence-analyzer gets the CoNLL-U table of each sentence from the spaCy tool and then looks for question
+    words and question syntax in it: two network hops and two serialize/parse cycles per sentence. The question
+    analysis of the spaCy tool (tool.services.question_analysis) does the same on the parsed spaCy Doc, with the same
+    results, and it parses many sentences at once with nlp.pipe.
+'''
+
+# The spaCy tool is in the same repository
+SPACY_TOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'qcg-spacy-tool')
+
+# The German model of the spaCy tool
+ANALYSIS_MODEL = 'de_core_news_md'
+
+class InProcessSyntaxChecker:
+    ''' Drop-in replacement of SyntaxChecker that analyzes the sentences in-process with a German spaCy model
+
+    :param model: The name of the spaCy model
+    :param batch_size: The number of sentences that spaCy parses together
+    :param n_process: The number of processes of spaCy
+    '''
+
+    def __init__(self, model=ANALYSIS_MODEL, batch_size=256, n_process=1):
+        import spacy
+        if SPACY_TOOL_DIR not in sys.path:
+            sys.path.append(SPACY_TOOL_DIR)
+        from tool.services import question_analysis
+        self.question_analysis = question_analysis
+        self.nlp = spacy.load(model)
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.requests = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def analyze(self, sentence):
+        ''' Return the analysis of the (first sentence of the) text, or None if there is none '''
+
+        results = self.question_analysis.analyze_text(sentence, self.nlp)
+        return results[0] if len(results)>0 else None
+
+    def analyze_many(self, sentences):
+        ''' Analyze many sentences in batches. The results are in the order of the sentences '''
+
+        start = time.perf_counter()
+        analyses = [results[0] if len(results)>0 else None
+                    for results in self.question_analysis.analyze_texts(sentences, self.nlp, self.batch_size, self.n_process)]
+        self.seconds += time.perf_counter() - start
+        self.requests += len(sentences)
+        self.failures += sum(1 for analysis in analyses if analysis==None)
+        return analyses
+
+    def close(self):
+        pass
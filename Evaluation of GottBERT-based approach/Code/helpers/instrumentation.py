@@ -0,0 +1,266 @@
+import json
+import time
+import heapq
+
+''' Instrumentation of the pipeline runs
+
+    - Instrumentation.track wraps the rows flowing out of a stage and measures the wall and CPU time spent
+      to produce them. In a chain of generators the time of a stage includes the time of the stages before it
+      (its upstream), so the exclusive time of each stage is its time minus the time of its upstream.
+      A progress line with the throughput and the estimated remaining time is printed every few seconds.
+    - InferenceTimer collects the inference time of each batch, as a histogram over the token count
+      of the sentences, together with the slowest batches (the pathological inputs).
+    - An opt-in profiler (cProfile or the PyTorch profiler) records a sampled window of input rows.
+
+    At the end of the run all the metrics are written to a json file.
+'''
+
+# Upper limits of the token count buckets of the inference histogram (the last bucket is everything longer)
+TOKEN_BUCKETS = [8, 16, 32, 64, 128, 256, 512]
+
+def bucket_label(length):
+    lower = 1
+    for upper in TOKEN_BUCKETS:
+        if length<=upper:
+            return str(lower) + "-" + str(upper)
+        lower = upper+1
+    return ">" + str(TOKEN_BUCKETS[-1])
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return str(seconds//3600) + "h" + str((seconds%3600)//60).zfill(2) + "m" + str(seconds%60).zfill(2) + "s"
+
+def count_rows(filename):
+    ''' Count the lines of a (csv) file quickly, without the header. Used as the total for the progress '''
+
+    count = 0
+    with open(filename, 'rb') as file_in:
+        for chunk in iter(lambda: file_in.read(1 << 20), b''):
+            count += chunk.count(b'\n')
+    return max(count-1, 0)
+
+class InferenceTimer:
+    ''' Histogram of the inference time per sentence over the token count, and the slowest batches
+
+    :param slowest: How many of the slowest batches are kept
+    '''
+
+    def __init__(self, slowest=10):
+        self.buckets = {}
+        self.batches = 0
+        self.seconds = 0.0
+        self.slowest = []
+        self.keep_slowest = slowest
+
+    def record(self, lengths, seconds, sentences=None):
+        ''' Record a batch: the token lengths of its sentences and the time the model needed for it '''
+
+        self.batches += 1
+        self.seconds += seconds
+        # The sentences of a batch have similar lengths, so its time is split evenly between them
+        per_sentence = seconds/max(len(lengths), 1)
+        for length in lengths:
+            bucket = self.buckets.setdefault(bucket_label(length), {"sentences": 0, "seconds": 0.0})
+            bucket["sentences"] += 1
+            bucket["seconds"] += per_sentence
+        longest = max(range(len(lengths)), key=lambda index: lengths[index]) if len(lengths)>0 else None
+        entry = (per_sentence, len(lengths), max(lengths, default=0), sentences[longest][:200] if sentences!=None and longest!=None else "")
+        if len(self.slowest)<self.keep_slowest:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def merge(self, other):
+        # Add the measurements of another timer (e.g. of a worker process)
+        self.batches += other.batches
+        self.seconds += other.seconds
+        for label, other_bucket in other.buckets.items():
+            bucket = self.buckets.setdefault(label, {"sentences": 0, "seconds": 0.0})
+            bucket["sentences"] += other_bucket["sentences"]
+            bucket["seconds"] += other_bucket["seconds"]
+        for entry in other.slowest:
+            if len(self.slowest)<self.keep_slowest:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def to_dict(self):
+        labels = sorted(self.buckets, key=lambda label: int(label.split("-")[0].lstrip(">")))
+        histogram = []
+        for label in labels:
+            bucket = self.buckets[label]
+            histogram.append({"tokens": label, "sentences": bucket["sentences"], "seconds": bucket["seconds"],
+                              "ms_per_sentence": 1000*bucket["seconds"]/bucket["sentences"]})
+        slowest = [{"ms_per_sentence": 1000*per_sentence, "batch_size": size, "max_tokens": length, "longest_sentence": sentence}
+                   for per_sentence, size, length, sentence in sorted(self.slowest, reverse=True)]
+        return {"batches": self.batches, "seconds": self.seconds, "histogram": histogram, "slowest_batches": slowest}
+
+class Stage:
+    def __init__(self, name, upstream=None, total=None):
+        self.name = name
+        self.upstream = upstream
+        self.total = total
+        self.rows = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.start = None
+
+    def exclusive(self, attribute):
+        value = getattr(self, attribute)
+        if self.upstream!=None:
+            value -= getattr(self.upstream, attribute)
+        return max(value, 0.0)
+
+    def to_dict(self):
+        return {
+            "rows_in": self.upstream.rows if self.upstream!=None else None,
+            "rows_out": self.rows,
+            "wall_seconds": self.wall,
+            "cpu_seconds": self.cpu,
+            "exclusive_wall_seconds": self.exclusive("wall"),
+            "exclusive_cpu_seconds": self.exclusive("cpu"),
+            "rows_per_second": self.rows/self.wall if self.wall>0 else None,
+        }
+
+class Instrumentation:
+    ''' Collects the metrics of a pipeline run
+
+    :param interval: The number of seconds between two progress lines (None for no progress)
+    :param profile: None, 'cprofile' or 'torch'
+    :param profile_start: The profiler starts after this number of input rows
+    :param profile_rows: And records this number of input rows
+    :param profile_file: Where the profile is written (.prof for cProfile, a chrome trace .json for torch)
+    '''
+
+    def __init__(self, interval=30, profile=None, profile_start=1000, profile_rows=1000, profile_file=None):
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.stages = {}
+        self.interval = interval
+        self.next_report = self.start + interval if interval!=None else None
+        self.inference = InferenceTimer()
+        self.counters = {}
+        self.profile = profile
+        self.profile_start = profile_start
+        self.profile_rows = profile_rows
+        self.profile_file = profile_file
+        self.profiler = None
+        self.profiled = False
+
+    def track(self, name, rows, upstream=None, total=None):
+        ''' Return a generator of the rows produced by a stage, that measures the time spent to produce them
+
+        :param name: The name of the stage
+        :param rows: The rows produced by the stage
+        :param upstream: The name of the tracked stage whose rows this stage consumes, if it's in the same chain of generators
+        :param total: The expected number of rows (for the estimated remaining time)
+        '''
+
+        # The stage is registered right away (and not when the rows are first requested), so that the stages
+        # after it find their upstream
+        stage = Stage(name, self.stages.get(upstream), total)
+        self.stages[name] = stage
+        return self.timed_rows(stage, rows)
+
+    def timed_rows(self, stage, rows):
+        iterator = iter(rows)
+        while True:
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            if stage.start==None:
+                stage.start = wall
+            try:
+                row = next(iterator)
+            except StopIteration:
+                stage.wall += time.perf_counter() - wall
+                stage.cpu += time.process_time() - cpu
+                break
+            stage.wall += time.perf_counter() - wall
+            stage.cpu += time.process_time() - cpu
+            stage.rows += 1
+            if stage.upstream==None and self.profile!=None:
+                self.update_profiler(stage.rows)
+            if self.next_report!=None and time.perf_counter()>=self.next_report:
+                self.print_progress()
+            yield row
+        self.stop_profiler()
+
+    def measure(self, name, function, upstream=None):
+        ''' Run function() as a stage that consumes the rows of upstream (e.g. writing a file) and return its result
+
+        If the result is a number, it's taken as the number of rows of the stage.
+        '''
+
+        stage = Stage(name, self.stages.get(upstream))
+        self.stages[name] = stage
+        stage.start = time.perf_counter()
+        cpu = time.process_time()
+        result = function()
+        stage.wall = time.perf_counter() - stage.start
+        stage.cpu = time.process_time() - cpu
+        if isinstance(result, int):
+            stage.rows = result
+        return result
+
+    def count(self, name, value):
+        # Extra numbers of the run (e.g. cache hits), written with the metrics
+        self.counters[name] = value
+
+    def print_progress(self):
+        now = time.perf_counter()
+        self.next_report = now + self.interval
+        parts = []
+        for stage in self.stages.values():
+            part = stage.name + ": " + str(stage.rows)
+            if stage.total!=None and stage.rows>0 and stage.start!=None:
+                rate = stage.rows/(now-stage.start)
+                part += "/" + str(stage.total) + " (" + str(round(100*stage.rows/max(stage.total, 1), 1)) + "%, " + str(round(rate, 1)) + " rows/s, ETA " + format_duration(max(stage.total-stage.rows, 0)/rate) + ")"
+            parts.append(part)
+        print("[" + format_duration(now-self.start) + "] " + " | ".join(parts))
+
+    def update_profiler(self, rows):
+        if self.profiler==None and not self.profiled and rows>=self.profile_start:
+            if self.profile=='torch':
+                import torch
+                self.profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+                self.profiler.start()
+            else:
+                import cProfile
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            print("Profiling input rows", rows, "to", rows+self.profile_rows)
+        elif self.profiler!=None and rows>=self.profile_start+self.profile_rows:
+            self.stop_profiler()
+
+    def stop_profiler(self):
+        if self.profiler==None:
+            return
+        if self.profile=='torch':
+            self.profiler.stop()
+            self.profiler.export_chrome_trace(self.profile_file)
+        else:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_file)
+        print("Profile written to", self.profile_file)
+        self.profiler = None
+        self.profiled = True
+
+    def to_dict(self):
+        return {
+            "wall_seconds": time.perf_counter() - self.start,
+            "cpu_seconds": time.process_time() - self.start_cpu,
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+            "inference": self.inference.to_dict(),
+            "counters": self.counters,
+        }
+
+    def write(self, filename, config=None):
+        ''' Write the metrics (and the configuration of the run) to a json file '''
+
+        metrics = self.to_dict()
+        if config!=None:
+            metrics["config"] = config
+        with open(filename, "w") as file_out:
+            json.dump(metrics, file_out, indent=2, default=str)
+        print("Metrics written to", filename)
+        return metrics
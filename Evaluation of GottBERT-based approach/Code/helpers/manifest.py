@@ -0,0 +1,135 @@
+import json
+import hashlib
+import sqlite3
+
+class Manifest:
+    ''' SQLite manifest of the input rows that have already been processed, for the incremental mode of the pipeline
+
+    The key of each input row is a hash of the configuration of the run and of the utterance (not its line number),
+    so an edited row gets a new key and is processed again, and the results of another configuration are never
+    reused. The value is the list of the final rows of the utterance (one per sentence). Every batch of results is
+    committed, so a run that crashes can be resumed. The configuration is also stored with every result, so that
+    prune only removes the old results of the configuration of the run and the others are kept.
+    '''
+
+    def __init__(self, filename, config_id):
+        self.config_id = config_id
+        self.rows = 0
+        self.known = 0
+        self.new = 0
+        self.removed = 0
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, rows TEXT NOT NULL, config_id TEXT)")
+        # The manifests written before the configuration was stored don't have its column yet
+        columns = [column[1] for column in self.connection.execute("PRAGMA table_info(results)")]
+        if "config_id" not in columns:
+            self.connection.execute("ALTER TABLE results ADD COLUMN config_id TEXT")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_config_id ON results (config_id)")
+        self.connection.commit()
+
+    def make_key(self, utterance):
+        return hashlib.sha256((self.config_id + "\n" + utterance).encode('utf-8')).hexdigest()
+
+    def find(self, keys):
+        ''' Return the set of the given keys that are in the manifest '''
+
+        found = set()
+        key_list = list(set(keys))
+        # Query in chunks, because SQLite limits the number of parameters of a statement
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start+500]
+            query = "SELECT key FROM results WHERE key IN (" + ",".join("?"*len(chunk)) + ")"
+            found.update(key for key, in self.connection.execute(query, chunk))
+        return found
+
+    def scan(self, rows, chunk_size=500):
+        ''' Read the input rows and return the keys of all of them (in order) and the new utterances {key: utterance} '''
+
+        keys = []
+        new = {}
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk)==chunk_size:
+                self.scan_chunk(chunk, keys, new)
+                chunk = []
+        if len(chunk)>0:
+            self.scan_chunk(chunk, keys, new)
+        self.rows = len(keys)
+        self.new = len(new)
+        self.known = sum(1 for key in keys if key not in new)
+        return keys, new
+
+    def scan_chunk(self, rows, keys, new):
+        chunk_keys = [self.make_key(row[0]) for row in rows]
+        found = self.find(chunk_keys)
+        for key, row in zip(chunk_keys, rows):
+            keys.append(key)
+            # An utterance that appears more than once is processed only once
+            if key not in found and key not in new:
+                new[key] = row[0]
+
+    def put_many(self, results):
+        ''' Store the results of a dictionary {key: rows} and commit them '''
+
+        entries = [(key, json.dumps(rows), self.config_id) for key, rows in results.items()]
+        self.connection.executemany("INSERT OR REPLACE INTO results (key, rows, config_id) VALUES (?, ?, ?)", entries)
+        self.connection.commit()
+
+    def put_rows(self, rows, owners, keys, batch_size=1000):
+        ''' Store the final rows of the new utterances and return the number of rows stored
+
+        :param rows: The final rows, in the order of the utterances
+        :param owners: A deque with the key of the utterance of each row, which is filled while the rows are produced
+        :param keys: The keys of all the new utterances (those without rows are stored with an empty list)
+        :param batch_size: The number of utterances that are committed together
+        '''
+
+        count = 0
+        pending = {}
+        for row in rows:
+            key = owners.popleft()
+            if key not in pending and len(pending)>=batch_size:
+                self.put_many(pending)
+                pending = {}
+            pending.setdefault(key, []).append(row)
+            count += 1
+        self.put_many(pending)
+        # The utterances without any sentence
+        stored = self.find(keys)
+        self.put_many({key: [] for key in keys if key not in stored})
+        return count
+
+    def get_rows(self, keys, chunk_size=500):
+        ''' Yield the stored rows of all the given keys, in their order '''
+
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start+chunk_size]
+            unique = list(set(chunk))
+            query = "SELECT key, rows FROM results WHERE key IN (" + ",".join("?"*len(unique)) + ")"
+            results = {key: json.loads(rows) for key, rows in self.connection.execute(query, unique)}
+            for key in chunk:
+                yield from results.get(key, [])
+
+    def prune(self, keys):
+        ''' Remove the results of this configuration whose rows are no longer in the input (e.g. edited rows) and return their number
+
+        The results of the other configurations are kept, so that switching back to them doesn't process everything again.
+        '''
+
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS current (key TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM current")
+        self.connection.executemany("INSERT OR IGNORE INTO current (key) VALUES (?)", ((key,) for key in keys))
+        # The results stored without their configuration (by an older version) belong to this one if they are in the input
+        self.connection.execute("UPDATE results SET config_id=? WHERE config_id IS NULL AND key IN (SELECT key FROM current)", (self.config_id,))
+        cursor = self.connection.execute("DELETE FROM results WHERE config_id=? AND key NOT IN (SELECT key FROM current)", (self.config_id,))
+        self.removed = cursor.rowcount
+        self.connection.commit()
+        return self.removed
+
+    def report(self):
+        return ("Manifest: " + str(self.rows) + " input rows, " + str(self.known) + " already processed, "
+                + str(self.new) + " new or changed utterances processed, " + str(self.removed) + " old results removed")
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,101 @@
+import os
+import json
+import numpy as np
+from .predictions import make_batches
+from .probability_store import DTYPE, get_metadata_filename
+
+''' Cached encoder states at the <mask> of every sentence
+
+    The question/EOS decision of the pipeline only uses the five best tokens (or the punctuation probabilities)
+    that the language model head computes from the final hidden state at the <mask>. That hidden state itself
+    (768 values for GottBERT) holds much more, and a small classifier can be trained on it (see
+    helpers.logistic_head). The encoder is run once over the masked sentences of a results file, and the hidden
+    states are written as one float16 row per result row to a raw binary file, with the same layout as the
+    probability store: the shape and the source of the hidden states (the model, the backend and the context
+    window) go to a json file next to it, and the file is loaded as a memory-mapped NumPy array. Training and
+    classifying then never need the model again. Hidden states of another source are not comparable (e.g. a
+    head trained on them is meaningless for the model at hand), so get_mismatch tells when they are stale.
+
+    A million sentences take 1.5 GB.
+'''
+
+def get_source(model, backend, left_context, right_context):
+    ''' Return what the hidden states depend on: the model, the backend and the context window '''
+
+    return {"model": model, "backend": backend, "left_context": left_context, "right_context": right_context}
+
+def get_mismatch(metadata, source):
+    ''' Return a description of how the source in metadata differs from source, or None if they are the same '''
+
+    stored = metadata.get("source")
+    if stored==None:
+        return "the source is unknown"
+    differences = [key + " " + json.dumps(stored.get(key)) + " instead of " + json.dumps(value) for key, value in source.items() if stored.get(key)!=value]
+    if len(differences)==0:
+        return None
+    return ", ".join(differences)
+
+def extract_embeddings(filename, sentences, model, tokenizer, context=None, max_tokens=4096, window_rows=8192, source=None):
+    ''' Run the encoder on the masked sentences and write their hidden state at the <mask> to filename
+
+    :param filename: The binary file (the metadata goes to a json file with the same name)
+    :param sentences: Iterable with the masked sentences, in the order of the result rows
+    :param model: The PyTorch masked language model (with its base_model)
+    :param tokenizer: The tokenizer of the model
+    :param context: The ContextWindow that cuts long sentences (None to keep them as they are)
+    :param max_tokens: The maximum number of tokens of a batch
+    :param window_rows: The number of rows read at once. The sentences are deduplicated and sorted by length within a window
+    :param source: The dict from get_source that describes how the hidden states were computed
+
+    Returns the number of rows written
+    '''
+
+    from .punctuation_scoring import mask_hidden_states
+    rows = 0
+    unique_sentences = 0
+    file_out = open(filename, 'wb')
+
+    def write_window(window):
+        unique = list(dict.fromkeys(window))
+        inputs = context.apply(unique) if context!=None else unique
+        states = np.empty((len(unique), model.config.hidden_size), dtype=DTYPE)
+        lengths = [len(ids) for ids in tokenizer(inputs, add_special_tokens=False)["input_ids"]]
+        for batch in make_batches(lengths, max_tokens):
+            states[batch] = mask_hidden_states(model, tokenizer, [inputs[index] for index in batch]).numpy()
+        positions = {sentence: index for index, sentence in enumerate(unique)}
+        file_out.write(states[[positions[sentence] for sentence in window]].tobytes())
+        return len(unique)
+
+    window = []
+    for sentence in sentences:
+        window.append(sentence)
+        if len(window)==window_rows:
+            unique_sentences += write_window(window)
+            rows += len(window)
+            window = []
+    if len(window)>0:
+        unique_sentences += write_window(window)
+        rows += len(window)
+    file_out.close()
+
+    metadata = {
+        "dtype": np.dtype(DTYPE).name,
+        "rows": rows,
+        "dimensions": model.config.hidden_size,
+        "source": source,
+    }
+    with open(get_metadata_filename(filename), 'w', encoding='utf-8') as file_out:
+        json.dump(metadata, file_out, indent=2, ensure_ascii=False)
+    print("Hidden states of", rows, "sentences (" + str(unique_sentences) + " computed) written to", filename,
+          "(" + str(round(os.path.getsize(filename)/(1024*1024), 1)) + " MB)")
+    return rows
+
+def load_embeddings(filename):
+    ''' Return the hidden states as a read-only memory-mapped (rows x dimensions) float16 array, and their metadata '''
+
+    with open(get_metadata_filename(filename), encoding='utf-8') as file_in:
+        metadata = json.load(file_in)
+    if metadata["rows"]==0:
+        return np.empty((0, metadata["dimensions"]), dtype=metadata["dtype"]), metadata
+    embeddings = np.memmap(filename, dtype=metadata["dtype"], mode='r', shape=(metadata["rows"], metadata["dimensions"]))
+    return embeddings, metadata
@@ -0,0 +1,91 @@
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+''' Stand-ins for the external resources of the pipeline, so that it can run (e.g. for benchmarks) without network
+
+    - save_tiny_model: trains a small byte-level BPE tokenizer on some utterances and saves it together with
+      a randomly initialized RoBERTa model with the same interface as GottBERT. Its predictions are meaningless,
+      but it goes through exactly the same code (and is much faster).
+    - StubAnalyzer: a local HTTP server with the same analyze-text endpoint (and JSON format) as the
+      qcg-sentence-analyzer. It only looks for question words and answers without any parsing.
+'''
+
+SPECIAL_TOKENS = ["<s>", "<pad>", "</s>", "<unk>", "<mask>"]
+
+def save_tiny_model(directory, texts, vocab_size=1000, hidden_size=64, layers=2, seed=0):
+    ''' Create a tiny RoBERTa fill-mask model with a tokenizer trained on texts and save both in directory
+
+    The directory can then be used as the model name of the pipeline. If it already exists, it's kept as it is.
+    '''
+
+    if os.path.isdir(directory):
+        return directory
+    import torch
+    from tokenizers import ByteLevelBPETokenizer
+    from tokenizers.processors import RobertaProcessing
+    from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaForMaskedLM
+
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(texts, vocab_size=vocab_size, special_tokens=SPECIAL_TOKENS)
+    bpe._tokenizer.post_processor = RobertaProcessing(("</s>", bpe.token_to_id("</s>")), ("<s>", bpe.token_to_id("<s>")))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe._tokenizer, bos_token="<s>", eos_token="</s>", unk_token="<unk>",
+                                        pad_token="<pad>", mask_token="<mask>", cls_token="<s>", sep_token="</s>", model_max_length=512)
+
+    torch.manual_seed(seed)
+    config = RobertaConfig(vocab_size=len(tokenizer), hidden_size=hidden_size, num_hidden_layers=layers, num_attention_heads=2,
+                           intermediate_size=2*hidden_size, max_position_embeddings=514, pad_token_id=tokenizer.pad_token_id,
+                           bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id)
+    model = RobertaForMaskedLM(config).eval()
+
+    model.save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    return directory
+
+# Question words of the German analyzer that are checked by the stub (as substrings of the lowercased text, like the analyzer)
+STUB_QUESTION_WORDS = ["wer", "wie", "was", "wann", "wo", "warum", "wieso", "weshalb", "welche", "woher", "wohin"]
+
+def stub_analysis(text):
+    words = [word for word in STUB_QUESTION_WORDS if word in text.lower()]
+    return {
+        "text": text,
+        "containsQuestionWords": len(words)>0,
+        "questionWords": words if len(words)>0 else None,
+        "containsQuestionSyntax": False,
+        "questionPhrases": None,
+    }
+
+class StubAnalyzerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are sent separately, which would wait for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        text = parse_qs(urlparse(self.path).query).get("text", [""])[0]
+        body = json.dumps([stub_analysis(text)]).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubAnalyzer:
+    ''' A local sentence analyzer running in a background thread. url is its analyze-text endpoint
+
+    :param port: The port of the server (default: any free port)
+    '''
+
+    def __init__(self, port=0):
+        self.server = ThreadingHTTPServer(("localhost", port), StubAnalyzerHandler)
+        self.url = "http://localhost:" + str(self.server.server_address[1]) + "/api/analyze-text"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,94 @@
+import os
+import time
+import multiprocessing
+from .predictions import run_batches
+from .instrumentation import InferenceTimer
+
+''' Inference sharded across several worker processes
+
+    Every worker loads its own model once (with load_function(load_args)) and limits the number of threads
+    that PyTorch uses, so that the workers don't oversubscribe the cores. A ParallelPredictor can be used
+    in place of the fill-mask pipeline in predict_batch: the sentences of each window that aren't found in the
+    cache are split into one shard per worker, the shards are predicted by the workers and the results are merged
+    back in the original order. A shard waits for the other shards of its window before it starts, so no worker can
+    take two of them: each worker predicts exactly one shard of every window.
+'''
+
+# The model of the current worker process
+worker_predictor = None
+# The barrier that the shards of a window wait at, shared by the workers
+worker_barrier = None
+
+def init_worker(load_function, load_args, threads, barrier):
+    global worker_predictor, worker_barrier
+    import torch
+    torch.set_num_threads(threads)
+    worker_predictor = load_function(load_args)
+    worker_barrier = barrier
+
+def predict_shard(task):
+    sentences, max_tokens, timed = task
+    # A worker waits here until every worker has a shard of the window
+    worker_barrier.wait()
+    # The batches are timed in the worker, and its timer is sent back to be merged
+    timer = InferenceTimer() if timed else None
+    # The counters of the predictor (e.g. of an UtterancePredictor) are sent back as the increase during the shard
+    before = worker_predictor.to_dict() if hasattr(worker_predictor, "to_dict") else None
+    start = time.time()
+    if hasattr(worker_predictor, "predict_rows"):
+        rows = worker_predictor.predict_rows(sentences, max_tokens, timer)
+    else:
+        rows = run_batches(worker_predictor, sentences, max_tokens, timer)
+    seconds = time.time() - start
+    counts = {key: value - before[key] for key, value in worker_predictor.to_dict().items()} if before!=None else None
+    return rows, os.getpid(), seconds, timer, counts
+
+class ParallelPredictor:
+    ''' Predicts the sentences with a pool of worker processes, each one with its own model
+
+    :param load_function: A (module-level) function that returns the predictor of a worker
+    :param load_args: The argument of load_function
+    :param workers: The number of worker processes
+    :param threads_per_worker: The number of threads of PyTorch in each worker (default: cores / workers)
+    '''
+
+    def __init__(self, load_function, load_args, workers=2, threads_per_worker=None):
+        if threads_per_worker==None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(load_function, load_args, threads_per_worker, multiprocessing.Barrier(workers)))
+        # Number of sentences and seconds spent on inference by each worker (by process id)
+        self.stats = {}
+        # The counters of the predictors of the workers, summed (None if they have none)
+        self.counts = None
+
+    def predict_rows(self, sentences, max_tokens, timer=None):
+        if len(sentences)==0:
+            return []
+        # Split the sentences into one contiguous shard per worker (the last ones may be empty, as every worker has
+        # to take one for the barrier). map returns the results in the order of the shards
+        shard_size = (len(sentences) + self.workers - 1) // self.workers
+        tasks = [(sentences[i*shard_size:(i+1)*shard_size], max_tokens, timer!=None) for i in range(self.workers)]
+        rows = []
+        # chunksize=1, so that the pool hands the shards out one by one
+        for (shard, _, _), (shard_rows, pid, seconds, shard_timer, counts) in zip(tasks, self.pool.map(predict_shard, tasks, chunksize=1)):
+            rows += shard_rows
+            if timer!=None:
+                timer.merge(shard_timer)
+            if counts!=None:
+                self.counts = {key: (self.counts or {}).get(key, 0) + value for key, value in counts.items()}
+            count, total_seconds = self.stats.get(pid, (0, 0.0))
+            self.stats[pid] = (count + len(shard), total_seconds + seconds)
+        return rows
+
+    def report(self):
+        lines = []
+        for pid, (count, seconds) in sorted(self.stats.items()):
+            throughput = count/seconds if seconds>0 else 0.0
+            lines.append("Worker " + str(pid) + ": " + str(count) + " sentences in " + str(round(seconds, 2)) + " s (" + str(round(throughput, 2)) + " sentences/s, " + str(self.threads_per_worker) + " threads)")
+        return "\n".join(lines)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
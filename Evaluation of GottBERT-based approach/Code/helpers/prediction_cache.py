@@ -0,0 +1,51 @@
+import json
+import hashlib
+import sqlite3
+
+class PredictionCache:
+    ''' Disk-backed cache (SQLite) of the predictions of the model
+
+    The key of each entry is a hash of the model id and the masked sentence, and the value is the list of
+    the (up to five) predictions and their scores, as returned by predict. Every call of put_many is committed,
+    so a run that crashes can be resumed and only pays for the sentences that haven't been seen before.
+    '''
+
+    def __init__(self, filename, model_id):
+        self.model_id = model_id
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, predictions TEXT NOT NULL)")
+        self.connection.commit()
+
+    def make_key(self, sentence):
+        return hashlib.sha256((self.model_id + "\n" + sentence).encode('utf-8')).hexdigest()
+
+    def get_many(self, sentences):
+        ''' Return a dictionary with the cached predictions of the given sentences (missing sentences are left out) '''
+
+        keys = {}
+        for sentence in sentences:
+            keys[self.make_key(sentence)] = sentence
+        found = {}
+        key_list = list(keys.keys())
+        # Query in chunks, because SQLite limits the number of parameters of a statement
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start+500]
+            query = "SELECT key, predictions FROM predictions WHERE key IN (" + ",".join("?"*len(chunk)) + ")"
+            for key, predictions in self.connection.execute(query, chunk):
+                found[keys[key]] = json.loads(predictions)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+
+        return found
+
+    def put_many(self, predictions):
+        ''' Store the predictions of a dictionary {sentence: predictions} and commit them '''
+
+        entries = [(self.make_key(sentence), json.dumps(prediction)) for sentence, prediction in predictions.items()]
+        self.connection.executemany("INSERT OR REPLACE INTO predictions (key, predictions) VALUES (?, ?)", entries)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,86 @@
+import os
+import json
+import numpy as np
+
+''' Compact store of the probabilities of all the punctuation candidates of every sentence
+
+    The prediction rows keep only the five best candidates as text. With --scoring punctuation, the whole
+    probability vector over the candidates can also be stored: one float16 row per sentence, in a raw binary file
+    whose row i belongs to the row i of the results table (rows that the model didn't predict, e.g. decided by the
+    cascade, are NaN). The shape, the candidates and their simplified labels are written to a json file next to it.
+    The file is loaded as a memory-mapped NumPy array, so the scores can be read without copying them, e.g. to
+    simplify the predictions with other rules, to calibrate the scores or to combine models.
+
+    A million sentences with 30 candidates take 60 MB.
+'''
+
+DTYPE = np.float16
+
+def get_metadata_filename(filename):
+    return os.path.splitext(filename)[0] + '.json'
+
+class ProbabilityWriter:
+    ''' Writes the probability vectors, in the order of the rows, to a raw float16 file
+
+    :param filename: The binary file (the metadata goes to a json file with the same name)
+    :param candidates: The punctuation candidates, i.e. the columns
+    :param labels: The simplified label of each candidate ('question', 'EOS' or 'other')
+    :param model_id: The model (and backend) that computed the probabilities
+    :param buffer_rows: The number of rows written to the file at once
+    '''
+
+    def __init__(self, filename, candidates, labels, model_id=None, buffer_rows=65536):
+        self.filename = filename
+        self.candidates = candidates
+        self.labels = labels
+        self.model_id = model_id
+        self.buffer = np.empty((buffer_rows, len(candidates)), dtype=DTYPE)
+        self.buffered = 0
+        self.rows = 0
+        self.file_out = open(filename, 'wb')
+
+    def add(self, probabilities):
+        # A row without probabilities is stored as NaN, so that the rows stay aligned with the results
+        if isinstance(probabilities, (list, tuple)) and len(probabilities)==len(self.candidates):
+            self.buffer[self.buffered] = probabilities
+        else:
+            self.buffer[self.buffered] = np.nan
+        self.buffered += 1
+        self.rows += 1
+        if self.buffered==len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file_out.write(self.buffer[:self.buffered].tobytes())
+        self.buffered = 0
+
+    def strip_rows(self, rows, index):
+        ''' Yield the rows without the probability vector at the given position, while writing the vectors '''
+
+        for row in rows:
+            self.add(row[index])
+            yield row[:index] + row[index+1:]
+
+    def close(self):
+        self.flush()
+        self.file_out.close()
+        metadata = {
+            "dtype": np.dtype(DTYPE).name,
+            "rows": self.rows,
+            "candidates": self.candidates,
+            "labels": self.labels,
+            "model": self.model_id,
+        }
+        with open(get_metadata_filename(self.filename), 'w', encoding='utf-8') as file_out:
+            json.dump(metadata, file_out, indent=2, ensure_ascii=False)
+        print("Probabilities of", self.rows, "sentences written to", self.filename, "(" + str(round(os.path.getsize(self.filename)/(1024*1024), 1)) + " MB)")
+
+def load_probabilities(filename):
+    ''' Return the probabilities as a read-only memory-mapped (rows x candidates) float16 array, and their metadata '''
+
+    with open(get_metadata_filename(filename), encoding='utf-8') as file_in:
+        metadata = json.load(file_in)
+    if metadata["rows"]==0:
+        return np.empty((0, len(metadata["candidates"])), dtype=metadata["dtype"]), metadata
+    probabilities = np.memmap(filename, dtype=metadata["dtype"], mode='r', shape=(metadata["rows"], len(metadata["candidates"])))
+    return probabilities, metadata
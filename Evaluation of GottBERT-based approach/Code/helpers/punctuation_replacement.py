@@ -62,6 +62,12 @@ def remove_punctuation(sentence):
 
     return masked_sentence, gt, gt_simple
 
+def mask_sentences(sentences):
+    ''' Yield a row [masked sentence, punctuation, simple punctuation] for each sentence '''
+
+    for sentence in sentences:
+        yield list(remove_punctuation(sentence))
+
 if __name__=='__main__':
     filename_in = os.path.join(os.path.abspath(os.path.join('..', '..')), "Data", "Dortmund_all_segmentedUtterances")
     filename_out = filename_in[:-4]+'_masked.csv'
@@ -0,0 +1,155 @@
+import re
+import time
+import torch
+from .predictions import make_batches, format_predictions
+from .simplify_predictions import simplify_pred
+from .csv_io import SCORE_COLUMNS
+
+# A token is a punctuation candidate if (without the surrounding spaces) it consists only of these symbols,
+# or if it is the end of sentence token
+PUNCTUATION_TOKEN = re.compile(r'[.?!…]+')
+
+def punctuation_candidates(tokenizer):
+    ''' Return the ids and the strings of the punctuation candidates of the vocabulary of the tokenizer '''
+
+    candidate_ids = []
+    candidates = []
+    for token_id in range(len(tokenizer)):
+        token_str = tokenizer.decode([token_id])
+        if PUNCTUATION_TOKEN.fullmatch(token_str.strip())!=None or token_str.strip()==tokenizer.eos_token:
+            candidate_ids.append(token_id)
+            candidates.append(token_str)
+    return candidate_ids, candidates
+
+def encode_masked(tokenizer, sentences):
+    ''' Return the padded inputs of the sentences, making sure that the <mask> of every sentence is kept
+
+    The sentences are truncated to the maximum length of the model, which can cut off the <mask> of a long
+    sentence. Those sentences are cut around their <mask> instead (see ContextWindow). A sentence without a
+    <mask> raises a ValueError, because there would be nothing to score.
+    '''
+
+    inputs = tokenizer(sentences, padding=True, truncation=True, return_tensors='pt')
+    lost = (inputs["input_ids"]==tokenizer.mask_token_id).any(dim=1).logical_not().nonzero().flatten().tolist()
+    if len(lost)==0:
+        return inputs
+    for index in lost:
+        if tokenizer.mask_token not in sentences[index]:
+            raise ValueError("The sentence has no " + tokenizer.mask_token + ": " + repr(sentences[index][:100]))
+    from .context_window import ContextWindow
+    length = min(tokenizer.model_max_length, 512) - tokenizer.num_special_tokens_to_add()
+    context = ContextWindow(tokenizer, (length-1)//2, length-1-(length-1)//2)
+    sentences = list(sentences)
+    for index, sentence in zip(lost, context.apply([sentences[index] for index in lost])):
+        sentences[index] = sentence
+    inputs = tokenizer(sentences, padding=True, truncation=True, return_tensors='pt')
+    if not (inputs["input_ids"]==tokenizer.mask_token_id).any(dim=1).all():
+        raise ValueError("The <mask> of a sentence doesn't fit into the " + str(length) + " tokens of the model")
+    return inputs
+
+def mask_hidden_states(model, tokenizer, sentences):
+    ''' Return the final hidden state of the encoder at the (first) <mask> position of each sentence '''
+
+    inputs = encode_masked(tokenizer, sentences)
+    with torch.no_grad():
+        hidden = model.base_model(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).last_hidden_state
+    mask_positions = (inputs["input_ids"]==tokenizer.mask_token_id).int().argmax(dim=1)
+    return hidden[torch.arange(len(sentences)), mask_positions]
+
+class PunctuationScorer:
+    ''' Scores only the punctuation tokens at the <mask> position, instead of the whole vocabulary
+
+    The encoder runs as usual, but the output projection of the LM head is computed only for the rows
+    of the punctuation candidates (e.g. '.', '?', '!', '...', '?!', '</s>'), which skips the biggest
+    matrix multiplication of the head. The scores are normalized over the candidates.
+
+    It can be used in place of the fill-mask pipeline in predict_batch: each prediction row contains the
+    (up to five) best candidates with their scores, followed by P(question) and P(EOS), the sum of the
+    probabilities of the candidates that simplify_pred converts to 'question' and 'EOS' respectively.
+    With keep_probabilities, the whole probability vector over the candidates is added at the end of each row
+    (for a ProbabilityWriter). It needs a PyTorch RoBERTa model (like GottBERT), whose LM head it computes itself.
+    '''
+
+    def __init__(self, model, tokenizer, keep_probabilities=False):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.keep_probabilities = keep_probabilities
+        self.model.eval()
+
+        self.candidate_ids, self.candidates = punctuation_candidates(tokenizer)
+        labels = [simplify_pred(token_str) for token_str in self.candidates]
+        self.question = torch.tensor([label=='question' for label in labels])
+        self.eos = torch.tensor([label=='EOS' for label in labels])
+
+        # The LM head is computed here step by step, as in RoBERTa models (like GottBERT)
+        lm_head = getattr(model, "lm_head", None)
+        if lm_head==None or not all(hasattr(lm_head, name) for name in ("dense", "layer_norm", "bias")):
+            raise ValueError("The punctuation scoring needs the LM head of a RoBERTa model (dense, layer_norm and bias), but " +
+                             type(model).__name__ + " has none. Please use --scoring topk")
+
+        # Keep only the rows of the output projection that correspond to the candidates
+        decoder = model.get_output_embeddings()
+        weight = decoder.weight
+        if callable(weight):
+            # dynamically quantized linear layer (int8 backend)
+            weight = weight().dequantize()
+        ids = torch.tensor(self.candidate_ids)
+        self.weight = weight[ids].detach()
+        self.bias = lm_head.bias[ids].detach()
+
+    def mask_hidden_states(self, sentences):
+        ''' Return the final hidden state of the encoder at the <mask> position of each sentence '''
+
+        return mask_hidden_states(self.model, self.tokenizer, sentences)
+
+    def candidate_probabilities(self, hidden):
+        # The LM head, restricted to the candidates
+        lm_head = self.model.lm_head
+        with torch.no_grad():
+            features = lm_head.layer_norm(torch.nn.functional.gelu(lm_head.dense(hidden)))
+            logits = features @ self.weight.T + self.bias
+        return torch.softmax(logits, dim=-1)
+
+    def score(self, sentences):
+        ''' Return a (sentences x candidates) tensor with the probabilities of the candidates '''
+
+        return self.candidate_probabilities(self.mask_hidden_states(sentences))
+
+    def score_masks(self, texts):
+        ''' Return, for each text, a (masks x candidates) tensor with the probabilities of the candidates at every <mask> of it '''
+
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors='pt')
+        with torch.no_grad():
+            hidden = self.model.base_model(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).last_hidden_state
+        is_mask = inputs["input_ids"]==self.tokenizer.mask_token_id
+        # The masks of all the texts, in the order of the texts and of their positions
+        probabilities = self.candidate_probabilities(hidden[is_mask])
+        return torch.split(probabilities, is_mask.sum(dim=1).tolist())
+
+    def format_scores(self, probabilities):
+        # The five best candidates in the format of the fill-mask pipeline, followed by P(question) and P(EOS)
+        best = torch.argsort(probabilities, descending=True)[:5]
+        result = [{"token_str": self.candidates[index], "score": probabilities[index].item()} for index in best]
+        p_question = probabilities[self.question].sum().item()
+        p_eos = probabilities[self.eos].sum().item()
+        row = format_predictions(result) + [p_question, p_eos]
+        if self.keep_probabilities:
+            row.append(probabilities.tolist())
+        return row
+
+    def predict_rows(self, sentences, max_tokens, timer=None):
+        ''' Return the prediction rows of the sentences, running the model on batches of similar length '''
+
+        if len(sentences)==0:
+            return []
+        lengths = [len(ids) for ids in self.tokenizer(sentences)["input_ids"]]
+        rows = [None] * len(sentences)
+        for batch in make_batches(lengths, max_tokens):
+            start = time.perf_counter()
+            probabilities = self.score([sentences[index] for index in batch])
+            if timer!=None:
+                timer.record([lengths[index] for index in batch], time.perf_counter() - start, [sentences[index] for index in batch])
+            for index, sentence_probabilities in zip(batch, probabilities):
+                rows[index] = self.format_scores(sentence_probabilities)
+
+        return rows
@@ -1,6 +1,6 @@
 import os
 import csv
-from spacy.lang.de import German
+import re
 
 def segment_utterance(sentence, model):
     sentences = []
@@ -9,7 +9,42 @@ def segment_utterance(sentence, model):
     
     return sentences
 
+# Matches any alphanumeric character (\w without the underscore, equivalent to str.isalnum)
+ALPHANUMERIC = re.compile(r'[^\W_]')
+
+def filter_sentences(texts):
+    # Drop the sentences that have only non-alphanumeric characters, as well as the ':D' emoticon
+    return [text for text in texts if len(text)!=0 and text!=':D' and ALPHANUMERIC.search(text)!=None]
+
+def segment_utterances(utterances, model, batch_size=1000, n_process=1):
+    ''' Segment many utterances by streaming them through model.pipe
+
+    For each utterance, yield the list of its sentences that contain alphanumeric characters.
+    The output has the same order as the input, also when n_process>1.
+
+    :param utterances: Iterable with the utterances (strings)
+    :param model: The segmentation model
+    :param batch_size: The number of utterances that spaCy processes together
+    :param n_process: The number of processes used by spaCy
+    '''
+
+    for doc in model.pipe(utterances, batch_size=batch_size, n_process=n_process):
+        yield filter_sentences([sent.text for sent in doc.sents])
+
+def segment_rows(rows, model, batch_size=1000, n_process=1, numbered=False):
+    ''' Yield the sentences of the utterances found in the first column of the given csv rows
+
+    With numbered, each row also has the position of the sentence in its utterance (starting from 0),
+    so that the sentences can be grouped back into their utterances '''
+
+    utterances = (row[0] for row in rows if len(row)!=0)
+    for sentences in segment_utterances(utterances, model, batch_size, n_process):
+        for position, sentence in enumerate(sentences):
+            yield [sentence, position] if numbered else [sentence]
+
 if __name__=='__main__':
+    from spacy.lang.de import German
+
     # Initialize segmentation model
     model = German()  # just the language with no pipeline
     config = {"punct_chars": ['.', '!', '?', '..', '...', '....', '.....']} # add custom sentence boundaries
@@ -27,18 +62,9 @@ if __name__=='__main__':
     csv_writer = csv.writer(csv_file_out, delimiter=',')
     csv_writer.writerow(["Utterance"])
 
-    for i, row in enumerate(csv_reader):
-        if i>0:
-            sentences = segment_utterance(row[0], model)
-            for sent in sentences:
-                # check if the sentence has only non-alphanumeric characters. If so, don't write it in the output file
-                flag = 0
-                for letter in sent.text:
-                    if letter.isalnum():
-                        flag = 1
-                        break
-                if flag==1 and sent.text!=':D' and len(sent.text)!=0:
-                    csv_writer.writerow([sent.text])
+    rows = (row for i, row in enumerate(csv_reader) if i>0)
+    for sentence_row in segment_rows(rows, model):
+        csv_writer.writerow(sentence_row)
 
     csv_file_in.close()
     csv_file_out.close()
@@ -1,7 +1,8 @@
 import os
 import csv
 import re
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 look_up_table = {
     '.': 'EOS',
@@ -59,17 +60,76 @@ def simplify_pred(pred1, pred2=None):
 
     return new_pred
 
-def check_sentence_syntax(sentence, simplified_pred, pred2):
+# The endpoint of the qcg-sentence-analyzer that finds question words and question syntax in a text
+ANALYZER_URL = "http://localhost:11111/api/analyze-text"
+
+class SyntaxChecker:
+    ''' Client of the sentence analyzer
+
+    All the calls go through one session with a pool of keep-alive connections, and analyze_many sends
+    the requests of many sentences concurrently (up to max_workers at a time), so that the latency
+    of the network overlaps instead of adding up. Every request has a timeout.
+    '''
+
+    def __init__(self, url=ANALYZER_URL, max_workers=8, timeout=10):
+        # Imported here, so that the simplification without the sentence analyzer doesn't need it
+        import requests
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.requests = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def analyze(self, sentence):
+        ''' Return the analysis of the (first sentence of the) text, or None if the call failed '''
+
+        response = None
+        try:
+            response = self.session.get(self.url, params={"text": sentence}, timeout=self.timeout)
+            return response.json()[0]
+        except Exception as e:
+            if response!=None:
+                print("Exception because of the following response: ", response.text)
+            else:
+                print("Exception while calling the sentence analyzer: ", e)
+            return None
+
+    def analyze_many(self, sentences):
+        ''' Analyze many sentences concurrently. The results are in the order of the sentences '''
+
+        start = time.perf_counter()
+        analyses = list(self.executor.map(self.analyze, sentences))
+        self.seconds += time.perf_counter() - start
+        self.requests += len(sentences)
+        self.failures += sum(1 for analysis in analyses if analysis==None)
+        return analyses
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
 
-    parameters = {"text": sentence}
+default_checker = None
 
-    try:
-        response = requests.get("http://localhost:11111/api/analyze-text", params=parameters)
-        containsQuestionWords = response.json()[0]["containsQuestionWords"]
-        containsQuestionSyntax = response.json()[0]["containsQuestionSyntax"]
-    except Exception as e:
-        print("Exception because of the following response: ", response.text)
+def get_default_checker():
+    global default_checker
+    if default_checker==None:
+        default_checker = SyntaxChecker()
+    return default_checker
+
+def needs_syntax_check(simplified_pred, pred2):
+    # The syntax can only change the label of a sentence predicted as 'EOS' whose second prediction is a 'question'
+    return simplified_pred=='EOS' and simplify_pred(pred2)=='question'
+
+def apply_syntax(simplified_pred, pred2, analysis):
+    if analysis==None:
         return simplified_pred, "False", "False"
+    containsQuestionWords = analysis["containsQuestionWords"]
+    containsQuestionSyntax = analysis["containsQuestionSyntax"]
 
     new_simplified_pred = simplified_pred
     simplified_pred2 = simplify_pred(pred2)
@@ -78,9 +138,67 @@ def check_sentence_syntax(sentence, simplified_pred, pred2):
 
     return new_simplified_pred, containsQuestionWords, containsQuestionSyntax
 
+def check_sentence_syntax(sentence, simplified_pred, pred2, checker=None):
+    if checker==None:
+        checker = get_default_checker()
+
+    return apply_syntax(simplified_pred, pred2, checker.analyze(sentence))
+
+# The value of the question words/syntax columns of the sentences that weren't sent to the sentence analyzer
+# (with --syntax-check needed), so that they can't be taken for sentences without question words or syntax
+NOT_CHECKED = "not checked"
+
 def tokenize_sent(sentence):
     return len(sentence.split())-1
 
+def simplify_row(row, analysis=None, checked=True):
+    ''' Extend a row of the predictions file with the simplified ground truth, predictions and syntax information
+
+    analysis is the result of the sentence analyzer for the sentence. If the sentence wasn't checked,
+    the columns about question words and question syntax are NOT_CHECKED (null in arrow/parquet results).
+    Any columns after the 13 columns of the predictions file (e.g. the scores of a PunctuationScorer) are kept at the end.
+    '''
+
+    gt_punct, pred1, pred2 = row[2], row[3], row[5]
+    simplified_gt = simplify_gt(gt_punct)
+    simplified_pred = simplify_pred(pred1, pred2)
+    if checked:
+        simplified_pred2, cqw, cqs = apply_syntax(simplified_pred, pred2, analysis)
+    else:
+        simplified_pred2, cqw, cqs = simplified_pred, NOT_CHECKED, NOT_CHECKED
+    tokens = tokenize_sent(row[0])
+    return row[:13] + [simplified_gt, simplified_pred, tokens, cqw, cqs, simplified_pred2] + row[13:]
+
+def simplify_chunk(rows, checker, check_all=False):
+    # Find the rows for which the syntax check can change the label (or all of them, if check_all)
+    to_check = []
+    for index, row in enumerate(rows):
+        if check_all or needs_syntax_check(simplify_pred(row[3], row[5]), row[5]):
+            to_check.append(index)
+    analyses = checker.analyze_many([rows[index][0] for index in to_check])
+    results = dict(zip(to_check, analyses))
+
+    return [simplify_row(row, results.get(index), index in results) for index, row in enumerate(rows)]
+
+def simplify_rows(rows, checker=None, check_all=True, chunk_size=256):
+    ''' Yield the simplified rows, in the order of the input
+
+    The rows are processed in chunks of chunk_size rows, so that the syntax checks of each chunk run concurrently.
+    By default the sentence analyzer is called for every row. With check_all=False it's called only for the rows where
+    its result can change the label, and the question words/syntax columns of the others are NOT_CHECKED.
+    '''
+
+    if checker==None:
+        checker = get_default_checker()
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk)==chunk_size:
+            yield from simplify_chunk(chunk, checker, check_all)
+            chunk = []
+    if len(chunk)>0:
+        yield from simplify_chunk(chunk, checker, check_all)
+
 if __name__=='__main__':
     filename_in = os.path.join(os.path.abspath(os.path.join('..', '..')), "Data", "Dortmund_all_segmentedUtterances_maskedPredictions_cleaned")
     filename_out = 'Dortmund_all_allPredictions'
@@ -94,16 +212,8 @@ if __name__=='__main__':
     csv_writer = csv.writer(csv_file_out, delimiter=',')
     csv_writer.writerow(["Utterance", "Punctuation", "Simple Punctuation", "Prominent Prediction", "Prominent Score", "Prediction 2", "Score 2", "Prediction 3", "Score 3", "Prediction 4", "Score 4", "Prediction 5", "Score 5", "GT Punctuation simplified", "Predicted Punctuation Simplified", "Num of Tokens", "Contains Question Words", "Contains Question Syntax", "New Predicted Punctuation Simplified"])
 
-    for i, row in enumerate(csv_reader):
-        if i>=1:
-            sentence, gt_punct, pred1, pred2 = row[0], row[2], row[3], row[5]
-            simplified_gt = simplify_gt(gt_punct)
-            simplified_pred = simplify_pred(pred1, pred2)
-            simplified_pred2, cqw, cqs = check_sentence_syntax(sentence, simplified_pred, pred2)
-            tokens = tokenize_sent(row[0])
-            new_row = row[:13] + [simplified_gt, simplified_pred, tokens, cqw, cqs, simplified_pred2]
-            csv_writer.writerow(new_row)
-        if i%100==0:
-            print("i=",i)
+    rows = (row for i, row in enumerate(csv_reader) if i>0)
+    for new_row in simplify_rows(rows):
+        csv_writer.writerow(new_row)
     csv_file_in.close()
     csv_file_out.close()
\ No newline at end of file
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from .predictions import make_batches, format_predictions, run_batches
+
+''' Pre-tokenized corpus, stored as memory-mapped token id arrays
+
+    The fill-mask pipeline (and the PunctuationScorer) tokenize every masked sentence again on every run, once to
+    sort the sentences by length and once more to run the model. The tokenization stage of the pipeline encodes the
+    unique masked sentences of the corpus once, in big batches with the fast tokenizer, and stores them as flat arrays:
+    the token ids (of all the sentences one after the other), the index of the first token of each sentence, the
+    position of the <mask> of each sentence, and the sentences themselves (utf-8). The sentences are found by a
+    64-bit hash of their text, in a sorted array of the hashes (with binary search), so opening a store only maps
+    its files and doesn't read the sentences into memory.
+    The arrays are written to a folder named after the tokenizer (see get_tokenizer_id), so a store is never read with
+    another tokenizer. A PretokenizedPredictor then runs the encoder directly on the stored ids: the sentences of the
+    store are not tokenized at all, the others are predicted as usual.
+'''
+
+ID_DTYPE = np.int32
+INDEX_DTYPE = np.int64
+HASH_DTYPE = np.uint64
+
+FILES = {
+    "ids": ID_DTYPE,            # the token ids of all the sentences (with the special tokens)
+    "index": INDEX_DTYPE,       # the position of the first token of every sentence in ids (and the end, at the end)
+    "masks": ID_DTYPE,          # the position of the (first) <mask> in every sentence, -1 without <mask>
+    "texts": np.uint8,          # the utf-8 bytes of all the sentences
+    "text_index": INDEX_DTYPE,  # the position of every sentence in texts (and the end, at the end)
+    "hashes": HASH_DTYPE,       # the hashes of the sentences (see get_hash), sorted
+    "hash_rows": INDEX_DTYPE,   # the row of the sentence of every hash in hashes
+}
+
+# The version of the files of a store
+FORMAT = 2
+
+def get_hash(text):
+    ''' Return the 64-bit hash of the utf-8 bytes of a sentence '''
+
+    return int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), 'little')
+
+def get_tokenizer_id(tokenizer):
+    ''' Return a short fingerprint of the tokenizer: its name, its vocabulary and its special tokens '''
+
+    description = json.dumps([type(tokenizer).__name__, tokenizer.name_or_path, sorted(tokenizer.get_vocab().items()),
+                              tokenizer.all_special_tokens], ensure_ascii=False)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()[:16]
+
+def get_store_dir(directory, tokenizer):
+    return os.path.join(directory, get_tokenizer_id(tokenizer))
+
+def build_store(directory, sentences, tokenizer, batch_size=10000):
+    ''' Encode the unique sentences with the (fast) tokenizer and write them to the store of the tokenizer in directory
+
+    :param directory: The folder of the stores (the store is written to a subfolder named after the tokenizer)
+    :param sentences: Iterable with the masked sentences, exactly as they are given to the model (after the context window)
+    :param tokenizer: The tokenizer of the model
+    :param batch_size: The number of sentences that are encoded together
+
+    Returns the number of sentences stored
+    '''
+
+    store_dir = get_store_dir(directory, tokenizer)
+    os.makedirs(store_dir, exist_ok=True)
+    files = {name: open(os.path.join(store_dir, name + '.bin'), 'wb') for name in FILES if not name.startswith("hash")}
+    seen = set()
+    hashes = []
+    counts = {"tokens": 0, "bytes": 0, "sentences": 0}
+
+    def write_batch(batch):
+        encodings = tokenizer(batch)
+        lengths = np.array([len(ids) for ids in encodings["input_ids"]], dtype=INDEX_DTYPE)
+        files["ids"].write(np.fromiter((token for ids in encodings["input_ids"] for token in ids), dtype=ID_DTYPE).tobytes())
+        files["index"].write((counts["tokens"] + np.cumsum(lengths) - lengths).tobytes())
+        files["masks"].write(np.array([ids.index(tokenizer.mask_token_id) if tokenizer.mask_token_id in ids else -1 for ids in encodings["input_ids"]], dtype=ID_DTYPE).tobytes())
+        encoded = [sentence.encode('utf-8') for sentence in batch]
+        text_lengths = np.array([len(text) for text in encoded], dtype=INDEX_DTYPE)
+        files["texts"].write(b''.join(encoded))
+        files["text_index"].write((counts["bytes"] + np.cumsum(text_lengths) - text_lengths).tobytes())
+        hashes.extend(get_hash(text) for text in encoded)
+        counts["tokens"] += int(lengths.sum())
+        counts["bytes"] += int(text_lengths.sum())
+        counts["sentences"] += len(batch)
+
+    batch = []
+    for sentence in sentences:
+        if sentence in seen:
+            continue
+        seen.add(sentence)
+        batch.append(sentence)
+        if len(batch)==batch_size:
+            write_batch(batch)
+            batch = []
+    if len(batch)>0:
+        write_batch(batch)
+
+    # The end of the last sentence closes the indices
+    files["index"].write(np.array([counts["tokens"]], dtype=INDEX_DTYPE).tobytes())
+    files["text_index"].write(np.array([counts["bytes"]], dtype=INDEX_DTYPE).tobytes())
+    for file_out in files.values():
+        file_out.close()
+    # The hashes are sorted for the binary search of TokenStore.find
+    hashes = np.array(hashes, dtype=HASH_DTYPE)
+    order = np.argsort(hashes, kind='stable')
+    hashes[order].tofile(os.path.join(store_dir, 'hashes.bin'))
+    order.astype(INDEX_DTYPE).tofile(os.path.join(store_dir, 'hash_rows.bin'))
+    metadata = {"format": FORMAT, "tokenizer": tokenizer.name_or_path, "tokenizer_id": get_tokenizer_id(tokenizer)}
+    metadata.update(counts)
+    with open(os.path.join(store_dir, 'metadata.json'), 'w', encoding='utf-8') as file_out:
+        json.dump(metadata, file_out, indent=2, ensure_ascii=False)
+    return counts["sentences"]
+
+def load_array(store_dir, name, count, shape=()):
+    if count==0:
+        return np.empty((0,) + shape, dtype=FILES[name])
+    return np.memmap(os.path.join(store_dir, name + '.bin'), dtype=FILES[name], mode='r', shape=(count,) + shape)
+
+class TokenStore:
+    ''' The read-only memory-mapped arrays of a store, with a lookup of the sentences by their hash
+
+    :param store_dir: The folder of the store (see get_store_dir)
+    '''
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, 'metadata.json'), encoding='utf-8') as file_in:
+            self.metadata = json.load(file_in)
+        sentences, tokens = self.metadata["sentences"], self.metadata["tokens"]
+        self.ids = load_array(store_dir, "ids", tokens)
+        self.index = load_array(store_dir, "index", sentences+1)
+        self.masks = load_array(store_dir, "masks", sentences)
+        self.texts = load_array(store_dir, "texts", self.metadata["bytes"])
+        self.text_index = load_array(store_dir, "text_index", sentences+1)
+        self.hashes = load_array(store_dir, "hashes", sentences)
+        self.hash_rows = load_array(store_dir, "hash_rows", sentences)
+
+    def find(self, sentence):
+        ''' Return the row of the sentence, or None if it isn't in the store '''
+
+        text = sentence.encode('utf-8')
+        key = get_hash(text)
+        position = int(np.searchsorted(self.hashes, HASH_DTYPE(key)))
+        # The sentences with the same hash are next to each other, and their texts are compared
+        while position<len(self.hashes) and int(self.hashes[position])==key:
+            row = int(self.hash_rows[position])
+            if self.texts[self.text_index[row]:self.text_index[row+1]].tobytes()==text:
+                return row
+            position += 1
+        return None
+
+    def get_ids(self, row):
+        return self.ids[self.index[row]:self.index[row+1]]
+
+    def length(self, row):
+        return int(self.index[row+1] - self.index[row])
+
+def open_store(directory, tokenizer):
+    ''' Return the TokenStore of the tokenizer in directory, or None if there is none '''
+
+    store_dir = get_store_dir(directory, tokenizer)
+    if not os.path.isfile(os.path.join(store_dir, 'metadata.json')):
+        return None
+    with open(os.path.join(store_dir, 'metadata.json'), encoding='utf-8') as file_in:
+        # A store written by an older version has other files, and is built again by the tokenization stage
+        if json.load(file_in).get("format")!=FORMAT:
+            return None
+    return TokenStore(store_dir)
+
+class PretokenizedPredictor:
+    ''' Predicts the sentences of a TokenStore from their stored token ids, without tokenizing them
+
+    It can be used in place of the predictor in predict_batch (and in the workers of a ParallelPredictor), with
+    the same prediction rows: the five best tokens of the fill-mask pipeline, or the rows of a PunctuationScorer.
+    The sentences that aren't in the store (or without a <mask>, or too long for the model) are passed to the
+    predictor as usual.
+
+    :param predictor: The fill-mask pipeline or a PunctuationScorer, with a PyTorch model
+    :param store: The TokenStore of the tokenizer of the predictor
+    '''
+
+    def __init__(self, predictor, store, top_k=5):
+        self.predictor = predictor
+        self.store = store
+        self.top_k = top_k
+        self.tokenizer = predictor.tokenizer
+        self.model = predictor.model
+        self.max_length = min(self.tokenizer.model_max_length, 512)
+        # The punctuation candidates of a PunctuationScorer (for the ProbabilityWriter)
+        self.candidates = getattr(predictor, "candidates", None)
+        self.hits = 0
+        self.misses = 0
+
+    def forward(self, rows):
+        # Return the prediction rows of the stored sentences, running the model on their padded ids
+        import torch
+        lengths = [self.store.length(row) for row in rows]
+        input_ids = torch.full((len(rows), max(lengths)), self.tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), max(lengths)), dtype=torch.long)
+        for i, (row, length) in enumerate(zip(rows, lengths)):
+            input_ids[i, :length] = torch.from_numpy(np.asarray(self.store.get_ids(row), dtype=np.int64))
+            attention_mask[i, :length] = 1
+        positions = torch.tensor([int(self.store.masks[row]) for row in rows])
+        with torch.no_grad():
+            hidden = self.model.base_model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+            hidden = hidden[torch.arange(len(rows)), positions]
+            if hasattr(self.predictor, "candidate_probabilities"):
+                # A PunctuationScorer
+                return [self.predictor.format_scores(probabilities) for probabilities in self.predictor.candidate_probabilities(hidden)]
+            # The five best tokens of the whole vocabulary, as in the fill-mask pipeline
+            values, predictions = torch.softmax(self.model.lm_head(hidden), dim=-1).topk(self.top_k)
+        return [format_predictions([{"token_str": self.tokenizer.decode([token_id]), "score": score}
+                                    for token_id, score in zip(sentence_predictions.tolist(), sentence_values.tolist())])
+                for sentence_predictions, sentence_values in zip(predictions, values)]
+
+    def predict_rows(self, sentences, max_tokens, timer=None):
+        ''' Return the prediction rows of the sentences, running the model on batches of similar length '''
+
+        if len(sentences)==0:
+            return []
+        found = []
+        missing = []
+        for index, sentence in enumerate(sentences):
+            row = self.store.find(sentence)
+            if row!=None and self.store.masks[row]>=0 and self.store.length(row)<=self.max_length:
+                found.append((index, row))
+            else:
+                missing.append(index)
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        predictions = [None] * len(sentences)
+        lengths = [self.store.length(row) for index, row in found]
+        for batch in make_batches(lengths, max_tokens):
+            batch = [found[position] for position in batch]
+            start = time.perf_counter()
+            rows = self.forward([row for index, row in batch])
+            if timer!=None:
+                timer.record([self.store.length(row) for index, row in batch], time.perf_counter() - start, [sentences[index] for index, row in batch])
+            for (index, row), prediction in zip(batch, rows):
+                predictions[index] = prediction
+
+        if len(missing)>0:
+            missing_sentences = [sentences[index] for index in missing]
+            if hasattr(self.predictor, "predict_rows"):
+                computed = self.predictor.predict_rows(missing_sentences, max_tokens, timer)
+            else:
+                computed = run_batches(self.predictor, missing_sentences, max_tokens, timer)
+            for index, prediction in zip(missing, computed):
+                predictions[index] = prediction
+
+        return predictions
+
+    def report(self):
+        return "Token store: " + str(self.hits) + " sentences predicted from their stored ids, " + str(self.misses) + " tokenized"
@@ -0,0 +1,144 @@
+import time
+from itertools import tee
+from .predictions import predict_batch, make_batches, format_predictions, run_batches
+from .punctuation_replacement import remove_punctuation
+
+''' One forward pass per utterance for all its sentence boundaries
+
+    By default every sentence is masked and predicted on its own, so an utterance with several sentences costs
+    several runs of the encoder, and each sentence is predicted without its neighbors. With --masking utterance,
+    the ending punctuation of every sentence of an utterance is replaced by a <mask> at once, the masked sentences
+    are joined, and the model predicts all the <mask> of the utterance in a single forward pass, each one with the
+    whole utterance as context. The predictions are then split back into one row per sentence, with the same
+    columns as in the default mode.
+
+    The masked sentences of an utterance are joined with SEPARATOR, a control character that the sanitizer strips
+    from the input, so that the utterance can be split again; the model sees a space instead. It isn't whitespace
+    (unlike e.g. '\x1f'), so str.split(), strip() and the normalized keys of the deduplication keep it. Utterances
+    that are longer than the context window (or whose number of <mask> tokens doesn't match their number of
+    sentences) are predicted sentence by sentence, as in the default mode, and counted as fallbacks.
+'''
+
+# SUB, the substitute character
+SEPARATOR = '\x1a'
+
+def group_sentences(rows):
+    ''' Yield the list of the sentences of each utterance, from the rows [sentence, position in its utterance] '''
+
+    utterance = []
+    for row in rows:
+        if len(row)<2:
+            raise ValueError("The segmented sentences have no position in their utterance, please segment them again with --masking utterance")
+        if int(row[1])==0 and len(utterance)>0:
+            yield utterance
+            utterance = []
+        utterance.append(row[0])
+    if len(utterance)>0:
+        yield utterance
+
+def mask_utterances(utterances):
+    ''' Yield, for each utterance (the list of its sentences), the joined masked sentences and their rows
+    [masked sentence, punctuation, simple punctuation] '''
+
+    for sentences in utterances:
+        rows = [list(remove_punctuation(sentence)) for sentence in sentences]
+        yield SEPARATOR.join(row[0] for row in rows), rows
+
+def add_utterance_predictions(predictor, utterances, **kwargs):
+    ''' Yield the row of every sentence of the masked utterances (see mask_utterances) extended with its predictions
+
+    The keyword arguments are passed to predict_batch. The predictor must be an UtterancePredictor '''
+
+    utterances, utterances_copy = tee(utterances)
+    predictions = predict_batch(predictor, (text for text, rows in utterances_copy), **kwargs)
+    for (text, rows), utterance_predictions in zip(utterances, predictions):
+        for row, prediction in zip(rows, utterance_predictions):
+            yield row + prediction
+
+class UtterancePredictor:
+    ''' Predicts all the <mask> of the joined masked utterances at once
+
+    It can be used in place of the predictor in predict_batch (and in the workers of a ParallelPredictor):
+    the prediction of an utterance is the list of the prediction rows of its sentences, so the utterances are what
+    is deduplicated and cached.
+
+    :param predictor: The fill-mask pipeline or a PunctuationScorer
+    :param context: The ContextWindow of the sentences of the utterances that are predicted one by one. Its size
+        (left + 1 + right tokens) is also the maximum size of an utterance that is predicted at once
+    '''
+
+    def __init__(self, predictor, context=None):
+        self.predictor = predictor
+        self.tokenizer = predictor.tokenizer
+        self.context = context
+        self.max_length = context.left+1+context.right if context!=None else 510
+        # The punctuation candidates of a PunctuationScorer (for the ProbabilityWriter)
+        self.candidates = getattr(predictor, "candidates", None)
+        self.utterances = 0
+        self.fallbacks = 0
+
+    def predict_masks(self, texts):
+        # Return the list of the prediction rows of every <mask>, for each text
+        if hasattr(self.predictor, "score_masks"):
+            return [[self.predictor.format_scores(probabilities) for probabilities in text_probabilities]
+                    for text_probabilities in self.predictor.score_masks(texts)]
+        results = self.predictor(texts, batch_size=len(texts))
+        # For a single input the pipeline doesn't return a list of results, but the result itself.
+        # The result of a text with one <mask> is the list of its predictions, with several <mask> one such list per <mask>
+        if len(texts)==1:
+            results = [results]
+        return [[format_predictions(result) for result in (text_results if isinstance(text_results[0], list) else [text_results])]
+                for text_results in results]
+
+    def predict_sentences(self, sentences, max_tokens, timer=None):
+        if self.context!=None:
+            sentences = self.context.apply(sentences)
+        if hasattr(self.predictor, "predict_rows"):
+            return self.predictor.predict_rows(sentences, max_tokens, timer)
+        return run_batches(self.predictor, sentences, max_tokens, timer)
+
+    def predict_rows(self, utterances, max_tokens, timer=None):
+        ''' Return the list of the prediction rows of the sentences of each utterance, running the model on batches of similar length '''
+
+        if len(utterances)==0:
+            return []
+        texts = [utterance.replace(SEPARATOR, ' ') for utterance in utterances]
+        encodings = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        lengths = [len(ids) for ids in encodings]
+        whole = []
+        split = []
+        for index, (utterance, ids) in enumerate(zip(utterances, encodings)):
+            if len(ids)<=self.max_length and ids.count(self.tokenizer.mask_token_id)==utterance.count(SEPARATOR)+1:
+                whole.append(index)
+            else:
+                split.append(index)
+        self.utterances += len(utterances)
+        self.fallbacks += len(split)
+
+        rows = [None] * len(utterances)
+        for batch in make_batches([lengths[index] for index in whole], max_tokens):
+            batch = [whole[index] for index in batch]
+            start = time.perf_counter()
+            results = self.predict_masks([texts[index] for index in batch])
+            if timer!=None:
+                timer.record([lengths[index] for index in batch], time.perf_counter() - start, [texts[index] for index in batch])
+            for index, result in zip(batch, results):
+                rows[index] = result
+
+        if len(split)>0:
+            sentences = [sentence for index in split for sentence in utterances[index].split(SEPARATOR)]
+            sentence_rows = iter(self.predict_sentences(sentences, max_tokens, timer))
+            for index in split:
+                rows[index] = [next(sentence_rows) for sentence in utterances[index].split(SEPARATOR)]
+
+        return rows
+
+    def to_dict(self):
+        # The numbers of utterances, of those predicted sentence by sentence, and of their sentences cut to the context window
+        return {"utterances": self.utterances, "fallbacks": self.fallbacks, "cut": self.context.windowed if self.context!=None else 0}
+
+def report_utterances(counts):
+    ''' Return the report of the counts of UtterancePredictor.to_dict (summed over the workers, if any) '''
+
+    return ("Utterance masking: " + str(counts["fallbacks"]) + " of " + str(counts["utterances"]) + " utterances predicted sentence by sentence " +
+            "(too long or with a <mask> in their text), " + str(counts["cut"]) + " of their sentences cut to the context window")
@@ -1,114 +1,576 @@
 import os
-import csv
-import re
-from spacy.lang.de import German
-from transformers import pipeline
-from helpers.sentence_segmentation import segment_utterance
-from helpers.punctuation_replacement import remove_punctuation
-from helpers.predictions import predict
-from helpers.simplify_predictions import *
-from helpers.clean_file import clean_file
+import json
+import argparse
+from collections import deque
+from helpers.sentence_segmentation import segment_rows, segment_utterances
+from helpers.punctuation_replacement import mask_sentences
+from helpers.predictions import add_predictions
+from helpers.simplify_predictions import simplify_rows, simplify_pred, SyntaxChecker, ANALYZER_URL
+from helpers.in_process_analysis import InProcessSyntaxChecker, ANALYSIS_MODEL
+from helpers.clean_file import sanitized_rows
+from helpers.prediction_cache import PredictionCache
+from helpers.deduplication import Deduplicator
+from helpers.backends import load_predictor as load_backend, BACKENDS, MODEL_NAME
+from helpers.parallel_inference import ParallelPredictor
+from helpers.context_window import ContextWindow
+from helpers.instrumentation import Instrumentation, count_rows
+from helpers.cascade import Cascade, DECIDED_BY_COLUMN
+from helpers.manifest import Manifest
+from helpers.columnar import is_columnar, COLUMNAR_FORMATS
+from helpers.utterance_masking import UtterancePredictor, group_sentences, mask_utterances, add_utterance_predictions, report_utterances
+from helpers.csv_io import *
 
 '''
-    This code takes as input a csv file (in utf-8 encoding) and returns a csv file with all the information regarding the ground truth and predicted punctuation.
-    After every preprocessing step, it saves the data in new csv files in order to be easier to run only a part of the process afterwards.
+    This code takes as input a csv file (in any encoding, which is detected) and returns a csv file with all the information regarding the ground truth and predicted punctuation.
+    By default, after every preprocessing step, it saves the data in new csv files in order to be easier to run only a part of the process afterwards.
+    With --streaming, every utterance flows through all the steps at once and only the final csv file is written
+    (the intermediate files can still be kept as debug outputs with --keep-intermediate).
+    With --streaming --concurrent, the segmentation runs in its own process and the simplification (with the requests
+    to the sentence analyzer) and the writing in a thread, connected to the model by bounded queues, so that the steps
+    overlap instead of running one after the other.
+    With --incremental, only the input rows that haven't been processed before (or that changed) go through the steps,
+    and the final file is rebuilt from their results and the stored results of the other rows.
+    With --stages, only some of the steps are run (e.g. --stages simplification to simplify the saved predictions again),
+    each one reading the file of the step before it. The heavy libraries (spaCy, transformers, torch) and the models are
+    only imported and loaded by the steps that need them.
+    With --token-store, the tokenization step encodes the masked sentences once and stores their token ids, and the
+    prediction step runs the model on them directly (e.g. --stages prediction,simplification for the next experiments).
 '''
 
-## 1st step: utterance segmentation
-# Initialize segmentation model
-segmentation_model = German()  # just the language with no pipeline
-config = {"punct_chars": ['.', '!', '?', '..', '...', '....', '.....']} # add custom sentence boundaries
-segmentation_model.add_pipe("sentencizer", config=config)
-
-# Open input and output csv files
-filename_in_1 = os.path.join(os.path.abspath('..'), "Data", "Dortmund_all.csv") 
-filename_out_1 = filename_in_1[:-4]+'_segmentedUtterances.csv'
-
-# Read input file (csv)
-csv_file_in = open(filename_in_1) # There is also an option regarding the encoding of the file, so depending on that you can add: encoding='utf-8'
-csv_reader = csv.reader(csv_file_in, delimiter=',')
-
-# Write to output file (csv)
-csv_file_out = open(filename_out_1, "w", newline='', encoding='utf-8')
-csv_writer = csv.writer(csv_file_out, delimiter=',')
-csv_writer.writerow(["Utterance"])
-
-for i, row in enumerate(csv_reader):
-    if i>0:
-        if len(row)==0:
-            continue
-        sentences = segment_utterance(row[0], segmentation_model)
-        for sent in sentences:
-            # check if the sentence has only non-alphanumeric characters. If so, don't write it in the output file
-            flag = 0
-            for letter in sent.text:
-                if letter.isalnum():
-                    flag = 1
-                    break
-            if flag==1 and sent.text!=':D' and len(sent.text)!=0:
-                csv_writer.writerow([sent.text])
-
-csv_file_in.close()
-csv_file_out.close()
-
-## 2nd step: Punctuation replacement by a <mask> in order to be used as input to the GottBERT model
-## and 3rd step: Pass all the sentences through gottbert to get predictions of the punctuation
-filename_out2 = filename_out_1[:-4]+'_maskedPredictions.csv'
-
-# Read input file (csv)
-csv_file_in = open(filename_out_1, encoding='utf-8')
-csv_reader = csv.reader(csv_file_in, delimiter=',')
-
-# Write to output file (csv)
-csv_file_out = open(filename_out2, "w", newline='', encoding='utf-8')
-csv_writer = csv.writer(csv_file_out, delimiter=',')
-csv_writer.writerow(["Utterance", "Punctuation", "Simple Punctuation", "Prominent Prediction", "Prominent Score", "Prediction 2", "Score 2", "Prediction 3", "Score 3", "Prediction 4", "Score 4", "Prediction 5", "Score 5"])
-
-# Initialize gottbert's pipeline
-predictor = pipeline('fill-mask', model='uklfr/gottbert-base')
-
-# For each sentence
-for i, row in enumerate(csv_reader):
-    if i>0:
-        init_sentence = row[0]
-        # Remove punctuation
-        sentence, gt, gt_simple = remove_punctuation(init_sentence)
-        # Make predictions
-        predictions = predict(predictor, sentence)
-
-        new_row = [sentence, gt, gt_simple] + predictions
-        csv_writer.writerow(new_row)
-
-csv_file_in.close()
-csv_file_out.close()
-
-# 4th step: Convert all the ground truth punctuation and predictions to three categories: 'question', 'EOS', 'other'
-filename_out2_cleaned = filename_out2[:-4]+'_cleaned.csv'
-filename_out3 = filename_in_1[:-4]+'_allPredictions_test.csv'
-
-# Clean "...masked_predictions.csv" file
-clean_file(filename_out2, filename_out2_cleaned)
-
-# Read input file (csv)
-csv_file_in = open(filename_out2_cleaned, encoding='utf-8')
-csv_reader = csv.reader(csv_file_in, delimiter=',')
-
-# Write to output file (csv)
-csv_file_out = open(filename_out3, "w", newline='', encoding='utf-8')
-csv_writer = csv.writer(csv_file_out, delimiter=',')
-csv_writer.writerow(["Utterance", "Punctuation", "Simple Punctuation", "Prominent Prediction", "Prominent Score", "Prediction 2", "Score 2", "Prediction 3", "Score 3", "Prediction 4", "Score 4", "Prediction 5", "Score 5", "GT Punctuation simplified", "Predicted Punctuation Simplified", "Num of Tokens", "Contains Question Words", "Contains Question Syntax", "New Predicted Punctuation Simplified"])
-
-for i, row in enumerate(csv_reader):
-    if i>0:
-        sentence, gt_punct, pred1, pred2 = row[0], row[2], row[3], row[5]
-        simplified_gt = simplify_gt(gt_punct)
-        simplified_pred = simplify_pred(pred1, pred2)
-        simplified_pred2, cqw, cqs = check_sentence_syntax(sentence, simplified_pred, pred2)
-        tokens = tokenize_sent(row[0])
-        new_row = row[:13] + [simplified_gt, simplified_pred, tokens, cqw, cqs, simplified_pred2]
-        csv_writer.writerow(new_row)
-    if i%100==0:
-        print("i=",i)
-
-csv_file_in.close()
-csv_file_out.close()
\ No newline at end of file
+# The steps of the pipeline that can be selected with --stages (the tokenization only runs with --token-store)
+STAGES = ["segmentation", "tokenization", "prediction", "simplification"]
+
+def parse_stages(value):
+    stages = [stage.strip() for stage in value.split(',') if stage.strip()!='']
+    for stage in stages:
+        if stage not in STAGES:
+            raise argparse.ArgumentTypeError("Unknown stage '" + stage + "'. Please use some of: " + ", ".join(STAGES))
+    if len(stages)==0:
+        raise argparse.ArgumentTypeError("No stage selected")
+    return stages
+
+def load_segmentation_model():
+    from spacy.lang.de import German
+    segmentation_model = German()  # just the language with no pipeline
+    config = {"punct_chars": ['.', '!', '?', '..', '...', '....', '.....']} # add custom sentence boundaries
+    segmentation_model.add_pipe("sentencizer", config=config)
+    return segmentation_model
+
+def load_predictor(args):
+    predictor = load_backend(args.backend, args.model, args.onnx_dir)
+    if args.scoring=='punctuation':
+        if args.backend=='onnx':
+            raise ValueError("The punctuation scoring needs the PyTorch model, please use the 'eager' or 'int8' backend")
+        from helpers.punctuation_scoring import PunctuationScorer
+        predictor = PunctuationScorer(predictor.model, predictor.tokenizer, keep_probabilities=args.probabilities_file!=None)
+    elif args.scoring=='head':
+        from helpers.head_scoring import load_head_scorer
+        from helpers.mask_embeddings import get_source
+        # The head only fits the hidden states of the model, backend and context window it was trained on
+        source = get_source(args.model, args.backend, args.left_context, args.right_context)
+        predictor = load_head_scorer(args.head_file, predictor.model, predictor.tokenizer, source)
+    if args.masking=='utterance':
+        # The sentences that are predicted one by one (e.g. of long utterances) are cut to the context window
+        predictor = UtterancePredictor(predictor, ContextWindow(predictor.tokenizer, args.left_context, args.right_context))
+    if args.token_store!=None:
+        from helpers.token_store import open_store, PretokenizedPredictor
+        store = open_store(args.token_store, predictor.tokenizer)
+        if store==None:
+            print("No token store of this tokenizer in", args.token_store, "(the sentences are tokenized as usual)")
+        else:
+            predictor = PretokenizedPredictor(predictor, store)
+    return predictor
+
+def make_predictor(args):
+    # With several workers, each worker process loads its own model and the parent only handles the cache and the order
+    if args.workers>1:
+        return ParallelPredictor(load_predictor, args, args.workers, args.threads_per_worker)
+    return load_predictor(args)
+
+def get_tokenizer(args, predictor):
+    tokenizer = getattr(predictor, "tokenizer", None)
+    if tokenizer==None:
+        # In parallel mode the models (and their tokenizers) are only loaded by the workers
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+    return tokenizer
+
+def make_context_window(args, predictor):
+    return ContextWindow(get_tokenizer(args, predictor), args.left_context, args.right_context)
+
+def check_options(args):
+    if args.scoring=='head' and args.head_file==None:
+        raise ValueError("The head scoring needs the head trained by head.py, please give it with --head-file")
+    if args.head_file!=None and args.scoring!='head':
+        raise ValueError("The head is only used with --scoring head")
+    if args.scoring=='head' and args.backend=='onnx':
+        raise ValueError("The head scoring needs the PyTorch model, please use the 'eager' or 'int8' backend")
+    if args.scoring=='head' and (args.masking=='utterance' or args.token_store!=None):
+        raise ValueError("The head is trained on the hidden states of single masked sentences, so it can't be combined with --masking utterance or --token-store")
+    if args.probabilities_file!=None and args.scoring!='punctuation':
+        raise ValueError("The probabilities of the punctuation candidates are only computed with --scoring punctuation")
+    if args.probabilities_file!=None and args.incremental:
+        raise ValueError("The probabilities can't be stored in incremental mode, because only the new rows are predicted")
+    if args.token_store!=None and args.backend=='onnx':
+        raise ValueError("The model runs on the stored token ids with PyTorch, please use the 'eager' or 'int8' backend with --token-store")
+    if args.token_store!=None and args.masking=='utterance':
+        raise ValueError("The token store keeps single masked sentences, so it can't be combined with --masking utterance")
+    if args.masking=='utterance' and args.cascade!='off':
+        raise ValueError("The cascade decides single sentences, so it can't be combined with --masking utterance")
+    if args.concurrent and (not args.streaming or args.incremental):
+        raise ValueError("Only the streaming mode can run its stages concurrently, please add --streaming")
+    if args.concurrent and args.profile!=None:
+        raise ValueError("The profiler records only the main process, so it can't be combined with --concurrent")
+    if len(args.stages)<len(STAGES) and (args.streaming or args.incremental):
+        raise ValueError("Only the stepwise mode can run some of the stages, because it's the only one that writes the files between them")
+    if args.probabilities_file!=None and "prediction" not in args.stages:
+        raise ValueError("The probabilities are computed by the prediction stage, please select it with --stages")
+
+def make_probability_writer(args, predictor):
+    if args.probabilities_file==None:
+        return None
+    from helpers.probability_store import ProbabilityWriter
+    candidates = getattr(predictor, "candidates", None)
+    if candidates==None:
+        from helpers.punctuation_scoring import punctuation_candidates
+        candidates = punctuation_candidates(get_tokenizer(args, predictor))[1]
+    return ProbabilityWriter(args.probabilities_file, candidates, [simplify_pred(candidate) for candidate in candidates], get_model_id(args))
+
+def get_prediction_options(args, context):
+    # In parallel mode, each window is split between the workers, so it has to be big enough for all of them
+    window_size = 1024 * max(args.workers, 1)
+    if args.masking=='utterance':
+        # The UtterancePredictor applies the context window to the sentences it predicts one by one
+        return {"max_tokens": args.max_tokens, "window_size": window_size}
+    return {"max_tokens": args.max_tokens, "window_size": window_size, "context": context}
+
+def close_predictor(predictor, metrics):
+    if hasattr(predictor, "store"):
+        # A PretokenizedPredictor (in parallel mode, the workers count their own sentences)
+        print(predictor.report())
+        metrics.count("token_store", {"hits": predictor.hits, "misses": predictor.misses})
+    if isinstance(predictor, ParallelPredictor):
+        print(predictor.report())
+        metrics.count("workers", {str(pid): {"sentences": count, "seconds": seconds} for pid, (count, seconds) in predictor.stats.items()})
+        predictor.close()
+
+def get_model_id(args):
+    # The predictions of the models, scoring modes and backends are different, so they are cached separately
+    model_id = args.model
+    if args.backend!='eager':
+        model_id += ':' + args.backend
+    if args.scoring=='punctuation':
+        model_id += ':punctuation'
+    if args.scoring=='head':
+        # A retrained head gives other predictions
+        from helpers.logistic_head import get_head_id
+        model_id += ':head:' + get_head_id(args.head_file)
+    if args.probabilities_file!=None:
+        # The cached rows also contain the probability vectors
+        model_id += ':probabilities'
+    if args.masking=='utterance':
+        # The cache keeps the predictions of whole utterances
+        model_id += ':utterance'
+    return model_id
+
+def get_segmented_header(args):
+    # In utterance mode, the position of each sentence in its utterance is kept, to group them again
+    if args.masking=='utterance':
+        return SEGMENTED_HEADER + ["Sentence Position"]
+    return SEGMENTED_HEADER
+
+def get_headers(args):
+    predictions_header, all_predictions_header = PREDICTIONS_HEADER, ALL_PREDICTIONS_HEADER
+    if args.scoring in ('punctuation', 'head'):
+        predictions_header, all_predictions_header = predictions_header + SCORE_COLUMNS, all_predictions_header + SCORE_COLUMNS
+    if args.cascade!='off':
+        predictions_header, all_predictions_header = predictions_header + [DECIDED_BY_COLUMN], all_predictions_header + [DECIDED_BY_COLUMN]
+    return predictions_header, all_predictions_header
+
+def open_cache(args):
+    if args.no_cache:
+        return None
+    cache_file = args.cache_file
+    if cache_file==None:
+        cache_file = os.path.splitext(args.input)[0]+'_predictionsCache.sqlite'
+    return PredictionCache(cache_file, get_model_id(args))
+
+def make_deduplicator(args):
+    if args.dedup=='off':
+        return None
+    return Deduplicator(aggressive=args.dedup=='aggressive')
+
+def report_deduplicator(deduplicator, metrics):
+    if deduplicator!=None:
+        print(deduplicator.report())
+        metrics.count("deduplication", {"sentences": deduplicator.total, "unique": len(deduplicator.predictions), "ratio": deduplicator.ratio()})
+
+def make_syntax_checker(args):
+    if args.analyzer=='in-process':
+        return InProcessSyntaxChecker(args.analysis_model)
+    return SyntaxChecker(args.analyzer_url, args.syntax_workers, args.syntax_timeout)
+
+def simplify(args, rows, metrics, cascade=None):
+    checker = make_syntax_checker(args)
+    rows = simplify_rows(rows, checker, check_all=args.syntax_check=='all')
+    if cascade!=None:
+        # The final labels are compared with the ground truth, for the accuracy of each tier
+        rows = cascade.score_rows(rows)
+    yield from rows
+    metrics.count("syntax_check", {"requests": checker.requests, "failures": checker.failures, "seconds": checker.seconds})
+    checker.close()
+
+def make_cascade(args, decide=True):
+    if args.cascade=='off':
+        return None
+    # The syntax tier uses the sentence analyzer on the sentences that the rules can't decide.
+    # A cascade that only scores the rows decided in an earlier run (decide=False) doesn't need it
+    checker = make_syntax_checker(args) if args.cascade=='syntax' and decide else None
+    return Cascade(checker, args.max_greeting_words)
+
+def close_cascade(cascade, metrics):
+    if cascade!=None:
+        # The rows are only counted by the simplification stage
+        if sum(cascade.rows.values())>0:
+            print(cascade.report())
+            metrics.count("cascade", cascade.to_dict())
+        if cascade.checker!=None:
+            cascade.checker.close()
+
+def close_cache(cache, metrics):
+    if cache!=None:
+        print("Prediction cache:", cache.hits, "hits,", cache.misses, "misses")
+        metrics.count("cache", {"hits": cache.hits, "misses": cache.misses})
+        cache.close()
+
+def get_config_id(args):
+    # The final rows of an utterance depend on these options, so the manifest keeps the results of each configuration apart
+    return json.dumps([get_model_id(args), get_headers(args)[1], args.dedup, args.left_context, args.right_context,
+                       args.syntax_check, args.cascade, args.max_greeting_words])
+
+def open_manifest(args):
+    manifest_file = args.manifest_file
+    if manifest_file==None:
+        manifest_file = os.path.splitext(args.input)[0]+'_manifest.sqlite'
+    return Manifest(manifest_file, get_config_id(args))
+
+def make_instrumentation(args):
+    base = os.path.splitext(args.input)[0]
+    profile_file = base + ('_profile.json' if args.profile=='torch' else '_profile.prof')
+    return Instrumentation(args.progress_interval, args.profile, args.profile_start, args.profile_rows, profile_file)
+
+def get_metrics_filename(args):
+    if args.metrics_file!=None:
+        return args.metrics_file
+    return os.path.splitext(args.input)[0]+'_metrics.json'
+
+def report_context(args, predictor, context, metrics):
+    if args.masking=='utterance':
+        # The context window only applies to the sentences of the utterances that are predicted one by one
+        counts = predictor.counts if isinstance(predictor, ParallelPredictor) else predictor.to_dict()
+        if counts==None:
+            counts = {"utterances": 0, "fallbacks": 0, "cut": 0}
+        print(report_utterances(counts))
+        metrics.count("utterance_masking", counts)
+    else:
+        print(context.report())
+        metrics.count("context_window", {"sentences": context.total, "cut": context.windowed})
+
+def finish_prediction(args, predictor, context, cache, deduplicator, metrics, writer=None):
+    close_predictor(predictor, metrics)
+    if writer!=None:
+        writer.close()
+        metrics.count("probabilities", {"rows": writer.rows, "candidates": len(writer.candidates)})
+    report_context(args, predictor, context, metrics)
+    close_cache(cache, metrics)
+    report_deduplicator(deduplicator, metrics)
+
+def get_filenames(filename_in, output_format='csv'):
+    base = os.path.splitext(filename_in)[0]
+    filename_out_1 = base+'_segmentedUtterances.csv'
+    filename_out_2 = filename_out_1[:-4]+'_maskedPredictions.csv'
+    filename_out_3 = base+'_allPredictions_test.'+output_format
+    return filename_out_1, filename_out_2, filename_out_3
+
+def read_input(args):
+    if is_columnar(args.input):
+        from helpers.columnar import read_rows
+        return read_rows(args.input)
+    # The sanitizer detects the encoding, strips the invalid characters and drops the unreadable rows while reading
+    return sanitized_rows(args.input, args.encoding)
+
+def write_output(args, rows, filename, header):
+    # The final results are written as csv, or as a typed arrow/parquet table
+    if args.output_format in COLUMNAR_FORMATS:
+        from helpers.columnar import write_table
+        return write_table(rows, filename, header)
+    return write_csv(rows, filename, header)
+
+def segment_input(args, segmentation_model, metrics):
+    # The number of input rows is known in advance (for csv files), for the progress and its ETA
+    total = None if is_columnar(args.input) else count_rows(args.input)
+    rows = metrics.track("read", read_input(args), total=total)
+    sentences = segment_rows(rows, segmentation_model, args.segmentation_batch_size, args.segmentation_processes, numbered=args.masking=='utterance')
+    return metrics.track("segmentation", sentences, upstream="read")
+
+def segment_worker(args):
+    # The segmentation stage of the concurrent mode, in its own process with its own spaCy model
+    return segment_rows(read_input(args), load_segmentation_model(), args.segmentation_batch_size, args.segmentation_processes, numbered=args.masking=='utterance')
+
+def get_units(args, rows):
+    # The segmented rows are predicted sentence by sentence, or grouped back into their utterances in utterance mode
+    if args.masking=='utterance':
+        return group_sentences(rows)
+    return (row[0] for row in rows)
+
+def pretokenize(args, filename, metrics):
+    from helpers.token_store import build_store
+    tokenizer = get_tokenizer(args, None)
+    context = ContextWindow(tokenizer, args.left_context, args.right_context)
+    rows = metrics.track("read segmented for tokenization", read_csv(filename), total=count_rows(filename))
+    # The sentences are stored exactly as the model sees them: masked and cut to their context window
+    def sentences(chunk_size=10000):
+        chunk = []
+        for row in mask_sentences(row[0] for row in rows):
+            chunk.append(row[0])
+            if len(chunk)==chunk_size:
+                yield from context.apply(chunk)
+                chunk = []
+        yield from context.apply(chunk)
+    count = metrics.measure("tokenization", lambda: build_store(args.token_store, sentences(), tokenizer), upstream="read segmented for tokenization")
+    print(count, "unique sentences tokenized and stored in", args.token_store)
+
+def predict_rows(args, units, predictor, context, cache, deduplicator, metrics, upstream=None, cascade=None, writer=None):
+    options = get_prediction_options(args, context)
+    # The number of prediction columns of a row, and the position of the probability vector (if any) after them
+    columns = len(get_headers(args)[0]) - len(MASKED_HEADER) - (1 if cascade!=None else 0)
+    if args.masking=='utterance':
+        # All the sentence boundaries of an utterance are predicted in one forward pass, and split back into sentences
+        utterances = metrics.track("masking", mask_utterances(units), upstream=upstream)
+        rows = add_utterance_predictions(predictor, utterances, cache=cache, deduplicator=deduplicator, timer=metrics.inference, **options)
+    elif cascade!=None:
+        rows = metrics.track("masking", mask_sentences(units), upstream=upstream)
+        # Only the sentences that the cascade can't decide are predicted by the model
+        rows = cascade.add_predictions(predictor, rows, columns + (1 if writer!=None else 0), cache=cache, deduplicator=deduplicator, timer=metrics.inference, **options)
+    else:
+        rows = metrics.track("masking", mask_sentences(units), upstream=upstream)
+        rows = add_predictions(predictor, rows, cache=cache, deduplicator=deduplicator, timer=metrics.inference, **options)
+    if writer!=None:
+        rows = writer.strip_rows(rows, len(MASKED_HEADER) + columns)
+    return metrics.track("prediction", rows, upstream="masking")
+
+def run_stepwise(args):
+    filename_out_1, filename_out_2, filename_out_3 = get_filenames(args.input, args.output_format)
+
+    metrics = make_instrumentation(args)
+    predictions_header, all_predictions_header = get_headers(args)
+    cascade = None
+
+    # Every selected step reads the file of a step before it, so it has to be there (e.g. from an earlier run)
+    for stage, previous, filename in [("tokenization", "segmentation", filename_out_1), ("prediction", "segmentation", filename_out_1), ("simplification", "prediction", filename_out_2)]:
+        if stage in args.stages and previous not in args.stages and not os.path.isfile(filename):
+            raise FileNotFoundError("The " + stage + " stage needs " + filename + ", please run the stages before it first")
+
+    ## 1st step: utterance segmentation
+    if "segmentation" in args.stages:
+        segmentation_model = load_segmentation_model()
+        metrics.measure("write segmented", lambda: write_csv(segment_input(args, segmentation_model, metrics), filename_out_1, get_segmented_header(args)), upstream="segmentation")
+
+    ## Optional step: the masked sentences are tokenized once and stored, for this and the next runs of the prediction
+    if "tokenization" in args.stages and args.token_store!=None:
+        pretokenize(args, filename_out_1, metrics)
+
+    ## 2nd step: Punctuation replacement by a <mask> in order to be used as input to the GottBERT model
+    ## and 3rd step: Pass all the sentences through gottbert to get predictions of the punctuation
+    if "prediction" in args.stages:
+        predictor = make_predictor(args)
+        context = make_context_window(args, predictor)
+        cache = open_cache(args)
+        deduplicator = make_deduplicator(args)
+        cascade = make_cascade(args)
+        writer = make_probability_writer(args, predictor)
+        units = get_units(args, metrics.track("read segmented", read_csv(filename_out_1), total=count_rows(filename_out_1)))
+        rows = predict_rows(args, units, predictor, context, cache, deduplicator, metrics, upstream="read segmented", cascade=cascade, writer=writer)
+        metrics.measure("write predictions", lambda: write_csv(rows, filename_out_2, predictions_header), upstream="prediction")
+        finish_prediction(args, predictor, context, cache, deduplicator, metrics, writer)
+
+    # 4th step: Convert all the ground truth punctuation and predictions to three categories: 'question', 'EOS', 'other'
+    if "simplification" in args.stages:
+        if cascade==None:
+            # The tiers of the rows were decided by an earlier run, they are only scored
+            cascade = make_cascade(args, decide=False)
+        rows = metrics.track("read predictions", read_csv(filename_out_2), total=count_rows(filename_out_2))
+        rows = metrics.track("simplification", simplify(args, rows, metrics, cascade), upstream="read predictions")
+        metrics.measure("write", lambda: write_output(args, rows, filename_out_3, all_predictions_header), upstream="simplification")
+    close_cascade(cascade, metrics)
+    metrics.write(get_metrics_filename(args), vars(args))
+
+def run_streaming(args):
+    filename_out_1, filename_out_2, filename_out_3 = get_filenames(args.input, args.output_format)
+
+    metrics = make_instrumentation(args)
+    segmentation_model = load_segmentation_model()
+    predictor = make_predictor(args)
+    context = make_context_window(args, predictor)
+    cache = open_cache(args)
+    deduplicator = make_deduplicator(args)
+    cascade = make_cascade(args)
+    writer = make_probability_writer(args, predictor)
+    predictions_header, all_predictions_header = get_headers(args)
+
+    # Chain all the steps as generators, so that each utterance goes through all of them at once.
+    # Every step is tracked, and its own time is its time minus the time of the step before it
+    rows = segment_input(args, segmentation_model, metrics)
+    if args.keep_intermediate:
+        rows = tee_csv(rows, filename_out_1, get_segmented_header(args))
+    rows = predict_rows(args, get_units(args, rows), predictor, context, cache, deduplicator, metrics, upstream="segmentation", cascade=cascade, writer=writer)
+    if args.keep_intermediate:
+        rows = tee_csv(rows, filename_out_2, predictions_header)
+    rows = metrics.track("simplification", simplify(args, rows, metrics, cascade), upstream="prediction")
+    metrics.measure("write", lambda: write_output(args, rows, filename_out_3, all_predictions_header), upstream="simplification")
+    finish_prediction(args, predictor, context, cache, deduplicator, metrics, writer)
+    close_cascade(cascade, metrics)
+    metrics.write(get_metrics_filename(args), vars(args))
+
+def run_concurrent(args):
+    from helpers.concurrent_stages import ProcessStage, ThreadStage
+    filename_out_1, filename_out_2, filename_out_3 = get_filenames(args.input, args.output_format)
+
+    metrics = make_instrumentation(args)
+    # The segmentation process starts before the model is loaded, so it segments the first utterances in the meantime
+    segmentation = ProcessStage("segmentation", segment_worker, (args,), args.queue_size)
+    try:
+        predictor = make_predictor(args)
+        context = make_context_window(args, predictor)
+        cache = open_cache(args)
+        deduplicator = make_deduplicator(args)
+        cascade = make_cascade(args)
+        writer = make_probability_writer(args, predictor)
+        predictions_header, all_predictions_header = get_headers(args)
+
+        # The model runs in this thread, on the rows that the segmentation process sends
+        rows = metrics.track("segmentation", segmentation)
+        if args.keep_intermediate:
+            rows = tee_csv(rows, filename_out_1, get_segmented_header(args))
+        rows = predict_rows(args, get_units(args, rows), predictor, context, cache, deduplicator, metrics, upstream="segmentation", cascade=cascade, writer=writer)
+        if args.keep_intermediate:
+            rows = tee_csv(rows, filename_out_2, predictions_header)
+
+        # The simplification and the writing run in a thread, on the predicted rows that this thread sends.
+        # Its times include the time it waited for them, so it has no upstream
+        def simplify_and_write(rows):
+            rows = metrics.track("simplification", simplify(args, rows, metrics, cascade))
+            metrics.measure("write", lambda: write_output(args, rows, filename_out_3, all_predictions_header), upstream="simplification")
+        simplification = ThreadStage("simplification", simplify_and_write, args.queue_size)
+        simplification.feed(rows)
+    finally:
+        segmentation.close()
+
+    print(segmentation.report())
+    print(simplification.report())
+    metrics.count("concurrent_stages", {"segmentation": segmentation.to_dict(), "simplification": simplification.to_dict()})
+    finish_prediction(args, predictor, context, cache, deduplicator, metrics, writer)
+    close_cascade(cascade, metrics)
+    metrics.write(get_metrics_filename(args), vars(args))
+
+def run_incremental(args):
+    filename_out_3 = get_filenames(args.input, args.output_format)[2]
+
+    metrics = make_instrumentation(args)
+    manifest = open_manifest(args)
+    predictions_header, all_predictions_header = get_headers(args)
+
+    # Find the input rows whose utterance (with this configuration) isn't in the manifest
+    total = None if is_columnar(args.input) else count_rows(args.input)
+    keys, new_utterances = manifest.scan(metrics.track("read", read_input(args), total=total))
+    print(len(new_utterances), "new or changed utterances of", len(keys), "input rows")
+
+    if len(new_utterances)>0:
+        segmentation_model = load_segmentation_model()
+        predictor = make_predictor(args)
+        context = make_context_window(args, predictor)
+        cache = open_cache(args)
+        deduplicator = make_deduplicator(args)
+        cascade = make_cascade(args)
+
+        # The key of the utterance of every sentence, so that the final rows can be stored per utterance
+        owners = deque()
+        def new_units():
+            segmented = segment_utterances(new_utterances.values(), segmentation_model, args.segmentation_batch_size, args.segmentation_processes)
+            for key, sentences in zip(new_utterances.keys(), segmented):
+                owners.extend([key] * len(sentences))
+                if args.masking=='utterance':
+                    if len(sentences)>0:
+                        yield sentences
+                else:
+                    yield from sentences
+
+        units = metrics.track("segmentation", new_units())
+        rows = predict_rows(args, units, predictor, context, cache, deduplicator, metrics, upstream="segmentation", cascade=cascade)
+        rows = metrics.track("simplification", simplify(args, rows, metrics, cascade), upstream="prediction")
+        metrics.measure("store", lambda: manifest.put_rows(rows, owners, list(new_utterances.keys())), upstream="simplification")
+        finish_prediction(args, predictor, context, cache, deduplicator, metrics)
+        close_cascade(cascade, metrics)
+
+    # Merge: the final file has the rows of all the input rows, in their order
+    manifest.prune(keys)
+    metrics.measure("write", lambda: write_output(args, manifest.get_rows(keys), filename_out_3, all_predictions_header))
+    print(manifest.report())
+    metrics.count("incremental", {"input_rows": manifest.rows, "known": manifest.known, "new": manifest.new, "removed": manifest.removed})
+    manifest.close()
+    metrics.write(get_metrics_filename(args), vars(args))
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default=os.path.join(os.path.abspath('..'), "Data", "Dortmund_all.csv"), help="The csv (or arrow/parquet) file with the utterances in its first column")
+    parser.add_argument("--encoding", type=str, default=None, help="The encoding of the input file (default: detected from the file, e.g. cp1252 for Data/Dortmund_all.csv)")
+    parser.add_argument("--streaming", action="store_true", help="Pass every utterance through all the steps at once and write only the final csv file")
+    parser.add_argument("--incremental", action="store_true", help="Process only the input rows that are new or changed since the last run and merge them into the final results")
+    parser.add_argument("--manifest-file", type=str, default=None, help="The SQLite file with the results of the rows already processed in incremental mode (default: next to the input file)")
+    parser.add_argument("--stages", type=parse_stages, default=STAGES, help="The comma-separated steps that are run in stepwise mode: " + ", ".join(STAGES) + " (default: all of them). Each step reads the file written by the step before it")
+    parser.add_argument("--concurrent", action="store_true", help="In streaming mode, run the segmentation in its own process and the simplification (with the requests to the sentence analyzer) in a thread, at the same time as the model")
+    parser.add_argument("--queue-size", type=int, default=8, help="With --concurrent, the maximum number of chunks of 256 rows waiting between two stages")
+    parser.add_argument("--keep-intermediate", action="store_true", help="In streaming mode, also write the intermediate csv files as debug outputs")
+    parser.add_argument("--segmentation-batch-size", type=int, default=1000, help="The number of utterances that spaCy segments together")
+    parser.add_argument("--segmentation-processes", type=int, default=1, help="The number of processes used by spaCy for the segmentation")
+    parser.add_argument("--cache-file", type=str, default=None, help="The SQLite file where the predictions are cached (default: next to the input file)")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the cache of predictions")
+    parser.add_argument("--dedup", choices=["exact", "aggressive", "off"], default="exact", help="Run the model once per unique masked sentence ('exact') or per normalized sentence ('aggressive': case folding, collapsing repeated letters)")
+    parser.add_argument("--analyzer", choices=["http", "in-process"], default="http", help="Call the sentence analyzer over HTTP ('http') or run the same question analysis with spaCy in this process ('in-process')")
+    parser.add_argument("--analysis-model", type=str, default=ANALYSIS_MODEL, help="The German spaCy model of the in-process analyzer")
+    parser.add_argument("--analyzer-url", type=str, default=ANALYZER_URL, help="The analyze-text endpoint of the sentence analyzer")
+    parser.add_argument("--syntax-workers", type=int, default=8, help="The number of concurrent requests to the sentence analyzer")
+    parser.add_argument("--syntax-timeout", type=float, default=10, help="The timeout (in seconds) of each request to the sentence analyzer")
+    parser.add_argument("--syntax-check", choices=["needed", "all"], default="all", help="Call the sentence analyzer for all the sentences (the question words/syntax columns are True/False for every row), or only for those where the result can change the label ('needed', the other rows are \"not checked\")")
+    parser.add_argument("--cascade", choices=["off", "rules", "syntax"], default="off", help="Decide the confident sentences without the model: with rules only ('rules') or with rules and the question syntax of the sentence analyzer ('syntax')")
+    parser.add_argument("--max-greeting-words", type=int, default=3, help="The maximum number of words of a greeting that the cascade labels as 'EOS'")
+    parser.add_argument("--masking", choices=["sentence", "utterance"], default="sentence", help="Predict every sentence on its own ('sentence') or all the sentence boundaries of an utterance in one forward pass, with the whole utterance as context ('utterance')")
+    parser.add_argument("--token-store", type=str, default=None, help="The folder of the pre-tokenized masked sentences: the tokenization stage writes them there and the prediction stage runs the model on their stored token ids")
+    parser.add_argument("--scoring", choices=["topk", "punctuation", "head"], default="topk", help="Get the top-5 tokens of the whole vocabulary ('topk'), score only the punctuation tokens and add P(question) and P(EOS) ('punctuation'), or label the sentences with the classification head trained by head.py ('head')")
+    parser.add_argument("--head-file", type=str, default=None, help="With --scoring head, the file of the head saved by head.py (trained with the same backend and context window)")
+    parser.add_argument("--probabilities-file", type=str, default=None, help="With --scoring punctuation, also store the probabilities of all the punctuation candidates of every sentence in this float16 file (aligned with the rows of the results)")
+    parser.add_argument("--output-format", choices=["csv"] + COLUMNAR_FORMATS, default="csv", help="The format of the final results: csv, or a typed table in Apache Arrow ('arrow', memory-mapped when loaded) or Parquet format")
+    parser.add_argument("--model", type=str, default=MODEL_NAME, help="The name (or local path) of the fill-mask model, e.g. a fine-tuned GottBERT or the folder of helpers.offline.save_tiny_model")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="The inference backend: PyTorch fp32 ('eager'), PyTorch with dynamic int8 quantization ('int8') or ONNX Runtime ('onnx')")
+    parser.add_argument("--onnx-dir", type=str, default=None, help="Where the exported ONNX model is saved, so that it's exported only once (use one folder per --model)")
+    parser.add_argument("--max-tokens", type=int, default=4096, help="The maximum number of (padded) tokens of an inference batch: the sentences are sorted by length and grouped into batches of this size")
+    parser.add_argument("--workers", type=int, default=1, help="The number of worker processes of the prediction step, each one with its own model")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="The number of PyTorch threads of each worker (default: the number of cores divided by the number of workers)")
+    parser.add_argument("--left-context", type=int, default=254, help="The maximum number of tokens before the <mask> that the model sees (longer sentences are cut)")
+    parser.add_argument("--right-context", type=int, default=254, help="The maximum number of tokens after the <mask> that the model sees")
+    parser.add_argument("--metrics-file", type=str, default=None, help="The json file where the metrics of the run are written (default: next to the input file)")
+    parser.add_argument("--progress-interval", type=float, default=30, help="The number of seconds between two progress lines")
+    parser.add_argument("--profile", choices=["cprofile", "torch"], default=None, help="Profile a window of input rows with cProfile or the PyTorch profiler")
+    parser.add_argument("--profile-start", type=int, default=1000, help="The number of input rows after which the profiler starts")
+    parser.add_argument("--profile-rows", type=int, default=1000, help="The number of input rows that are profiled")
+    args = parser.parse_args()
+    check_options(args)
+
+    if args.incremental:
+        run_incremental(args)
+    elif args.streaming and args.concurrent:
+        run_concurrent(args)
+    elif args.streaming:
+        run_streaming(args)
+    else:
+        run_stepwise(args)
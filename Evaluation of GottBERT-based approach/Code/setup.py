@@ -0,0 +1,18 @@
+import setuptools
+
+# The helpers of the pipeline as an installable package, e.g. for the /classify endpoint of the qcg-spacy-tool.
+# They are installed as gottbert_helpers (not as helpers, which would collide with other packages), so they import
+# each other with relative imports. Importing them only needs numpy and requests; the model needs the 'model' extra.
+# spaCy isn't required here, because the spaCy tool pins its own version of it
+setuptools.setup(name="gottbert-question-classifier",
+version='0.1',
+description='The helpers of the pipeline of the GottBERT-based question classifier',
+url='#',
+author='Contexity AG',
+install_requires=['numpy>=1.21,<3', 'requests>=2.25,<3'],
+extras_require={'model': ['torch>=1.13,<3', 'transformers>=4.30,<5'],
+                'pipeline': ['torch>=1.13,<3', 'transformers>=4.30,<5', 'spacy>=3.0,<4', 'pyarrow>=10']},
+author_email='',
+package_dir={'gottbert_helpers': 'helpers'},
+packages=['gottbert_helpers'],
+zip_safe=False)
@@ -0,0 +1,61 @@
+import os
+import sys
+
+# The tests import the helpers (and the scripts) of the Code folder, like the scripts themselves
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import pytest
+
+# Utterances of the tests (and of the tokenizer of the tiny model)
+UTTERANCES = ["Hallo", "Hi! Wie geht es dir?", "Ich habe morgen Zeit. Hast du Zeit?", "Vielen Dank!", "Wann kommst du nach Hause?",
+              "Das ist gut. Bis morgen.", "Was machst du heute Abend? Ich gehe ins Kino.", "Ist das dein Auto?", "Guten Morgen",
+              "Ich weiß nicht, wo er wohnt.", "Kannst du mir helfen? Das wäre nett!", "Tschüss"]
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory):
+    ''' The folder of a tiny random RoBERTa model (see helpers.offline), shared by the tests '''
+
+    from helpers.offline import save_tiny_model
+    return save_tiny_model(str(tmp_path_factory.mktemp("model") / "tiny"), UTTERANCES * 20, vocab_size=300, hidden_size=32)
+
+# The input of the pipeline runs: with repeated utterances and one that is longer than the context window
+INPUT_UTTERANCES = UTTERANCES + UTTERANCES[:4] + ["Hallo " * 300 + "wie geht es dir?", "Vielen Dank!"]
+
+@pytest.fixture(scope="session")
+def analyzer():
+    ''' The url of a stub of the sentence analyzer (see helpers.offline) '''
+
+    from helpers.offline import StubAnalyzer
+    stub = StubAnalyzer()
+    yield stub.url
+    stub.close()
+
+@pytest.fixture
+def run_pipeline(tmp_path, tiny_model, analyzer):
+    ''' Return a function that runs pipeline.py with the tiny model on INPUT_UTTERANCES and returns the final rows and the output
+
+    Its keyword arguments: input (the name of the input file in tmp_path, which is kept between the runs) and model
+    '''
+
+    import csv
+    import subprocess
+    def run(*options, input="input.csv", model=tiny_model):
+        filename = str(tmp_path / input)
+        if not os.path.isfile(filename):
+            with open(filename, 'w', encoding='utf-8', newline='') as file_out:
+                csv.writer(file_out).writerows([["Utterance"]] + [[utterance] for utterance in INPUT_UTTERANCES])
+        result = subprocess.run([sys.executable, "pipeline.py", "--input", filename, "--model", model, "--analyzer-url", analyzer] + list(options),
+                                cwd=CODE_DIR, capture_output=True, text=True)
+        assert result.returncode==0, result.stderr
+        with open(os.path.splitext(filename)[0] + '_allPredictions_test.csv', encoding='utf-8', newline='') as file_in:
+            return list(csv.reader(file_in)), result.stdout
+    return run
+
+@pytest.fixture(scope="session")
+def fill_mask(tiny_model):
+    ''' The fill-mask pipeline of the tiny model '''
+
+    from helpers.backends import load_predictor
+    return load_predictor('eager', tiny_model)
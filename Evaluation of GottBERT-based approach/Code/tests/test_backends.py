@@ -0,0 +1,29 @@
+import pytest
+from helpers.backends import load_predictor, check_parity
+
+SENTENCES = ["Hallo <mask>", "Wie geht es dir <mask>", "Ich habe morgen Zeit <mask>", "Ist das dein Auto <mask>"]
+
+def test_int8_quantizes_the_linear_layers(tiny_model):
+    import torch
+    predictor = load_predictor('int8', tiny_model)
+    assert any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in predictor.model.modules())
+    assert not any(type(module)==torch.nn.Linear for module in predictor.model.modules())
+
+def test_parity_report(fill_mask, tiny_model):
+    result = check_parity(fill_mask, fill_mask, SENTENCES)
+    assert (result["sentences"], result["top1_agreement"], result["label_agreement"]) == (4, 1.0, 1.0)
+    result = check_parity(fill_mask, load_predictor('int8', tiny_model), SENTENCES, max_tokens=16)
+    assert result["sentences"] == 4
+    assert 0 <= result["label_agreement"] <= 1 and result["candidate_seconds"] > 0
+
+def test_onnx_backend(tiny_model, tmp_path):
+    pytest.importorskip("optimum.onnxruntime")
+    onnx_dir = str(tmp_path / "onnx")
+    result = check_parity(load_predictor('eager', tiny_model), load_predictor('onnx', tiny_model, onnx_dir), SENTENCES)
+    assert result["top1_agreement"] == 1.0
+    # The exported model is loaded from onnx_dir the next time
+    assert load_predictor('onnx', tiny_model, onnx_dir)("Hallo <mask>")[0]["token_str"] != None
+
+def test_unknown_backend(tiny_model):
+    with pytest.raises(ValueError, match="Unknown backend 'fp16'"):
+        load_predictor('fp16', tiny_model)
@@ -0,0 +1,47 @@
+import sys
+import json
+import subprocess
+import pytest
+from benchmark import PeakMemory, run_stage
+from conftest import CODE_DIR, UTTERANCES
+
+def allocate(megabytes):
+    block = bytearray(megabytes*1024*1024)
+    # Touch every page, so that it's resident
+    block[::4096] = b'x' * len(block[::4096])
+    return block
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="The peak of a stage is only measured on Linux")
+def test_peak_of_a_stage_is_not_inherited():
+    memory = PeakMemory().start()
+    block = allocate(200)
+    del block
+    first = memory.stop()
+    assert first - memory.start_rss > 150
+
+    memory = PeakMemory().start()
+    second = memory.stop()
+    assert second < first - 150
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="The peak of a stage is only measured on Linux")
+def test_stage_reports_its_peak(capsys):
+    outputs, result = run_stage("allocation", lambda items: [len(allocate(size)) for size in items], lambda item: None, [100, 10, 10], latency_sample=2)
+    assert outputs == [100*1024*1024, 10*1024*1024, 10*1024*1024]
+    assert (result["items"], result["outputs"], result["latency_sample"]) == (3, 3, 2)
+    assert result["peak_rss_method"] in ("hwm", "polling")
+    assert result["peak_rss_mb"] - result["start_rss_mb"] > 80
+    assert "allocation: 3 items" in capsys.readouterr().out
+
+def test_every_stage_is_reported(tmp_path, tiny_model):
+    filename = tmp_path / "input.csv"
+    filename.write_text("Utterance\n" + "\n".join(UTTERANCES) + "\n", encoding='utf-8')
+    output = tmp_path / "benchmark.json"
+    subprocess.run([sys.executable, "benchmark.py", "--input", str(filename), "--sizes", "3", "full", "--latency-sample", "2",
+                    "--tiny-model", tiny_model, "--stub-analyzer", "--output", str(output)], cwd=CODE_DIR, check=True, capture_output=True)
+    results = json.loads(output.read_text())
+    assert [subset["utterances"] for subset in results["subsets"].values()] == [3, len(UTTERANCES)]
+    for subset in results["subsets"].values():
+        assert list(subset["stages"]) == ["segmentation", "masking", "inference", "simplification", "syntax"]
+        for stage in subset["stages"].values():
+            assert stage["peak_rss_mb"] >= stage["start_rss_mb"] > 0
+            assert stage["items_per_second"] > 0
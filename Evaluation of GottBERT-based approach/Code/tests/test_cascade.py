@@ -0,0 +1,55 @@
+from helpers.cascade import Cascade, LABEL_PUNCTUATION
+
+class FakePredictor:
+    # Predicts "." for every sentence and keeps the sentences that were predicted
+    def __init__(self):
+        self.sentences = []
+
+    def predict_rows(self, sentences, max_tokens, timer=None):
+        self.sentences += sentences
+        return [[".", 0.9] + [""]*8 for sentence in sentences]
+
+class FakeChecker:
+    # The question syntax of the sentences that start with "ist"
+    def analyze_many(self, texts):
+        return [{"containsQuestionSyntax": text.lower().startswith("ist")} for text in texts]
+
+ROWS = [["Wie geht es dir<mask>"], ["Hallo<mask>"], ["Ist das dein Auto<mask>"], ["Ich komme morgen<mask>"], ["Vielen Dank für alles, bis morgen<mask>"]]
+
+def test_rules():
+    cascade = Cascade(max_greeting_words=2)
+    assert [cascade.decide_rules(row[0]) for row in ROWS] == ["question", "EOS", None, None, None]
+    assert cascade.decide_rules("<mask>") == None
+
+def test_only_undecided_rows_go_to_the_model():
+    predictor = FakePredictor()
+    rows = list(Cascade(FakeChecker(), chunk_size=2).add_predictions(predictor, ROWS))
+    assert predictor.sentences == ["Ich komme morgen<mask>", "Vielen Dank für alles, bis morgen<mask>"]
+    assert [row[0] for row in rows] == [row[0] for row in ROWS]
+    assert [(row[1], row[-1]) for row in rows] == [("?", "rules"), (".", "rules"), ("?", "syntax"), (".", "model"), (".", "model")]
+    assert all(len(row)==12 for row in rows)
+
+def test_tier_accuracy():
+    cascade = Cascade()
+    # GT Punctuation simplified (13) and New Predicted Punctuation Simplified (18) of final rows
+    rows = [[""]*13 + ["question"] + [""]*4 + ["question", tier] for tier in ("rules", "model")] + [[""]*13 + ["EOS"] + [""]*4 + ["question", "model"]]
+    assert len(list(cascade.score_rows(rows))) == 3
+    result = cascade.to_dict()
+    assert result["rules"] == {"rows": 1, "share": 1/3, "accuracy": 1.0}
+    assert result["model"]["accuracy"] == 0.5
+
+def test_pipeline_records_the_deciding_tier(run_pipeline):
+    rows = run_pipeline("--no-cache")[0]
+    cascade_rows, output = run_pipeline("--no-cache", "--cascade", "rules", input="cascade.csv")
+    assert cascade_rows[0] == rows[0] + ["Decided By"]
+    tiers = [row[-1] for row in cascade_rows[1:]]
+    assert set(tiers) == {"rules", "model"}
+    for row, cascade_row in zip(rows[1:], cascade_rows[1:]):
+        if cascade_row[-1]=="model":
+            assert cascade_row[:-1] == row
+        else:
+            # A decided row gets the punctuation of its label and no scores
+            assert cascade_row[3] == LABEL_PUNCTUATION[Cascade().decide_rules(cascade_row[0])]
+            assert cascade_row[4] == ""
+    assert "  rules: " + str(tiers.count("rules")) + " rows" in output
+    assert "  model: " + str(tiers.count("model")) + " rows" in output
@@ -0,0 +1,46 @@
+import pytest
+from helpers.clean_file import Sanitizer, detect_encoding
+
+TEXT = "Utterance\nGrüß dich!\nKostet das 5 €?\n"
+
+@pytest.mark.parametrize("data, encoding", [
+    (TEXT.encode('utf-8'), 'utf-8'),
+    (TEXT.encode('cp1252'), 'cp1252'),
+    # 0x81 isn't a character in cp1252
+    (TEXT.replace("€", "").encode('latin-1') + b"\x81\n", 'latin-1'),
+    (b"\xef\xbb\xbf" + TEXT.encode('utf-8'), 'utf-8-sig'),
+])
+def test_encoding_detection(tmp_path, data, encoding):
+    filename = tmp_path / "input.csv"
+    filename.write_bytes(data)
+    assert detect_encoding(str(filename)) == encoding
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+def test_rows_are_decoded_across_chunks(tmp_path, chunk_size):
+    filename = tmp_path / "input.csv"
+    filename.write_bytes(TEXT.encode('utf-8'))
+    sanitizer = Sanitizer(str(filename), chunk_size=chunk_size)
+    assert list(sanitizer.read_rows()) == [["Utterance"], ["Grüß dich!"], ["Kostet das 5 €?"]]
+
+def test_control_characters_and_empty_rows(tmp_path):
+    filename = tmp_path / "input.csv"
+    # A NUL and a bell in a row, a row of control characters only, an empty row and a blank line
+    filename.write_bytes("Utterance\nHal\x00lo\x07 du\n\x01\x02\n,\n\nTschüss\n".encode('utf-8'))
+    sanitizer = Sanitizer(str(filename))
+    assert list(sanitizer.read_rows()) == [["Utterance"], ["Hallo du"], ["Tschüss"]]
+    assert (sanitizer.repaired, sanitizer.dropped, sanitizer.rows) == (2, 2, 3)
+
+def test_rows_emptied_by_the_repair_are_dropped_once(tmp_path):
+    filename = tmp_path / "input.csv"
+    # A control character followed by a space, and a control character alone
+    filename.write_bytes(b"a,b\n\x01 \n\x01\nc,d\n")
+    sanitizer = Sanitizer(str(filename))
+    assert list(sanitizer.read_rows()) == [["a", "b"], ["c", "d"]]
+    assert (sanitizer.repaired, sanitizer.dropped, sanitizer.rows) == (2, 2, 2)
+
+def test_invalid_bytes_are_stripped(tmp_path):
+    filename = tmp_path / "input.csv"
+    filename.write_bytes(TEXT.encode('utf-8') + b"Gr\xfc\xdf\n")
+    sanitizer = Sanitizer(str(filename), encoding='utf-8')
+    assert list(sanitizer.read_rows())[-1] == ["Gr"]
+    assert sanitizer.repaired == 1
@@ -0,0 +1,20 @@
+import pytest
+from helpers.columnar import is_columnar, write_table, read_table, read_rows, export_csv
+from helpers.csv_io import read_csv
+
+HEADER = ["Utterance", "Prominent Prediction", "Prominent Score", "Num of Tokens", "Contains Question Words"]
+ROWS = [["Hallo <mask>", "!", "0.5", "2", "True"], ["Wie geht es <mask>", "?", "0.25", "5", ""]]
+
+def test_is_columnar():
+    assert is_columnar("results.arrow") and is_columnar("../Data/results.parquet")
+    assert not is_columnar("results.csv") and not is_columnar("parquet")
+
+@pytest.mark.parametrize("extension", ["arrow", "parquet"])
+def test_tables_round_trip_with_typed_columns(tmp_path, extension):
+    filename = str(tmp_path / ("results." + extension))
+    assert write_table(iter(ROWS), filename, HEADER, batch_size=1) == 2
+    table = read_table(filename)
+    assert [str(field.type) for field in table.schema] == ["string", "dictionary<values=string, indices=int32, ordered=0>", "float", "int32", "bool"]
+    assert list(read_rows(filename)) == [["Hallo <mask>", "!", 0.5, 2, True], ["Wie geht es <mask>", "?", 0.25, 5, ""]]
+    export_csv(filename, str(tmp_path / "results.csv"))
+    assert list(read_csv(str(tmp_path / "results.csv"))) == [["Hallo <mask>", "!", "0.5", "2", "True"], ["Wie geht es <mask>", "?", "0.25", "5", ""]]
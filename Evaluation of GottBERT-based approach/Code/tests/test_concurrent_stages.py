@@ -0,0 +1,42 @@
+import pytest
+from helpers.concurrent_stages import ProcessStage, ThreadStage
+
+# The functions of a ProcessStage run in the child process, so they are defined at module level
+
+def count_rows(count):
+    return ([number] for number in range(count))
+
+def fail_after(count):
+    yield from count_rows(count)
+    raise KeyError("segmentation failed")
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_process_stage_keeps_the_order(chunk_size):
+    stage = ProcessStage("counting", count_rows, (100,), queue_size=2, chunk_size=chunk_size)
+    assert list(stage) == [[number] for number in range(100)]
+    assert stage.to_dict()["rows"] == 100
+    assert not stage.process.is_alive()
+
+def test_process_stage_error_has_the_traceback():
+    stage = ProcessStage("failing", fail_after, (10,), chunk_size=4)
+    rows = []
+    with pytest.raises(RuntimeError, match="(?s)The failing stage failed:.*KeyError: 'segmentation failed'"):
+        for row in stage:
+            rows.append(row)
+    # The rows before the error arrive
+    assert rows == [[number] for number in range(8)]
+
+def test_thread_stage_keeps_the_order():
+    stage = ThreadStage("collecting", list, queue_size=2, chunk_size=3)
+    assert stage.feed(iter(range(100))) == list(range(100))
+    assert stage.to_dict()["rows"] == 100
+
+def test_thread_stage_error_is_raised_by_feed():
+    def consume(rows):
+        for row in rows:
+            if row==5:
+                raise ValueError("simplification failed")
+    stage = ThreadStage("failing", consume, queue_size=1, chunk_size=2)
+    # The feeder doesn't block on the full queue after the error
+    with pytest.raises(ValueError, match="simplification failed"):
+        stage.feed(iter(range(10000)))
@@ -0,0 +1,43 @@
+import pytest
+from transformers import AutoTokenizer
+from helpers.context_window import ContextWindow
+
+@pytest.fixture(scope="module")
+def tokenizer(tiny_model):
+    return AutoTokenizer.from_pretrained(tiny_model)
+
+def test_short_sentences_are_kept(tokenizer):
+    context = ContextWindow(tokenizer, 8, 4)
+    sentences = ["Hallo <mask>", "Wie geht es dir <mask>"]
+    assert context.apply(sentences) == sentences
+    assert (context.total, context.windowed) == (2, 0)
+
+def test_long_sentences_are_cut_around_the_mask(tokenizer):
+    context = ContextWindow(tokenizer, 8, 4)
+    sentence = "Hallo " * 50 + "wie geht es dir <mask> und was machst du " * 5
+    cut = context.apply([sentence])[0]
+    assert cut in sentence
+    ids = tokenizer(cut, add_special_tokens=False)["input_ids"]
+    position = ids.index(tokenizer.mask_token_id)
+    assert position <= 8 and len(ids) - position - 1 <= 4
+    # The cut is between words, so its tokens are the same as in the whole sentence
+    all_ids = tokenizer(sentence, add_special_tokens=False)["input_ids"]
+    start = all_ids.index(tokenizer.mask_token_id) - position
+    assert all_ids[start:start+len(ids)] == ids
+    assert context.windowed == 1
+
+@pytest.mark.parametrize("left, right", [(1, 1), (5, 3), (254, 254)])
+def test_windows_fit_the_model(tokenizer, left, right):
+    context = ContextWindow(tokenizer, left, right)
+    sentence = "Ichhabemorgenzeit " * 200 + "hastduzeit<mask>wannkommstdu " * 200
+    ids = tokenizer(context.apply([sentence])[0])["input_ids"]
+    position = ids.index(tokenizer.mask_token_id)
+    # Without the <s> and </s> tokens
+    assert position - 1 <= left and len(ids) - position - 2 <= right
+
+def test_sentence_without_mask_keeps_its_end(tokenizer):
+    context = ContextWindow(tokenizer, 4, 4)
+    sentence = "Hallo " * 50 + "Tschüss"
+    cut = context.apply([sentence])[0]
+    assert sentence.endswith(cut)
+    assert len(tokenizer(cut, add_special_tokens=False)["input_ids"]) <= 5
@@ -0,0 +1,49 @@
+from helpers.deduplication import Deduplicator, normalized_key
+from helpers.prediction_cache import PredictionCache
+from helpers.predictions import predict_batch
+
+class CountingPredictor:
+    # Predicts the length of every sentence and keeps the sentences that were predicted
+    def __init__(self):
+        self.sentences = []
+
+    def predict_rows(self, sentences, max_tokens, timer=None):
+        self.sentences += sentences
+        return [[sentence, float(len(sentence))] + [""]*8 for sentence in sentences]
+
+def test_normalized_key():
+    assert normalized_key("Juuuuliiiia  <mask>") == normalized_key("julia <mask>")
+    assert normalized_key("Hallo <mask>") != normalized_key("Hallo du <mask>")
+
+def test_model_runs_once_per_key():
+    predictor = CountingPredictor()
+    deduplicator = Deduplicator()
+    sentences = ["Hallo <mask>", "Wie geht es <mask>", "Hallo <mask>", "hallo <mask>"]
+    rows = list(predict_batch(predictor, sentences, window_size=2, deduplicator=deduplicator))
+    # The duplicate in the second window is taken from the predictions of the first one
+    assert predictor.sentences == ["Hallo <mask>", "Wie geht es <mask>", "hallo <mask>"]
+    assert rows[2] == rows[0]
+    assert deduplicator.ratio() == 0.25
+
+def test_aggressive_keys_share_the_first_prediction():
+    predictor = CountingPredictor()
+    rows = list(predict_batch(predictor, ["Juuulia <mask>", "julia  <mask>"], deduplicator=Deduplicator(aggressive=True)))
+    assert predictor.sentences == ["Juuulia <mask>"]
+    assert rows[1] == rows[0]
+
+def test_cache_keys(tmp_path):
+    filename = str(tmp_path / "cache.sqlite")
+    cache = PredictionCache(filename, "model")
+    list(predict_batch(CountingPredictor(), ["Hallo <mask>", "Wie geht es <mask>"], cache=cache))
+    cache.close()
+
+    # The same model finds the predictions, another model doesn't
+    predictor = CountingPredictor()
+    cache = PredictionCache(filename, "model")
+    list(predict_batch(predictor, ["Wie geht es <mask>", "Tschüss <mask>"], cache=cache))
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert predictor.sentences == ["Tschüss <mask>"]
+    cache.close()
+    cache = PredictionCache(filename, "model:punctuation")
+    assert cache.get_many(["Hallo <mask>"]) == {}
+    cache.close()
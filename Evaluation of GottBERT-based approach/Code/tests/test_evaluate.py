@@ -0,0 +1,119 @@
+import os
+import csv
+import sys
+import random
+import subprocess
+import numpy as np
+import pytest
+from helpers.csv_io import write_csv, ALL_PREDICTIONS_HEADER
+from helpers.simplify_predictions import simplify_pred, NOT_CHECKED
+
+pytest.importorskip("pyarrow")
+from evaluate import load_results, select_rows, evaluate, get_buckets
+from conftest import CODE_DIR
+
+def make_row(gt, prediction, prediction2, words):
+    # A final row whose second prediction is prediction2, with the question words (True/False) or NOT_CHECKED
+    syntax = NOT_CHECKED if words==NOT_CHECKED else False
+    return ["Satz <mask>", "?" if gt=="question" else ".", "?" if gt=="question" else ".", prediction, 0.6, prediction2, 0.3,
+            "!", 0.05, ",", 0.03, ":", 0.02, gt, "EOS", 1, words, syntax, "EOS"]
+
+ROWS = [
+    make_row("question", ".", "?", True),
+    make_row("EOS", ".", "?", False),
+    make_row("question", "!", "?", NOT_CHECKED),
+    make_row("EOS", ".", ",", NOT_CHECKED),
+]
+
+@pytest.fixture
+def results(tmp_path):
+    filename = str(tmp_path / "results.csv")
+    write_csv(ROWS, filename, ALL_PREDICTIONS_HEADER)
+    return filename
+
+def test_checked_rows(results):
+    data = load_results(results)
+    assert data["checked"].tolist() == [True, True, False, False]
+    assert data["question_words"].tolist() == [True, False, False, False]
+    selected = select_rows(data, data["checked"])
+    assert selected["gt"].tolist() == [True, False]
+    assert len(selected["baselines"]["New Predicted Punctuation Simplified"]) == 2
+
+def test_overrides(results):
+    data = load_results(results)
+    records = evaluate(data, np.array([1.1]), [None], [2], overrides=["none"])
+    assert set(record["override"] for record in records) == {"none"}
+    records = evaluate(data, np.array([1.1]), [None], [2])
+    words = [record for record in records if record["override"]=="words" and record["bucket"]=="all"][0]
+    assert (words["tp"], words["fp"]) == (1, 0)
+
+def test_unchecked_results_skip_the_overrides(results, tmp_path):
+    output = str(tmp_path / "sweep.csv")
+    run = subprocess.run([sys.executable, "evaluate.py", "--input", results, "--output", output], cwd=CODE_DIR, capture_output=True, text=True, check=True)
+    assert "WARNING: 1 sentences" in run.stdout
+    with open(output, encoding='utf-8') as file_in:
+        assert set(row["override"] for row in csv.DictReader(file_in)) == {"none"}
+
+    subprocess.run([sys.executable, "evaluate.py", "--input", results, "--output", output, "--checked-only"], cwd=CODE_DIR, capture_output=True, check=True)
+    with open(output, encoding='utf-8') as file_in:
+        records = [row for row in csv.DictReader(file_in) if row["bucket"]=="all"]
+    assert "words" in set(row["override"] for row in records)
+    assert all(int(row["tp"])+int(row["fp"])+int(row["fn"])+int(row["tn"])==2 for row in records)
+
+PUNCTUATION = ["?", ".", "!", ",", "?!", ":", "..."]
+
+def random_rows(count, seed=0):
+    # Final rows with scores in steps of 1/8 (so that their sums are exact), and rows decided by the cascade without a score
+    generator = random.Random(seed)
+    rows = []
+    for index in range(count):
+        gt = generator.choice(["question", "EOS"])
+        if index%5==0:
+            tier = generator.choice(["rules", "syntax"])
+            predictions = ["?" if tier=="syntax" or generator.random()<0.5 else ".", ""] + [""]*8
+        else:
+            tier = "model"
+            predictions = []
+            for punctuation in generator.sample(PUNCTUATION, 5):
+                predictions += [punctuation, generator.randint(0, 8)/8]
+        words = generator.random()<0.3
+        rows.append(["Satz <mask>", "", "", *predictions, gt, "", generator.randint(1, 30), words, generator.random()<0.2, "", tier])
+    return rows
+
+def naive_counts(rows, threshold, override, max_tokens, edges):
+    # The confusion counts of every bucket, one row at a time
+    labels = get_buckets(np.array([0]), edges)[0]
+    counts = {label: {"tp": 0, "fp": 0, "fn": 0, "tn": 0} for label in labels}
+    for row in rows:
+        predictions = row[3:13]
+        score = 0.0
+        for k in range(5):
+            if simplify_pred(predictions[2*k])=="question":
+                score += predictions[2*k+1] if predictions[2*k+1]!="" else 1.0
+        words, syntax, tokens = row[16], row[17], row[15]
+        forced = {"none": False, "words": words, "syntax": syntax, "words_or_syntax": words or syntax}[override]
+        forced = forced and simplify_pred(predictions[2])=="question" and (max_tokens==None or tokens<=max_tokens)
+        predicted = forced or score>=threshold
+        actual = row[13]=="question"
+        name = ("tp" if actual else "fp") if predicted else ("fn" if actual else "tn")
+        bucket = next((labels[index+1] for index, upper in enumerate(edges) if tokens<=upper), labels[-1])
+        counts["all"][name] += 1
+        counts[bucket][name] += 1
+    return counts
+
+def test_sweep_matches_a_row_by_row_evaluation(tmp_path):
+    rows = random_rows(300)
+    filename = str(tmp_path / "results.csv")
+    write_csv(rows, filename, ALL_PREDICTIONS_HEADER + ["Decided By"])
+    thresholds = np.linspace(0, 1, 9)
+    records = evaluate(load_results(filename), thresholds, [None, 10], [2, 5, 10, 20])
+    assert len(records) == 7 * 6 * len(thresholds)
+    for record in records:
+        threshold = thresholds[round(record["threshold"]*8)]
+        expected = naive_counts(rows, threshold, record["override"], record["override_max_tokens"], [2, 5, 10, 20])[record["bucket"]]
+        assert {name: record[name] for name in expected} == expected
+    # A row decided by the cascade has no score, its label counts as sure
+    decided = [row for row in rows if row[-1]!="model"]
+    write_csv(decided, filename, ALL_PREDICTIONS_HEADER + ["Decided By"])
+    record = evaluate(load_results(filename), np.array([1.0]), [None], [2], overrides=["none"])[0]
+    assert (record["tp"], record["fp"]) == (sum(row[3]=="?" and row[13]=="question" for row in decided), sum(row[3]=="?" and row[13]=="EOS" for row in decided))
@@ -0,0 +1,65 @@
+import json
+import time
+import pstats
+from helpers.instrumentation import Instrumentation, InferenceTimer, bucket_label, count_rows
+
+def slow_rows(count, seconds):
+    for index in range(count):
+        time.sleep(seconds)
+        yield index
+
+def slow_rows_after(rows, seconds):
+    for row in rows:
+        time.sleep(seconds)
+        yield row
+
+def test_exclusive_time_of_chained_stages(tmp_path):
+    metrics = Instrumentation(interval=None)
+    rows = metrics.track("read", slow_rows(5, 0.02))
+    rows = metrics.track("double", (row*2 for row in slow_rows_after(rows, 0.01)), upstream="read")
+    assert metrics.measure("write", lambda: len(list(rows)), upstream="double") == 5
+
+    stages = metrics.write(str(tmp_path / "metrics.json"), config={"model": "tiny"})["stages"]
+    assert [stages[name]["rows_out"] for name in ("read", "double", "write")] == [5, 5, 5]
+    assert (stages["read"]["rows_in"], stages["double"]["rows_in"]) == (None, 5)
+    # The time of a stage includes its upstream, its exclusive time doesn't
+    assert stages["double"]["wall_seconds"] >= 0.15
+    assert 0.05 <= stages["double"]["exclusive_wall_seconds"] < 0.1
+    assert stages["read"]["exclusive_wall_seconds"] == stages["read"]["wall_seconds"] >= 0.1
+    with open(tmp_path / "metrics.json") as file_in:
+        assert json.load(file_in)["config"] == {"model": "tiny"}
+
+def test_inference_histogram():
+    timer = InferenceTimer(slowest=2)
+    timer.record([5, 8], 0.2, ["kurz", "acht Token"])
+    timer.record([600], 1.0, ["sehr lang"])
+    other = InferenceTimer(slowest=2)
+    other.record([9, 12, 16], 0.3, ["a", "b", "c"])
+    timer.merge(other)
+
+    report = timer.to_dict()
+    assert (report["batches"], report["seconds"]) == (3, 1.5)
+    assert [(bucket["tokens"], bucket["sentences"]) for bucket in report["histogram"]] == [("1-8", 2), ("9-16", 3), (">512", 1)]
+    assert report["histogram"][0]["ms_per_sentence"] == 100
+    assert [(batch["max_tokens"], batch["longest_sentence"]) for batch in report["slowest_batches"]] == [(600, "sehr lang"), (8, "acht Token")]
+
+def test_bucket_label():
+    assert [bucket_label(length) for length in (1, 8, 9, 512, 513)] == ["1-8", "1-8", "9-16", "257-512", ">512"]
+
+def test_count_rows(tmp_path):
+    filename = tmp_path / "rows.csv"
+    filename.write_text("Utterance\nHallo\nWie geht es?\n")
+    assert count_rows(str(filename)) == 2
+    filename.write_text("")
+    assert count_rows(str(filename)) == 0
+
+def test_metrics_and_profile_of_a_run(run_pipeline, tmp_path):
+    rows, output = run_pipeline("--no-cache", "--metrics-file", str(tmp_path / "metrics.json"), "--profile", "cprofile", "--profile-start", "2", "--profile-rows", "3")
+    assert "Profiling input rows 2 to 5" in output
+    assert pstats.Stats(str(tmp_path / "input_profile.prof")).total_calls > 0
+    with open(tmp_path / "metrics.json") as file_in:
+        metrics = json.load(file_in)
+    assert metrics["stages"]["write"]["rows_out"] == len(rows) - 1
+    assert metrics["stages"]["segmentation"]["rows_in"] == metrics["stages"]["read"]["rows_out"]
+    assert sum(bucket["sentences"] for bucket in metrics["inference"]["histogram"]) > 0
+    assert metrics["config"]["model"] != None
@@ -0,0 +1,65 @@
+import sys
+import subprocess
+import numpy as np
+import pytest
+from helpers.logistic_head import LogisticHead, get_head_id
+from helpers.mask_embeddings import get_source, get_mismatch
+from helpers.head_scoring import load_head_scorer
+from helpers.csv_io import SCORE_COLUMNS
+from conftest import CODE_DIR
+
+SOURCE = get_source("uklfr/gottbert-base", "eager", 254, 254)
+
+def train_head():
+    random = np.random.default_rng(0)
+    features = random.standard_normal((200, 8)).astype(np.float16)
+    targets = np.where(features[:, 0]>0, "question", "EOS")
+    return LogisticHead(["EOS", "question"], source=SOURCE).fit(features, targets, epochs=30, learning_rate=0.05), features, targets
+
+def test_head_learns_a_separable_label():
+    head, features, targets = train_head()
+    assert (head.predict(features)==targets).mean() > 0.95
+
+def test_saved_head_keeps_its_predictions_and_source(tmp_path):
+    head, features, targets = train_head()
+    filename = str(tmp_path / "head.npz")
+    head.save(filename)
+    loaded = LogisticHead.load(filename)
+    assert loaded.labels == head.labels
+    assert loaded.source == SOURCE
+    assert np.array_equal(loaded.predict_proba(features), head.predict_proba(features))
+    assert get_head_id(filename) == get_head_id(filename)
+
+def test_mismatch_of_the_source():
+    assert get_mismatch({"source": SOURCE}, SOURCE) == None
+    assert get_mismatch({}, SOURCE) == "the source is unknown"
+    other = get_source("uklfr/gottbert-base", "int8", 254, 64)
+    assert get_mismatch({"source": SOURCE}, other) == 'backend "eager" instead of "int8", right_context 254 instead of 64'
+
+def save_head(filename, source, hidden_size=32):
+    # A head on the hidden states of the tiny model
+    random = np.random.default_rng(0)
+    features = random.standard_normal((50, hidden_size)).astype(np.float16)
+    targets = np.where(features[:, 0]>0, "question", "EOS")
+    LogisticHead(["EOS", "question"], source=source).fit(features, targets, epochs=5).save(filename)
+    return filename
+
+def test_head_of_another_source_is_refused(tmp_path, fill_mask):
+    filename = save_head(str(tmp_path / "head.npz"), SOURCE)
+    assert load_head_scorer(filename, fill_mask.model, fill_mask.tokenizer, SOURCE).head.source == SOURCE
+    with pytest.raises(ValueError, match="was trained on other hidden states"):
+        load_head_scorer(filename, fill_mask.model, fill_mask.tokenizer, get_source("uklfr/gottbert-base", "int8", 254, 254))
+
+def test_pipeline_scores_with_the_head_of_its_source(run_pipeline, tiny_model, analyzer, tmp_path):
+    filename = save_head(str(tmp_path / "head.npz"), get_source(tiny_model, "eager", 254, 254))
+    rows = run_pipeline("--no-cache", "--scoring", "head", "--head-file", filename)[0]
+    assert rows[0][-len(SCORE_COLUMNS):] == SCORE_COLUMNS
+    for row in rows[1:]:
+        assert row[3] in ("?", ".")
+        assert float(row[-2]) + float(row[-1]) == pytest.approx(1, abs=1e-3)
+
+    # The same head with another context window of the pipeline
+    result = subprocess.run([sys.executable, "pipeline.py", "--input", str(tmp_path / "input.csv"), "--model", tiny_model, "--analyzer-url", analyzer,
+                             "--no-cache", "--scoring", "head", "--head-file", filename, "--left-context", "64"], cwd=CODE_DIR, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "was trained on other hidden states (left_context 254 instead of 64)" in result.stderr
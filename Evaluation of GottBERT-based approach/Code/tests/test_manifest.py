@@ -0,0 +1,53 @@
+from collections import deque
+from helpers.manifest import Manifest
+
+UTTERANCES = ["Hallo zusammen", "Wie geht es dir? Gut.", "Bis morgen!"]
+
+def run(filename, config_id, utterances):
+    # One incremental run: scan the input, store one row per new utterance, prune and return the number of new utterances
+    manifest = Manifest(filename, config_id)
+    keys, new = manifest.scan([[utterance] for utterance in utterances])
+    owners = deque(new.keys())
+    manifest.put_rows(([utterance, config_id] for utterance in new.values()), owners, list(new.keys()))
+    manifest.prune(keys)
+    rows = list(manifest.get_rows(keys))
+    manifest.close()
+    return len(new), manifest.removed, rows
+
+def test_known_rows_are_not_processed_again(tmp_path):
+    filename = str(tmp_path / "manifest.sqlite")
+    assert run(filename, "a", UTTERANCES)[0]==3
+    new, removed, rows = run(filename, "a", UTTERANCES)
+    assert (new, removed) == (0, 0)
+    assert rows == [[utterance, "a"] for utterance in UTTERANCES]
+
+def test_edited_rows_are_pruned(tmp_path):
+    filename = str(tmp_path / "manifest.sqlite")
+    run(filename, "a", UTTERANCES)
+    new, removed, rows = run(filename, "a", UTTERANCES[:2] + ["Bis übermorgen!"])
+    assert (new, removed) == (1, 1)
+    assert rows[-1] == ["Bis übermorgen!", "a"]
+
+def test_switching_configurations_keeps_their_results(tmp_path):
+    filename = str(tmp_path / "manifest.sqlite")
+    run(filename, "default", UTTERANCES)
+    new, removed, rows = run(filename, "cascade", UTTERANCES)
+    assert (new, removed) == (3, 0)
+    new, removed, rows = run(filename, "default", UTTERANCES)
+    assert (new, removed) == (0, 0)
+    assert rows == [[utterance, "default"] for utterance in UTTERANCES]
+
+def test_results_without_configuration(tmp_path):
+    ''' The results of a manifest written before the configuration was stored are adopted, not removed '''
+
+    import sqlite3
+    filename = str(tmp_path / "manifest.sqlite")
+    run(filename, "a", UTTERANCES)
+    connection = sqlite3.connect(filename)
+    connection.execute("UPDATE results SET config_id=NULL")
+    connection.commit()
+    connection.close()
+    new, removed, rows = run(filename, "a", UTTERANCES)
+    assert (new, removed) == (0, 0)
+    assert run(filename, "b", UTTERANCES[:1])[1] == 0
+    assert run(filename, "a", UTTERANCES)[0] == 0
@@ -0,0 +1,109 @@
+import os
+import re
+import sys
+import shutil
+import subprocess
+import pytest
+from conftest import CODE_DIR
+
+def assert_same_rows(rows, expected):
+    # The scores can differ by rounding errors when the sentences are batched differently
+    assert len(rows) == len(expected)
+    for row, expected_row in zip(rows, expected):
+        assert len(row) == len(expected_row)
+        for value, expected_value in zip(row, expected_row):
+            if value!=expected_value:
+                assert float(value) == pytest.approx(float(expected_value), abs=1e-5)
+
+def count_new(output):
+    return int(re.search(r"(\d+) new or changed utterances of", output).group(1))
+
+def test_model_is_part_of_the_configuration(run_pipeline, tiny_model, tmp_path):
+    rows, output = run_pipeline("--incremental")
+    assert count_new(output) > 0
+    assert count_new(run_pipeline("--incremental")[1]) == 0
+    # Another model: its results are neither taken from the manifest nor from the cache
+    other_model = str(tmp_path / "other")
+    shutil.copytree(tiny_model, other_model)
+    other_rows, output = run_pipeline("--incremental", model=other_model)
+    assert count_new(output) > 0
+    assert "Prediction cache: 0 hits" in output
+    assert other_rows == rows
+
+def test_streaming_matches_stepwise(run_pipeline):
+    rows = run_pipeline("--no-cache")[0]
+    assert len(rows) > 1
+    assert run_pipeline("--no-cache", "--streaming", input="streaming.csv")[0] == rows
+
+def test_concurrent_stages_match_stepwise(run_pipeline):
+    rows = run_pipeline("--no-cache")[0]
+    concurrent_rows, output = run_pipeline("--no-cache", "--streaming", "--concurrent", "--queue-size", "1", input="concurrent.csv")
+    assert "simplification (thread): " + str(len(rows) - 1) + " rows" in output
+    assert concurrent_rows == rows
+
+def test_cached_predictions_match(run_pipeline):
+    rows, output = run_pipeline()
+    assert "Prediction cache: 0 hits" in output
+    cached_rows, output = run_pipeline()
+    assert re.search(r"Prediction cache: \d+ hits, 0 misses", output)
+    assert cached_rows == rows
+
+def test_workers_match_a_single_process(run_pipeline):
+    rows = run_pipeline("--no-cache")[0]
+    parallel_rows, output = run_pipeline("--no-cache", "--workers", "2", input="workers.csv")
+    # Every worker predicts one shard of each window
+    counts = [int(count) for count in re.findall(r"Worker \d+: (\d+) sentences", output)]
+    assert len(counts) == 2 and min(counts) > 0
+    assert_same_rows(parallel_rows, rows)
+
+def test_incremental_run_of_an_edited_input(run_pipeline, tmp_path):
+    run_pipeline("--incremental")
+    # One utterance is edited and one is appended
+    utterances = (tmp_path / "input.csv").read_text(encoding='utf-8').replace("Tschüss", "Tschüss bis bald!") + "Wo wohnst du?\n"
+    (tmp_path / "input.csv").write_text(utterances, encoding='utf-8')
+    rows, output = run_pipeline("--incremental")
+    assert count_new(output) == 2
+    assert "1 old results removed" in output
+    # The same results as a full run on the edited input
+    (tmp_path / "full.csv").write_text(utterances, encoding='utf-8')
+    assert_same_rows(rows, run_pipeline("--no-cache", input="full.csv")[0])
+
+def test_probabilities_are_aligned_with_the_rows(run_pipeline, tmp_path):
+    import numpy as np
+    from helpers.probability_store import load_probabilities
+    filename = str(tmp_path / "probabilities.f16")
+    rows = run_pipeline("--no-cache", "--scoring", "punctuation", "--probabilities-file", filename)[0]
+    probabilities, metadata = load_probabilities(filename)
+    assert len(probabilities) == len(rows) - 1
+    is_question = np.array(metadata["labels"])=="question"
+    p_question = rows[0].index("P(question)")
+    for row, row_probabilities in zip(rows[1:], probabilities):
+        assert float(row_probabilities[is_question].astype(np.float32).sum()) == pytest.approx(float(row[p_question]), abs=1e-2)
+
+def test_token_store_matches_the_tokenizer(run_pipeline, tmp_path):
+    rows = run_pipeline("--no-cache")[0]
+    token_store = str(tmp_path / "tokens")
+    stored_rows, output = run_pipeline("--no-cache", "--token-store", token_store, input="stored.csv")
+    assert re.search(r"Token store: [1-9]\d* sentences predicted from their stored ids", output)
+    assert_same_rows(stored_rows, rows)
+
+def test_importing_the_pipeline_loads_no_model_library():
+    code = "import sys, pipeline; print(sorted(name for name in ('torch', 'transformers', 'spacy') if name in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=CODE_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_selected_stages_match_a_full_run(run_pipeline, tmp_path, tiny_model, analyzer):
+    rows = run_pipeline("--no-cache")[0]
+    filename = str(tmp_path / "input.csv")
+    os.remove(str(tmp_path / "input_allPredictions_test.csv"))
+    os.remove(str(tmp_path / "input_segmentedUtterances_maskedPredictions.csv"))
+    def run_stages(stages):
+        return subprocess.run([sys.executable, "pipeline.py", "--input", filename, "--model", tiny_model, "--analyzer-url", analyzer,
+                              "--no-cache", "--stages", stages], cwd=CODE_DIR, capture_output=True, text=True)
+    result = run_stages("simplification")
+    assert result.returncode != 0
+    assert "The simplification stage needs " + str(tmp_path / "input_segmentedUtterances_maskedPredictions.csv") + ", please run the stages before it first" in result.stderr
+    assert run_stages("segmentation").returncode == 0
+    assert not os.path.isfile(str(tmp_path / "input_segmentedUtterances_maskedPredictions.csv"))
+    assert run_stages("prediction,simplification").returncode == 0
+    assert run_pipeline("--no-cache", "--stages", "simplification")[0] == rows
@@ -0,0 +1,25 @@
+import pytest
+from helpers.predictions import make_batches, predict, predict_batch
+
+SENTENCES = ["Hallo <mask>", "Wie geht es dir <mask>", "Ich habe morgen Zeit, hast du auch Zeit und Lust auf Kino <mask>", "Tschüss <mask>",
+             "Was machst du heute Abend <mask>", "Ist das dein Auto <mask>", "Danke <mask>"]
+
+def test_batches_cover_every_sentence_once():
+    lengths = [3, 40, 7, 7, 12, 1, 90, 5]
+    batches = make_batches(lengths, max_tokens=24)
+    assert sorted(index for batch in batches for index in batch) == list(range(len(lengths)))
+    for batch in batches:
+        # A batch is within the budget, unless it's a single sentence that is longer than it
+        assert len(batch)*max(lengths[index] for index in batch) <= 24 or len(batch)==1
+    # The batches are sorted by length
+    assert [lengths[index] for batch in batches for index in batch] == sorted(lengths)
+
+@pytest.mark.parametrize("max_tokens, window_size", [(4096, 1024), (40, 3), (1, 2)])
+def test_rows_keep_the_order_of_the_input(fill_mask, max_tokens, window_size):
+    rows = list(predict_batch(fill_mask, SENTENCES, max_tokens=max_tokens, window_size=window_size))
+    assert len(rows) == len(SENTENCES)
+    for row, sentence in zip(rows, SENTENCES):
+        expected = predict(fill_mask, sentence)
+        # The padding of a batch changes the scores only by rounding errors
+        assert row[0::2] == expected[0::2]
+        assert row[1::2] == pytest.approx(expected[1::2], abs=1e-4)
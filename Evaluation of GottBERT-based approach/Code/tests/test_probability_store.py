@@ -0,0 +1,22 @@
+import numpy as np
+from helpers.probability_store import ProbabilityWriter, load_probabilities
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / "probabilities.f16")
+    writer = ProbabilityWriter(filename, [".", "?", "!"], ["EOS", "question", "EOS"], "model", buffer_rows=2)
+    rows = [["Hallo <mask>", [0.5, 0.25, 0.25]], ["Wie <mask>", None], ["Was <mask>", [0.0, 1.0, 0.0]]]
+    assert list(writer.strip_rows(rows, 1)) == [["Hallo <mask>"], ["Wie <mask>"], ["Was <mask>"]]
+    writer.close()
+
+    probabilities, metadata = load_probabilities(filename)
+    assert (metadata["rows"], metadata["candidates"], metadata["model"]) == (3, [".", "?", "!"], "model")
+    assert probabilities.dtype == np.float16 and probabilities.shape == (3, 3)
+    assert probabilities[0].tolist() == [0.5, 0.25, 0.25]
+    # The row without probabilities keeps the others aligned
+    assert np.isnan(probabilities[1]).all()
+    assert probabilities[2].tolist() == [0.0, 1.0, 0.0]
+
+def test_empty_store(tmp_path):
+    filename = str(tmp_path / "probabilities.f16")
+    ProbabilityWriter(filename, [".", "?"], ["EOS", "question"]).close()
+    assert load_probabilities(filename)[0].shape == (0, 2)
@@ -0,0 +1,36 @@
+import pytest
+import torch
+from transformers import AutoTokenizer, AutoModelForMaskedLM, BertConfig, BertForMaskedLM
+from helpers.context_window import ContextWindow
+from helpers.punctuation_scoring import mask_hidden_states, PunctuationScorer
+
+@pytest.fixture(scope="module")
+def model(tiny_model):
+    return AutoModelForMaskedLM.from_pretrained(tiny_model).eval(), AutoTokenizer.from_pretrained(tiny_model)
+
+def test_cut_off_mask_is_kept(model):
+    model, tokenizer = model
+    sentence = "Hallo " * 600 + "wie geht es dir<mask>"
+    # The <mask> is beyond the 512 tokens of the model, so the sentence is cut around it instead of scoring <s>
+    assert (tokenizer([sentence], truncation=True)["input_ids"][0]).count(tokenizer.mask_token_id) == 0
+    cut = ContextWindow(tokenizer, 254, 255).apply([sentence])[0]
+    states = mask_hidden_states(model, tokenizer, ["Wie geht es dir<mask>", sentence])
+    assert torch.allclose(states[1], mask_hidden_states(model, tokenizer, [cut])[0], atol=1e-5)
+
+def test_sentence_without_mask(model):
+    model, tokenizer = model
+    with pytest.raises(ValueError, match="has no <mask>"):
+        mask_hidden_states(model, tokenizer, ["Hallo " * 600])
+
+def test_scorer_needs_a_roberta_head(model):
+    tokenizer = model[1]
+    config = BertConfig(vocab_size=len(tokenizer), hidden_size=32, num_hidden_layers=1, num_attention_heads=2, intermediate_size=64)
+    with pytest.raises(ValueError, match="--scoring topk"):
+        PunctuationScorer(BertForMaskedLM(config), tokenizer)
+
+def test_scores_sum_to_one(model):
+    scorer = PunctuationScorer(*model)
+    rows = scorer.predict_rows(["Hallo<mask>", "Wie geht es dir<mask>"], max_tokens=4096)
+    for row in rows:
+        assert len(row) == 12
+        assert row[10] + row[11] <= 1 + 1e-6
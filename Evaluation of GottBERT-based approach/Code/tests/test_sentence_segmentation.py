@@ -0,0 +1,21 @@
+import pytest
+from pipeline import load_segmentation_model
+from helpers.sentence_segmentation import segment_utterance, segment_utterances, segment_rows, filter_sentences
+
+UTTERANCES = ["Hi! Wie geht es dir?", ":D", "Ich habe morgen Zeit... Hast du Zeit?", "???", "Das ist gut. :D Bis morgen."]
+
+@pytest.fixture(scope="module")
+def model():
+    return load_segmentation_model()
+
+@pytest.mark.parametrize("batch_size, n_process", [(1000, 1), (2, 1), (2, 2)])
+def test_pipe_gives_the_sentences_of_each_utterance(model, batch_size, n_process):
+    expected = [filter_sentences([sentence.text for sentence in segment_utterance(utterance, model)]) for utterance in UTTERANCES]
+    assert list(segment_utterances(iter(UTTERANCES * 3), model, batch_size, n_process)) == expected * 3
+    assert expected[0] == ["Hi!", "Wie geht es dir?"]
+    # The utterances without alphanumeric characters have no sentences
+    assert expected[1] == [] and expected[3] == []
+
+def test_numbered_rows(model):
+    rows = list(segment_rows([["Hi! Wie geht es dir?"], [], ["Danke"]], model, numbered=True))
+    assert rows == [["Hi!", 0], ["Wie geht es dir?", 1], ["Danke", 0]]
@@ -0,0 +1,30 @@
+from helpers.simplify_predictions import simplify_rows, NOT_CHECKED
+
+class FakeChecker:
+    ''' Answers like the sentence analyzer: question words in every sentence '''
+
+    def __init__(self):
+        self.sentences = []
+
+    def analyze_many(self, sentences):
+        self.sentences += sentences
+        return [{"containsQuestionWords": True, "containsQuestionSyntax": False} for sentence in sentences]
+
+def make_row(sentence, prediction, prediction2):
+    return [sentence, "?", "?", prediction, "0.5", prediction2, "0.2", ".", "0.1", "!", "0.1", ",", "0.1"]
+
+ROWS = [make_row("Wie geht es <mask>", ".", "?"), make_row("Hallo <mask>", "!", ".")]
+
+def test_unchecked_rows_are_marked():
+    checker = FakeChecker()
+    rows = list(simplify_rows(ROWS, checker, check_all=False))
+    # Only the first row can change its label, so only it is sent to the analyzer
+    assert checker.sentences == ["Wie geht es <mask>"]
+    assert rows[0][16:19] == [True, False, "question"]
+    assert rows[1][16:19] == [NOT_CHECKED, NOT_CHECKED, "EOS"]
+
+def test_every_row_is_checked_by_default():
+    checker = FakeChecker()
+    rows = list(simplify_rows(ROWS, checker))
+    assert len(checker.sentences) == 2
+    assert rows[1][16:19] == [True, False, "EOS"]
@@ -0,0 +1,47 @@
+import json
+import pytest
+from helpers import token_store
+from helpers.predictions import run_batches
+from helpers.token_store import build_store, open_store, get_store_dir, PretokenizedPredictor
+
+SENTENCES = ["Hallo <mask>", "Wie geht es dir <mask>", "Hallo <mask>", "Ich habe morgen Zeit, hast du auch Zeit <mask>", "Tschüss <mask>"]
+
+def test_stored_ids_match_the_tokenizer(fill_mask, tmp_path):
+    assert open_store(str(tmp_path), fill_mask.tokenizer) == None
+    # The duplicate sentence is stored once
+    assert build_store(str(tmp_path), iter(SENTENCES), fill_mask.tokenizer, batch_size=2) == 4
+    store = open_store(str(tmp_path), fill_mask.tokenizer)
+    for sentence in SENTENCES:
+        row = store.find(sentence)
+        ids = fill_mask.tokenizer(sentence)["input_ids"]
+        assert store.get_ids(row).tolist() == ids
+        assert store.length(row) == len(ids)
+        assert ids[store.masks[row]] == fill_mask.tokenizer.mask_token_id
+    assert store.find("Nicht gespeichert <mask>") == None
+
+def test_predictions_from_the_stored_ids(fill_mask, tmp_path):
+    build_store(str(tmp_path), SENTENCES[:3], fill_mask.tokenizer)
+    predictor = PretokenizedPredictor(fill_mask, open_store(str(tmp_path), fill_mask.tokenizer))
+    rows = predictor.predict_rows(SENTENCES, max_tokens=4096)
+    assert (predictor.hits, predictor.misses) == (3, 2)
+    for row, expected in zip(rows, run_batches(fill_mask, SENTENCES, max_tokens=4096)):
+        assert row[0::2] == expected[0::2]
+        assert row[1::2] == pytest.approx(expected[1::2], abs=1e-4)
+
+def test_sentences_with_the_same_hash(fill_mask, tmp_path, monkeypatch):
+    # With a single hash for every sentence, they are told apart by their texts
+    monkeypatch.setattr(token_store, "get_hash", lambda text: 7)
+    build_store(str(tmp_path), SENTENCES, fill_mask.tokenizer)
+    store = open_store(str(tmp_path), fill_mask.tokenizer)
+    assert [store.find(sentence) for sentence in SENTENCES] == [0, 1, 0, 2, 3]
+    assert store.find("Nicht gespeichert <mask>") == None
+
+def test_store_of_another_format_is_ignored(fill_mask, tmp_path):
+    build_store(str(tmp_path), SENTENCES, fill_mask.tokenizer)
+    filename = get_store_dir(str(tmp_path), fill_mask.tokenizer) + "/metadata.json"
+    with open(filename, encoding='utf-8') as file_in:
+        metadata = json.load(file_in)
+    del metadata["format"]
+    with open(filename, 'w', encoding='utf-8') as file_out:
+        json.dump(metadata, file_out)
+    assert open_store(str(tmp_path), fill_mask.tokenizer) == None
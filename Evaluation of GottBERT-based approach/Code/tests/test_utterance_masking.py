@@ -0,0 +1,38 @@
+import pytest
+from transformers import AutoTokenizer, AutoModelForMaskedLM
+from helpers.context_window import ContextWindow
+from helpers.deduplication import normalized_key
+from helpers.punctuation_scoring import PunctuationScorer
+from helpers.utterance_masking import SEPARATOR, UtterancePredictor, mask_utterances
+
+UTTERANCES = [["Hallo!"], ["Hi!", "Wie geht es dir?"], ["Ich habe morgen Zeit.", "Hast du Zeit?", "Bis morgen."]]
+
+@pytest.fixture(scope="module")
+def scorer(tiny_model):
+    return PunctuationScorer(AutoModelForMaskedLM.from_pretrained(tiny_model), AutoTokenizer.from_pretrained(tiny_model))
+
+def test_separator_is_kept_by_split_and_normalization():
+    text, rows = next(mask_utterances([["Hi!", "Wie geht es dir?"]]))
+    assert text.split(SEPARATOR) == [row[0] for row in rows]
+    assert "<mask>" + SEPARATOR + "Wie" in text.split()
+    assert normalized_key(text).count(SEPARATOR) == 1
+
+def test_rows_are_split_back_into_sentences(scorer):
+    texts = [text for text, rows in mask_utterances(UTTERANCES)]
+    predictor = UtterancePredictor(scorer, ContextWindow(scorer.tokenizer))
+    rows = predictor.predict_rows(texts, max_tokens=4096)
+    assert [len(utterance_rows) for utterance_rows in rows] == [1, 2, 3]
+    assert all(len(row)==12 for utterance_rows in rows for row in utterance_rows)
+    assert predictor.to_dict() == {"utterances": 3, "fallbacks": 0, "cut": 0}
+
+def test_long_utterances_fall_back_to_sentences(scorer):
+    utterances = [["Hi!"], ["Ich habe morgen Zeit.", "Hast du Zeit?", "Bis morgen."], ["Was ist <mask>?", "Gut."]]
+    texts = [text for text, rows in mask_utterances(utterances)]
+    context = ContextWindow(scorer.tokenizer, 4, 4)
+    predictor = UtterancePredictor(scorer, context)
+    rows = predictor.predict_rows(texts, max_tokens=4096)
+    # The second utterance is longer than the 9 tokens of the window, the third one has one <mask> too many
+    assert predictor.to_dict() == {"utterances": 3, "fallbacks": 2, "cut": 1}
+    sentences = texts[1].split(SEPARATOR)
+    assert rows[1] == scorer.predict_rows(ContextWindow(scorer.tokenizer, 4, 4).apply(sentences), max_tokens=4096)
+    assert len(rows[2]) == 2
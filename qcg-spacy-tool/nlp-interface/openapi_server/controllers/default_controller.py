@@ -1,6 +1,7 @@
 import connexion
 import sys
 from openapi_server import util
+from openapi_server.error_management.errors import ServiceUnavailableProblem
 
 import logging
 logger = logging.getLogger(__name__)
@@ -183,3 +184,52 @@ def post_text_to_graph(body):  # noqa: E501
         logger.debug("Using analysis to return the result of text_to_graph")
         dep_graph = analysis.convert_text_to_graph(text, lang)
         return dep_graph, 200
+
+
+def get_analyze_text(text):  # noqa: E501
+    """Get the question analysis of a German text
+
+    Find the question words and the question syntax of each sentence of a German text, with the same results as the analyze-text endpoint of the qcg-sentence-analyzer # noqa: E501
+
+    :param text: The German text that will be analyzed
+    :type text: str
+
+    :rvalue results: One result per sentence
+    :rtype: list
+    """
+
+    # Use analyze_text of the question_analysis module, with the German model of the analysis module
+    try: 
+        from tool.services import analysis, question_analysis
+    except:
+        logger.error("Unexpected error: "+str(sys.exc_info()))
+        return "", 500
+    else:
+        logger.debug("Using question_analysis to return the result of analyze_text")
+        results = question_analysis.analyze_text(text, analysis.nlp_models['de'])
+        return results, 200
+
+
+def get_classify(text):  # noqa: E501
+    """Classify a German sentence as a question or not
+
+    Predict the ending punctuation of a German sentence with the GottBERT model and convert it to 'question', 'EOS' or 'other', as in the pipeline of the GottBERT-based approach. The concurrent requests are run as one batch of the model # noqa: E501
+
+    :param text: The German sentence that will be classified
+    :type text: str
+
+    :rvalue result: The label of the sentence, the predictions of the model and their scores
+    :rtype: dict
+    """
+
+    # Use classify of the classification module, which collects the concurrent requests into batches.
+    # It needs the helpers of the GottBERT-based approach, which are an optional dependency of the tool
+    try: 
+        from tool.services import classification
+    except ImportError as e:
+        logger.error("Unexpected error: "+str(sys.exc_info()))
+        raise ServiceUnavailableProblem(detail="The classifier is not installed ("+str(e)+"). Please install the helpers of the GottBERT-based approach: pip install \"Evaluation of GottBERT-based approach/Code[model]\"", type="CLASSIFIER_UNAVAILABLE")
+    else:
+        logger.debug("Using classification to return the result of classify")
+        result = classification.classify(text)
+        return result, 200
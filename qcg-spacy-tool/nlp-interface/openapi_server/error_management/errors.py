@@ -4,3 +4,8 @@ class BadRequestProblem(ProblemException):
 
     def __init__(self, type=None, title='Bad Request', detail=None):
         super(BadRequestProblem, self).__init__(type=type, status=400, title=title, detail=detail)
+
+class ServiceUnavailableProblem(ProblemException):
+
+    def __init__(self, type=None, title='Service Unavailable', detail=None):
+        super(ServiceUnavailableProblem, self).__init__(type=type, status=503, title=title, detail=detail)
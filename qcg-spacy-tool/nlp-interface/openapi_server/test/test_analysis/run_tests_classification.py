@@ -0,0 +1,197 @@
+# coding: utf-8
+
+# must run from the current folder
+
+import time
+import tempfile
+import unittest
+import threading
+from unittest import mock
+from tool.services import classification
+from tool.services.classification import MicroBatcher, Classifier, load_predictor, classify_texts
+from openapi_server.error_management.errors import BadRequestProblem, ServiceUnavailableProblem
+# The helpers of the GottBERT-based approach are a dependency of the classifier (pip install "Evaluation of GottBERT-based approach/Code[model]")
+from gottbert_helpers.offline import save_tiny_model
+from gottbert_helpers.predictions import predict_batch
+from gottbert_helpers.punctuation_replacement import remove_punctuation
+from gottbert_helpers.simplify_predictions import simplify_pred
+
+# Sentences of chat messages (the tiny model is trained on them, its predictions are meaningless but deterministic)
+TEXTS = [
+    "Hast du morgen Zeit?",
+    "Wie viele Leute kommen morgen?",
+    "Ich komme auch.",
+    "hallo",
+    "Das ist ein Satz!",
+    "Kommst du :)",
+]
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_concurrent_calls(self):
+        """
+        Checks if concurrent calls are processed in one batch and every caller gets the result of its own item
+        """
+
+        batches = []
+        def function(items):
+            batches.append(list(items))
+            return [item*2 for item in items]
+
+        batcher = MicroBatcher(function, max_batch_size=100, max_latency=0.5)
+        results = {}
+        def call(item):
+            results[item] = batcher(item)
+        threads = [threading.Thread(target=call, args=(item,)) for item in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.close()
+
+        self.assertEqual(results, {item: item*2 for item in range(20)})
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batcher.batches, 1)
+        self.assertEqual(batcher.items, 20)
+
+    def test_max_batch_size(self):
+        """
+        Checks if the batches are not bigger than max_batch_size and keep the order of the items
+        """
+
+        batches = []
+        def function(items):
+            batches.append(list(items))
+            return items
+
+        batcher = MicroBatcher(function, max_batch_size=4, max_latency=0.5)
+        futures = [batcher.submit(item) for item in range(10)]
+        self.assertEqual([future.result(5) for future in futures], list(range(10)))
+        batcher.close()
+        self.assertEqual(batches, [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+
+    def test_max_latency(self):
+        """
+        Checks if a single call doesn't wait much longer than max_latency for other calls
+        """
+
+        batcher = MicroBatcher(lambda items: items, max_batch_size=32, max_latency=0.05)
+        start = time.perf_counter()
+        self.assertEqual(batcher("a"), "a")
+        self.assertLess(time.perf_counter()-start, 1)
+        batcher.close()
+
+    def test_exception(self):
+        """
+        Checks if an exception of the function is raised to every caller of the batch, and the next batches still work
+        """
+
+        def function(items):
+            if "error" in items:
+                raise ValueError("error")
+            return items
+
+        batcher = MicroBatcher(function, max_batch_size=2, max_latency=0.5)
+        futures = [batcher.submit(item) for item in ["a", "error", "b"]]
+        for future in futures[:2]:
+            self.assertRaises(ValueError, future.result, 5)
+        self.assertEqual(futures[2].result(5), "b")
+        batcher.close()
+
+class TestClassification(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        model = save_tiny_model(cls.directory.name+'/tiny', TEXTS*20)
+        cls.predictor = load_predictor(model, scoring='topk')
+        cls.scorer = load_predictor(model, scoring='punctuation')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_classify_texts(self):
+        """
+        Checks if the label of each sentence is the simplified prediction of its masked sentence, as in the pipeline
+        """
+
+        results = classify_texts(TEXTS, self.predictor)
+        self.assertEqual([result["text"] for result in results], TEXTS)
+        for text, result in zip(TEXTS, results):
+            row = list(predict_batch(self.predictor, [remove_punctuation(text)[0]]))[0]
+            self.assertEqual(result["predictedLabel"], simplify_pred(row[0], row[2]))
+            self.assertEqual(result["label"], result["predictedLabel"])
+            self.assertEqual(result["predictions"][0], {"token": row[0], "score": row[1]})
+            self.assertIsNone(result["questionScore"])
+
+    def test_punctuation_scores(self):
+        """
+        Checks if the punctuation scoring adds the probabilities of the labels
+        """
+
+        for result in classify_texts(TEXTS, self.scorer):
+            self.assertGreaterEqual(result["questionScore"], 0)
+            self.assertLessEqual(result["questionScore"]+result["eosScore"], 1.0001)
+
+    def test_classifier(self):
+        """
+        Checks if the concurrent requests of the classifier get the same labels and predictions as the classification of all the sentences at once
+        """
+
+        classifier = Classifier(self.predictor, max_batch_size=4, max_latency=0.1)
+        results = [None] * len(TEXTS)
+        def call(index):
+            results[index] = classifier.classify(TEXTS[index])
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(len(TEXTS))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        classifier.close()
+
+        # The scores can differ in the last digits, because the sentences are padded differently in other batches
+        expected = classify_texts(TEXTS, self.predictor)
+        self.assertEqual([result["label"] for result in results], [result["label"] for result in expected])
+        self.assertEqual([[prediction["token"] for prediction in result["predictions"]] for result in results],
+                         [[prediction["token"] for prediction in result["predictions"]] for result in expected])
+        self.assertLess(classifier.batcher.batches, len(TEXTS))
+
+    def test_empty_text(self):
+        """
+        Checks if an empty text is a bad request
+        """
+
+        classifier = Classifier(self.predictor)
+        self.assertRaises(BadRequestProblem, classifier.classify, "  ")
+        classifier.close()
+
+class TestUnavailableClassifier(unittest.TestCase):
+
+    def test_loading_error(self):
+        """
+        Checks if a classifier that can't be loaded (e.g. without transformers) is a service unavailable problem, and is loaded again by the next request
+        """
+
+        with mock.patch.object(classification, "load_predictor", side_effect=ImportError("No module named 'transformers'")), \
+             mock.patch.dict(classification.options, {"syntax": False}):
+            with self.assertRaises(ServiceUnavailableProblem) as context:
+                classification.classify("Hast du Zeit?")
+        self.assertEqual(context.exception.status, 503)
+        self.assertIn("transformers", context.exception.detail)
+        self.assertIsNone(classification.classifier)
+
+    def test_unknown_scoring(self):
+        """
+        Checks if a scoring of the pipeline that the classifier doesn't have (the trained head) is refused
+        """
+
+        with self.assertRaises(ValueError) as context:
+            load_predictor(scoring='head')
+        self.assertIn("'punctuation' and 'topk'", str(context.exception))
+
+def run_tests():
+    unittest.main()
+
+if __name__=='__main__':
+    unittest.main()
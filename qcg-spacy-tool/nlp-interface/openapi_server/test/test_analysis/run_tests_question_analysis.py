@@ -0,0 +1,101 @@
+# coding: utf-8
+
+# must run from the current folder
+
+import json
+import unittest
+import sys
+import pathlib
+from tool.services.question_analysis import *
+
+try:
+    from tool.services.analysis import nlp_models, convert_text_to_conllu
+except:
+    print("Unexpected error:", sys.exc_info(), file=sys.stderr)
+
+# Texts whose analysis (with the German model) must be the same in-process and over CoNLL-U, as in the qcg-sentence-analyzer
+TEXTS = [
+    "Wie viele Leute kommen morgen?",
+    "Kommst du morgen? Ich komme auch.",
+    "Seit wann hast du das Auto?",
+    "  Wo   wohnst\tdu?  ",
+    "Das ist ein Satz.",
+]
+
+def read_data(filename):
+    with open(pathlib.Path(__file__).parent.parent.joinpath('data','de',filename), encoding='utf-8') as f:
+        return f.read()
+
+class TestQuestionAnalysis(unittest.TestCase):
+
+    def test_question_words(self):
+        """
+        Checks if the question words are found as substrings of the lowercased sentence, in the order of the analyzer
+        """
+
+        self.assertEqual(find_question_words("Wie viele Leute kommen ?"), ["wie", "wie viel", "wie viele"])
+        self.assertEqual(find_question_words("Seit wann ?"), ["seit wann", "wann"])
+        self.assertEqual(find_question_words("Das ist ein Satz ."), [])
+
+    def test_clean_text(self):
+        """
+        Checks if the text is trimmed and its whitespace collapsed, like in the analyzer
+        """
+
+        self.assertEqual(clean_text("  Wo   wohnst\tdu?\r\n"), "Wo wohnst du?")
+        self.assertEqual(clean_text(" \n "), "")
+
+    def test_analyze_conllu(self):
+        """
+        Checks if the analysis of a CoNLL-U table gives the expected results. They are hand-written, by applying the
+        rules of SentenceAnalysisService.java of the qcg-sentence-analyzer to the tables (the question words in the
+        iteration order of its HashSet, a verb with a subject after it for the syntax); they weren't produced by the
+        Java service itself
+        """
+
+        results = analyze_conllu(read_data('conllu_questions.txt'))
+        expected = json.loads(read_data('analysis_questions_expected.json'))
+        self.assertEqual(results, expected)
+
+    def test_line_endings_in_conllu(self):
+        """
+        Checks if the analysis of a CoNLL-U table is the same for Windows-style and Unix-style line endings
+        """
+
+        results1 = analyze_conllu(read_data('conllu_Win_line_endings.txt'))
+        results2 = analyze_conllu(read_data('conllu_Unix_line_endings.txt'))
+        self.assertEqual(results1, results2)
+        self.assertEqual([result["containsQuestionSyntax"] for result in results1], [False, False])
+
+    def test_analyze_text(self):
+        """
+        Checks if the in-process analysis of a text gives the same results as the analysis of its CoNLL-U table
+        (which is what the qcg-sentence-analyzer does)
+        """
+
+        for text in TEXTS:
+            results = analyze_text(text, nlp_models['de'])
+            expected = analyze_conllu(convert_text_to_conllu(clean_text(text), 'de'))
+            self.assertEqual(results, expected, text)
+
+    def test_analyze_texts(self):
+        """
+        Checks if the batched analysis gives the same results as the analysis of each text on its own
+        """
+
+        texts = TEXTS + ["", "Wer?"]
+        results = list(analyze_texts(texts, nlp_models['de'], batch_size=2))
+        self.assertEqual(results, [analyze_text(text, nlp_models['de']) for text in texts])
+
+    def test_empty_text(self):
+        """
+        Check if the analysis of an empty text has no results, like in the analyzer
+        """
+
+        self.assertEqual(analyze_text("  ", nlp_models['de']), [])
+
+def run_tests():
+    unittest.main()
+
+if __name__=='__main__':
+    unittest.main()
@@ -1,8 +1,14 @@
 import unittest
-from openapi_server.test.test_analysis import run_tests_de, run_tests_en
+from openapi_server.test.test_analysis import run_tests_de, run_tests_en, run_tests_question_analysis, run_tests_classification
 
 suite_de = unittest.TestLoader().loadTestsFromModule(run_tests_de)
 unittest.TextTestRunner(verbosity=2).run(suite_de)
 
 suite_en = unittest.TestLoader().loadTestsFromModule(run_tests_en)
-unittest.TextTestRunner(verbosity=2).run(suite_en)
\ No newline at end of file
+unittest.TextTestRunner(verbosity=2).run(suite_en)
+
+suite_question_analysis = unittest.TestLoader().loadTestsFromModule(run_tests_question_analysis)
+unittest.TextTestRunner(verbosity=2).run(suite_question_analysis)
+
+suite_classification = unittest.TestLoader().loadTestsFromModule(run_tests_classification)
+unittest.TextTestRunner(verbosity=2).run(suite_classification)
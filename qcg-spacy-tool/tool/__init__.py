@@ -2,6 +2,15 @@ import logging.config
 import yaml
 import os
 
-with open(os.path.join('tool','log_config.yaml'), 'r') as f:
+# The paths are relative to the project's directory, so that the tool can also be imported from other folders
+# (e.g. by the evaluation pipeline, for the question analysis)
+tool_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(tool_dir)
+
+with open(os.path.join(tool_dir, 'log_config.yaml'), 'r') as f:
     config = yaml.safe_load(f.read())
-    logging.config.dictConfig(config)
\ No newline at end of file
+    for handler in config['handlers'].values():
+        if 'filename' in handler and not os.path.isabs(handler['filename']):
+            handler['filename'] = os.path.join(project_dir, handler['filename'])
+            os.makedirs(os.path.dirname(handler['filename']), exist_ok=True)
+    logging.config.dictConfig(config)
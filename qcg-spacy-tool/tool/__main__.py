@@ -1,10 +1,25 @@
 from openapi_server.start_app import start_app
 import argparse
+import sys
 
 
 if __name__ == '__main__':
     # read port from command line
     parser = argparse.ArgumentParser()
     parser.add_argument("-port", type=int, default=8080, help="The port where the tool's API will be exposed")
+    # options of the classifier of the /classify endpoint
+    parser.add_argument("-classify-batch-size", type=int, default=32, help="The maximum number of sentences that the classifier runs as one batch")
+    parser.add_argument("-classify-latency", type=float, default=10, help="The maximum number of milliseconds that a sentence waits for others to fill the batch")
+    parser.add_argument("-classify-backend", choices=["eager", "int8", "onnx"], default="eager", help="The inference backend of the classifier")
+    parser.add_argument("-classify-scoring", choices=["punctuation", "topk"], default="punctuation", help="Score only the punctuation tokens ('punctuation', with P(question) and P(EOS)) or get the top-5 tokens ('topk')")
     args = parser.parse_args()
+
+    # The classifier needs the code of the GottBERT-based approach (and transformers), the other endpoints don't
+    try:
+        from tool.services import classification
+    except ImportError:
+        print("The classify endpoint is not available (it will answer 503):", sys.exc_info()[1], file=sys.stderr)
+    else:
+        classification.configure(max_batch_size=args.classify_batch_size, max_latency=args.classify_latency/1000,
+                                 backend=args.classify_backend, scoring=args.classify_scoring)
     start_app(base_path='/spacy', port=args.port)
\ No newline at end of file
@@ -0,0 +1,278 @@
+# imports for the classification of messages
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from tool.services import question_analysis
+from openapi_server.error_management.errors import *
+
+# Create a logger that will be used in this module
+logger = logging.getLogger('spacy.'+__name__)
+
+# The helpers of the GottBERT-based approach (the model and the rules of its pipeline.py) are installed as the
+# gottbert_helpers package, with transformers and torch in its 'model' extra:
+#     pip install "../Evaluation of GottBERT-based approach/Code[model]"
+# Importing these three modules doesn't import transformers or torch, only the loading of the model does
+from gottbert_helpers.predictions import predict_batch
+from gottbert_helpers.punctuation_replacement import remove_punctuation
+from gottbert_helpers.simplify_predictions import simplify_pred, needs_syntax_check, apply_syntax
+
+# The options of the classifier of the /classify endpoint, which can be changed with configure() before its first use
+options = {
+    "model": None,              # the name or the local path of the model (None: GottBERT)
+    "backend": "eager",         # one of the backends of the pipeline ('eager', 'int8' or 'onnx')
+    "scoring": "punctuation",   # 'punctuation' (with P(question) and P(EOS)) or 'topk', as in the pipeline
+    "syntax": True,             # whether the question syntax can change the label, as in the last step of the pipeline
+    "max_batch_size": 32,
+    "max_latency": 0.01,
+}
+
+
+def configure(**kwargs):
+    """ Change the options of the classifier (see options)
+
+    It has no effect once the classifier has been loaded by the first request.
+    """
+
+    for key, value in kwargs.items():
+        if key not in options:
+            raise ValueError("Unknown option of the classifier: "+key)
+        options[key] = value
+
+
+def load_predictor(model=None, backend='eager', scoring='punctuation'):
+    """ Load the GottBERT model in the same way as pipeline.py
+
+    :param model: The name or the local path of the model (None for GottBERT)
+    :type model: str
+    :param backend: The inference backend ('eager', 'int8' or 'onnx')
+    :type backend: str
+    :param scoring: 'punctuation' to score only the punctuation tokens, or 'topk' for the fill-mask pipeline.
+        The 'head' scoring of the pipeline (a trained logistic head, see head.py) isn't available here
+    :type scoring: str
+
+    :rvalue predictor: The fill-mask pipeline or a PunctuationScorer
+    """
+
+    from gottbert_helpers.backends import load_predictor as load_backend, MODEL_NAME
+    if scoring not in ('punctuation', 'topk'):
+        raise ValueError("Unknown scoring of the classifier: "+str(scoring)+" (only 'punctuation' and 'topk' are available)")
+    if scoring=='punctuation' and backend=='onnx':
+        raise ValueError("The punctuation scoring needs the PyTorch model, please use the 'eager' or 'int8' backend")
+    predictor = load_backend(backend, model if model!=None else MODEL_NAME)
+    if scoring=='punctuation':
+        from gottbert_helpers.punctuation_scoring import PunctuationScorer
+        return PunctuationScorer(predictor.model, predictor.tokenizer)
+    return predictor
+
+
+def classify_texts(texts, predictor, nlp_model=None):
+    """ Classify many sentences at once, with the steps of the pipeline
+
+    The ending punctuation of each sentence is replaced by a <mask>, the model predicts it (in batches, with
+    predict_batch) and the predictions are simplified to 'question', 'EOS' or 'other'. With a German spaCy model,
+    the sentences predicted as 'EOS' whose second prediction is a 'question' are analyzed in-process, and their
+    question words or question syntax make them a 'question', as in the last step of the pipeline.
+
+    :param texts: The sentences
+    :type texts: list
+    :param predictor: The fill-mask pipeline or a PunctuationScorer (see load_predictor)
+    :param nlp_model: The German spaCy model of the question analysis (None to skip it)
+    :type nlp_model: spacy.language.Language
+
+    :rvalue results: One result per sentence, in the order of the sentences
+    :rtype: list
+    """
+
+    masked_sentences = [remove_punctuation(text.strip())[0] for text in texts]
+    rows = list(predict_batch(predictor, masked_sentences))
+    predicted_labels = [simplify_pred(row[0], row[2]) for row in rows]
+
+    # Like the pipeline, the analysis is only needed where it can change the label, and it gets the masked sentence
+    analyses = {}
+    if nlp_model!=None:
+        to_check = [index for index, row in enumerate(rows) if needs_syntax_check(predicted_labels[index], row[2])]
+        results = question_analysis.analyze_texts([masked_sentences[index] for index in to_check], nlp_model)
+        analyses = {index: sentence_results[0] if len(sentence_results)>0 else None for index, sentence_results in zip(to_check, results)}
+
+    classifications = []
+    for index, (text, row) in enumerate(zip(texts, rows)):
+        if index in analyses:
+            label, contains_question_words, contains_question_syntax = apply_syntax(predicted_labels[index], row[2], analyses[index])
+        else:
+            label, contains_question_words, contains_question_syntax = predicted_labels[index], None, None
+        classifications.append({
+            "text": text,
+            "label": label,
+            "predictedLabel": predicted_labels[index],
+            "predictions": [{"token": row[i], "score": row[i+1]} for i in range(0, 10, 2) if row[i]!=""],
+            # The sums of the probabilities of the punctuation tokens of each label (only with the punctuation scoring)
+            "questionScore": row[10] if len(row)>10 else None,
+            "eosScore": row[11] if len(row)>11 else None,
+            "containsQuestionWords": contains_question_words,
+            "containsQuestionSyntax": contains_question_syntax,
+        })
+    return classifications
+
+
+class MicroBatcher:
+    """ Collects the items of concurrent calls in a queue and processes them together
+
+    A background thread takes the first waiting item and then waits for more, until max_batch_size items are
+    collected or max_latency seconds have passed, and processes them with one call of the function. Every caller
+    waits only for the result of its own item. Under load the batches fill up without waiting, and a single
+    request waits at most max_latency seconds longer than on its own.
+
+    :param function: The function that processes a list of items and returns the list of their results (in the same order)
+    :type function: callable
+    :param max_batch_size: The maximum number of items of a batch
+    :type max_batch_size: int
+    :param max_latency: The maximum number of seconds that the first item of a batch waits for others
+    :type max_latency: float
+    """
+
+    def __init__(self, function, max_batch_size=32, max_latency=0.01):
+        self.function = function
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue = queue.Queue()
+        self.items = 0
+        self.batches = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """ Add an item to the queue and return the Future of its result """
+
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        """ Process an item (together with the items of the other callers) and return its result """
+
+        return self.submit(item).result(timeout)
+
+    def next_batch(self):
+        # Return the next batch, and whether the batcher has been closed (None is put in the queue by close)
+        first = self.queue.get()
+        if first==None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch)<self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self.queue.get(timeout=remaining) if remaining>0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry==None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def process(self, batch):
+        items = [item for item, future in batch]
+        try:
+            results = self.function(items)
+        except Exception as e:
+            logger.error("Processing of a batch of "+str(len(items))+" items failed", exc_info=True)
+            for item, future in batch:
+                future.set_exception(e)
+            return
+        self.items += len(items)
+        self.batches += 1
+        for (item, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def run(self):
+        closed = False
+        while not closed:
+            batch, closed = self.next_batch()
+            if len(batch)>0:
+                self.process(batch)
+
+    def report(self):
+        average = self.items/self.batches if self.batches>0 else 0
+        return str(self.items)+" items in "+str(self.batches)+" batches ("+str(round(average, 1))+" items per batch)"
+
+    def close(self):
+        """ Process the items that are already in the queue and stop the background thread """
+
+        self.queue.put(None)
+        self.thread.join()
+
+
+class Classifier:
+    """ The question/EOS classifier of single sentences, whose concurrent requests are run as one model batch
+
+    :param predictor: The fill-mask pipeline or a PunctuationScorer (see load_predictor)
+    :param nlp_model: The German spaCy model of the question analysis (None to skip it)
+    :type nlp_model: spacy.language.Language
+    :param max_batch_size: The maximum number of sentences of a batch
+    :type max_batch_size: int
+    :param max_latency: The maximum number of seconds that a request waits for others
+    :type max_latency: float
+    """
+
+    def __init__(self, predictor, nlp_model=None, max_batch_size=32, max_latency=0.01):
+        self.predictor = predictor
+        self.nlp_model = nlp_model
+        self.batcher = MicroBatcher(self.classify_many, max_batch_size, max_latency)
+
+    def classify_many(self, texts):
+        return classify_texts(texts, self.predictor, self.nlp_model)
+
+    def classify(self, text):
+        """ Classify a sentence as a 'question', 'EOS' or 'other'
+
+        :param text: The sentence
+        :type text: str
+
+        :rvalue result: The label of the sentence, the predictions of the model and their scores
+        :rtype: dict
+        """
+
+        # If text is empty, raise an Exception that will return a response
+        # with the proper information about the error
+        if text==None or len(text.strip())==0:
+            logger.error("BAD REQUEST: The 'text' parameter is empty. Cannot classify an empty string. Please fill the sentence you'd like to classify.")
+            raise BadRequestProblem(detail="The 'text' parameter is empty. Cannot classify an empty string. Please fill the sentence you'd like to classify.", type="EMPTY_PARAMETER")
+        return self.batcher(text)
+
+    def close(self):
+        self.batcher.close()
+        logger.info("Classification: "+self.batcher.report())
+
+
+# The classifier is loaded by the first request, so that the tool starts without the model if it isn't used
+classifier = None
+classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """ Return the classifier of the /classify endpoint, loading it with the options on its first use """
+
+    global classifier
+    with classifier_lock:
+        if classifier==None:
+            logger.info("Loading the classifier...")
+            try:
+                nlp_model = None
+                if options["syntax"]:
+                    from tool.services import analysis
+                    nlp_model = analysis.nlp_models['de']
+                predictor = load_predictor(options["model"], options["backend"], options["scoring"])
+            except Exception as e:
+                # e.g. transformers or torch aren't installed, or the model can't be downloaded. The next request tries again
+                logger.error("The classifier could not be loaded", exc_info=True)
+                raise ServiceUnavailableProblem(detail="The classifier is not available: "+str(e), type="CLASSIFIER_UNAVAILABLE")
+            classifier = Classifier(predictor, nlp_model, options["max_batch_size"], options["max_latency"])
+    return classifier
+
+
+def classify(text):
+    """ Classify a sentence with the classifier of the /classify endpoint (see Classifier.classify) """
+
+    return get_classifier().classify(text)
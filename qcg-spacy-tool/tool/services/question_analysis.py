@@ -0,0 +1,228 @@
+# imports for the question analysis
+import re
+import logging
+
+# Create a logger that will be used in this module
+logger = logging.getLogger('spacy.'+__name__)
+
+# The question words (and multi-word question phrases) of the qcg-sentence-analyzer (SentenceAnalysisService.java).
+# The analyzer keeps them in a Java HashSet and reports the words it finds in the iteration order of that set,
+# so they are listed here in the same order, to return exactly the same lists.
+QUESTION_WORDS_GERMAN = ['wovor', 'womit', 'wessen', 'worüber', 'wofür', 'woran', 'weswegen', 'woraus', 'welches', 'welcher',
+                         'welche', 'wogegen', 'wieso', 'wie lange', 'wie', 'welchen', 'welchem', 'wo', 'wem', 'wen', 'seit wann',
+                         'worunter', 'wozu', 'wer', 'was', 'wodurch', 'wie viel', 'wobei', 'mit wem', 'weshalb', 'woneben',
+                         'gibt es', 'worum', 'wieweit', 'wie viele', 'wohin', 'warum', 'worauf', 'wovon', 'wann', 'woher',
+                         'wohinter', 'worin']
+
+# The Semgrex pattern of the analyzer is {pos:/V.*/}=verb >sb {}=subject (case insensitive):
+# a verb (STTS tag) with a subject (TIGER dependency label)
+VERB_TAG = re.compile('V.*', re.IGNORECASE)
+SUBJECT_RELATION = 'sb'
+
+# Java's String.trim() removes all the characters up to the space, and \s only matches ASCII whitespace
+JAVA_TRIM_CHARACTERS = ''.join(chr(i) for i in range(33))
+JAVA_WHITESPACE = re.compile('[ \t\n\x0b\f\r]+')
+
+
+def clean_text(text):
+    """ Clean a text like the analyzer does before parsing it: trim it and collapse the whitespace
+
+    :param text: The text
+    :type text: str
+
+    :rvalue text: The cleaned text
+    :rtype: str
+    """
+
+    return JAVA_WHITESPACE.sub(' ', text.strip(JAVA_TRIM_CHARACTERS))
+
+
+def find_question_words(sentence_text):
+    """ Find the question words that a sentence contains
+
+    Like the analyzer, the question words (or phrases, e.g. "wie viele") are searched as substrings of the lowercased
+    sentence, so "wie viele" also finds "wie" and "wie viel".
+
+    :param sentence_text: The text of the sentence (its tokens separated by spaces)
+    :type sentence_text: str
+
+    :rvalue question_words: The question words found, in the order of QUESTION_WORDS_GERMAN
+    :rtype: list
+    """
+
+    lowercased = sentence_text.lower()
+    return [word for word in QUESTION_WORDS_GERMAN if word in lowercased]
+
+
+def find_question_phrases(words):
+    """ Find the question syntax of a sentence: a verb that comes before its subject
+
+    As in the analyzer, only the first match of the Semgrex pattern counts: the first verb of the sentence that has
+    a subject, with its first subject. It's a question phrase if the verb comes before the subject.
+
+    :param words: The words of the sentence as (id, form, tag, head, deprel) tuples, in the order of the sentence.
+        The ids start from 1 and the head of the root is 0, as in a CoNLL-U table.
+    :type words: list
+
+    :rvalue question_phrases: The question phrases, as "<verb id>. <verb> -> <subject id>. <subject>" (at most one)
+    :rtype: list
+    """
+
+    for verb_id, verb_form, verb_tag, _, _ in words:
+        if VERB_TAG.fullmatch(verb_tag)==None:
+            continue
+        subjects = [(word_id, form) for word_id, form, _, head, deprel in words if head==verb_id and deprel==SUBJECT_RELATION]
+        if len(subjects)==0:
+            continue
+        subject_id, subject_form = subjects[0]
+        if verb_id<subject_id:
+            return [str(verb_id)+". "+verb_form+" -> "+str(subject_id)+". "+subject_form]
+        return []
+    return []
+
+
+def analyze_words(words):
+    """ Analyze a sentence, given as the words of its dependency analysis
+
+    :param words: The words of the sentence as (id, form, tag, head, deprel) tuples (see find_question_phrases)
+    :type words: list
+
+    :rvalue result: The analysis, with the same fields as a result of the analyzer
+    :rtype: dict
+    """
+
+    text = ' '.join(word[1] for word in words)
+    question_words = find_question_words(text)
+    question_phrases = find_question_phrases(words)
+    return {
+        "text": text,
+        "containsQuestionWords": len(question_words)>0,
+        "questionWords": question_words if len(question_words)>0 else None,
+        "containsQuestionSyntax": len(question_phrases)>0,
+        "questionPhrases": question_phrases if len(question_phrases)>0 else None,
+    }
+
+
+def words_from_span(sentence):
+    """ Convert a sentence of a parsed spaCy Doc into (id, form, tag, head, deprel) tuples
+
+    The ids and the heads are the same as in the CoNLL-U table of the sentence (see convert_text_to_conllu).
+
+    :param sentence: The sentence
+    :type sentence: spacy.tokens.Span
+
+    :rtype: list
+    """
+
+    words = []
+    for token in sentence:
+        head = 0 if token.head.i==token.i else token.head.i-sentence.start+1
+        words.append((token.i-sentence.start+1, token.text, token.tag_, head, token.dep_))
+    return words
+
+
+def words_from_conllu(sentence):
+    """ Convert a sentence of a parsed CoNLL-U table into (id, form, tag, head, deprel) tuples
+
+    :param sentence: The sentence, as parsed by conllu.parse
+    :type sentence: conllu.TokenList
+
+    :rtype: list
+    """
+
+    words = []
+    for token in sentence:
+        # Multi-word tokens (e.g. 1-2) and empty nodes (e.g. 1.1) are not words of the dependency graph
+        if not isinstance(token['id'], int):
+            continue
+        tag = token.get('xpos', token.get('xpostag'))
+        words.append((token['id'], token['form'], tag if tag!=None else '_', token['head'], token['deprel']))
+    return words
+
+
+def empty_result(text):
+    # The result of the analyzer when the analysis of a text fails
+    return {
+        "text": text,
+        "containsQuestionWords": None,
+        "questionWords": None,
+        "containsQuestionSyntax": None,
+        "questionPhrases": None,
+    }
+
+
+def analyze_doc(doc):
+    """ Analyze the sentences of a parsed spaCy Doc
+
+    :param doc: The Doc, parsed by a German model
+    :type doc: spacy.tokens.Doc
+
+    :rvalue results: One result per sentence (see analyze_words)
+    :rtype: list
+    """
+
+    return [analyze_words(words_from_span(sentence)) for sentence in doc.sents]
+
+
+def analyze_text(text, nlp_model):
+    """ Analyze a text in the same way as the analyze-text endpoint of the qcg-sentence-analyzer
+
+    :param text: The text
+    :type text: str
+    :param nlp_model: The German spaCy model
+    :type nlp_model: spacy.language.Language
+
+    :rvalue results: One result per sentence of the text (none for an empty text)
+    :rtype: list
+    """
+
+    cleaned = clean_text(text)
+    if len(cleaned)==0:
+        return []
+    try:
+        return analyze_doc(nlp_model(cleaned))
+    except Exception:
+        logger.error("Analysis of the text failed: "+cleaned, exc_info=True)
+        return [empty_result(cleaned)]
+
+
+def analyze_texts(texts, nlp_model, batch_size=256, n_process=1):
+    """ Analyze many texts, parsing them in batches with nlp.pipe
+
+    :param texts: The texts
+    :type texts: iterable of str
+    :param nlp_model: The German spaCy model
+    :type nlp_model: spacy.language.Language
+    :param batch_size: The number of texts that spaCy parses together
+    :type batch_size: int
+    :param n_process: The number of processes of spaCy
+    :type n_process: int
+
+    :rvalue results: For each text (in the same order), the same results as analyze_text
+    :rtype: generator of lists
+    """
+
+    cleaned = [clean_text(text) for text in texts]
+    docs = nlp_model.pipe([text for text in cleaned if len(text)>0], batch_size=batch_size, n_process=n_process)
+    for text in cleaned:
+        if len(text)==0:
+            yield []
+        else:
+            yield analyze_doc(next(docs))
+
+
+def analyze_conllu(conllu_table):
+    """ Analyze the sentences of a CoNLL-U table (e.g. the output of convert_text_to_conllu)
+
+    This is what the analyzer does with the CoNLL-U table that it gets from this tool, so it gives the
+    results of the analyzer without a spaCy model.
+
+    :param conllu_table: The CoNLL-U table
+    :type conllu_table: str
+
+    :rvalue results: One result per sentence of the table
+    :rtype: list
+    """
+
+    import conllu
+    return [analyze_words(words_from_conllu(sentence)) for sentence in conllu.parse(conllu_table)]